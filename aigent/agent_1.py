@@ -3,8 +3,17 @@
 # The striker agent
 
 import random
+import sys
 from soccerpy.agent import Agent as baseAgent
 from soccerpy.world_model import WorldModel
+from soccerpy.flight_recorder import FlightRecorder
+from intercept import InterceptSolver, first_intercept, own_intercept
+from passing import PassEvaluator
+from shooting import ShotEvaluator
+from navigation import Navigator
+from experience import ExperienceRecorder
+import positioning
+from parameters import PARAMS
 
 # methods from actionHandler are
 # CATCH = "catch"(rel_direction)
@@ -22,11 +31,61 @@ from soccerpy.world_model import WorldModel
 # mdp
 # 
 
+# branches of the decision loop, in order, as ids for the flight recorder
+(SHOOT, PASS, DRIBBLE, MOVE_TO_BALL, MOVE_TO_DEFEND, MOVE_TO_ENEMY_GOALPOS,
+        DEFAULT) = range(7)
+BRANCHES = ["shoot", "pass", "dribble", "move_to_ball", "move_to_defend",
+        "move_to_enemy_goalpos", "default"]
+
 class Agent(baseAgent):
     """
     The extended Agent class with specific heuritics
     """
 
+    def setup_environment(self):
+        """
+        Sets up the base agent's variables, plus the ball interception solver
+        shared by the decision heuristics.
+        """
+
+        baseAgent.setup_environment(self)
+
+        # predicts who reaches the ball first, refreshed every decision
+        self.interceptor = InterceptSolver(self.wm.server_parameters)
+        self.intercepts = []
+
+        # ranks passes to all visible teammates when we have the ball
+        self.pass_evaluator = PassEvaluator(self.interceptor)
+        self.pass_options = []
+
+        # picks where in the goal mouth to shoot
+        self.shot_evaluator = ShotEvaluator(self.interceptor)
+        self.shot = None
+
+        # finds our way around other players
+        self.navigator = Navigator(self.wm, self.log)
+
+        # where to stand off the ball
+        self.positioning = positioning.load()
+
+        # records which branch every decision took, and why
+        self.recorder = FlightRecorder(BRANCHES)
+
+        # keeps what every decision led to, for learning them offline
+        self.experience = ExperienceRecorder(BRANCHES)
+
+    def dump_recording(self, reason):
+        """
+        Writes our experience to disk along with the flight recorder's
+        decisions.
+        """
+
+        baseAgent.dump_recording(self, reason)
+
+        path = self.experience.dump(self.recorder.name, reason)
+        if path is not None:
+            self.log.info("experience_saved", path=path)
+
     def think(self):
         """
         Performs a single step of thinking for our agent.  Gets called on every
@@ -39,7 +98,7 @@ class Agent(baseAgent):
 
         # take places on the field by uniform number
         if not self.in_kick_off_formation:
-            print "the side is", self.wm.side
+            self.log.info("side", side=self.wm.side)
 
             # used to flip x coords for other side
             side_mod = 1
@@ -137,11 +196,11 @@ class Agent(baseAgent):
 
     # check if ball is close to self
     def ball_close(self):
-        return self.wm.ball.distance < 10
+        return self.wm.ball.distance < PARAMS["ball_close"]
 
     # check if enemy goalpost is close enough
     def goalpos_close(self):
-        return self.wm.get_distance_to_point(self.enemy_goal_pos) < 20
+        return self.wm.get_distance_to_point(self.enemy_goal_pos) < PARAMS["goalpos_close"]
 
     # check if path to target's coordinate is clear, by direction
     def is_clear(self, target_coords):
@@ -156,7 +215,7 @@ class Agent(baseAgent):
         tDist = self.wm.get_distance_to_point(target_coords)
 
         # the closest teammate is closer, or angle is clear
-        return tDist < qDist or abs(qDir - tDir) > 20
+        return tDist < qDist or abs(qDir - tDir) > PARAMS["clear_angle"]
 
 
     # Action decisions start
@@ -200,7 +259,7 @@ class Agent(baseAgent):
                     if self.wm.ball is not None:
                         if (self.wm.ball.direction is not None and
                                 -7 <= self.wm.ball.direction <= 7):
-                            self.wm.ah.dash(50)
+                            self.wm.ah.dash(PARAMS["kickoff_dash"])
                         else:
                             self.wm.turn_body_to_point((0, 0))
 
@@ -223,49 +282,60 @@ class Agent(baseAgent):
                 self.wm.kick_to(self.enemy_goal_pos, 1.0)
                 return
             else:
-                # move towards ball
-                if -7 <= self.wm.ball.direction <= 7:
-                    self.wm.ah.dash(65)
+                # move towards where we can intercept the ball
+                mine = own_intercept(self.intercepts)
+                if mine is not None and self.wm.abs_body_dir is not None:
+                    self.run_to_point(mine.point, PARAMS["chase_dash"])
+                elif -7 <= self.wm.ball.direction <= 7:
+                    self.wm.ah.dash(PARAMS["chase_dash"])
                 else:
                     # face ball
                     self.wm.ah.turn(self.wm.ball.direction / 2)
 
                 return
 
+    # run to a point, around anyone in the way
+    def run_to_point(self, point, power):
+        self.navigator.go_to(point, power)
+
 
 
     # condition for shooting to the goal
     def shall_shoot(self):
-        return self.wm.is_ball_kickable() and self.goalpos_close() and self.is_clear(self.enemy_goal_pos)
+        if not (self.wm.is_ball_kickable() and self.goalpos_close()):
+            return False
+        self.shot = self.shot_evaluator.evaluate(self.wm, self.enemy_goal_pos)
+        return self.shot is not None and self.shot.success > 0.5
 
-    # do shoot
+    # do shoot, at the best spot in the goal mouth
     def shoot(self):
-        print "shoot"
-        return self.wm.kick_to(self.enemy_goal_pos, 1.0)
+        self.log.info("shoot")
+        return self.wm.kick_to(self.shot.target, 1.0)
 
-    # condition for passing to the closest teammate
-    # if can kick ball, teammate is closer to goal, path clear
+    # condition for passing to the best placed teammate
+    # if can kick ball, best pass is safe and gets closer to goal
     def shall_pass(self):
         # self.defaultaction()
-        p = self.wm.get_nearest_teammate()
-        if p == None:
+        if not self.wm.is_ball_kickable():
+            return False
+        self.pass_options = self.pass_evaluator.evaluate(self.wm, self.enemy_goal_pos)
+        if not self.pass_options:
             return False
-        p_coords = self.wm.get_object_absolute_coords(p)
-        pDistToGoal = self.wm.euclidean_distance(p_coords, self.enemy_goal_pos)
+        best = self.pass_options[0]
+        pDistToGoal = self.wm.euclidean_distance(best.target, self.enemy_goal_pos)
         myDistToGoal = self.wm.get_distance_to_point(self.enemy_goal_pos)
-        # kickable, pass closer to goal, path is clear
-        return self.wm.is_ball_kickable() and pDistToGoal < myDistToGoal and self.is_clear(p_coords)
+        # best pass is likely to arrive, and gets closer to goal
+        return best.success > 0.5 and pDistToGoal < myDistToGoal
 
     # do passes
     def passes(self):
-        print "pass"
-        p = self.wm.get_nearest_teammate()
-        if p == None:
+        self.log.info("pass")
+        if not self.pass_options:
             return False
-        p_coords = self.wm.get_object_absolute_coords(p)
+        p_coords = self.pass_options[0].target
         dist = self.wm.get_distance_to_point(p_coords)
-        power_ratio = 2*dist/55.0
-        # kick to closest teammate, power is scaled
+        power_ratio = dist/PARAMS["pass_range"]
+        # kick to the best pass target, power is scaled
         return self.wm.kick_to(p_coords, power_ratio)
 
     # condition for dribbling, if can't shoot or pass
@@ -278,11 +348,11 @@ class Agent(baseAgent):
 
     # dribble: turn body, kick, then run towards ball
     def dribble(self):
-        print "dribbling"
+        self.log.info("dribbling")
         self.wm.kick_to(self.enemy_goal_pos, 1.0)
         self.wm.turn_body_to_point(self.enemy_goal_pos)
         self.wm.align_neck_with_body()
-        self.wm.ah.dash(50)
+        self.wm.ah.dash(PARAMS["dribble_dash"])
         return
 
     # if enemy has the ball, and not too far move towards it
@@ -290,12 +360,20 @@ class Agent(baseAgent):
         # while self.wm.ball is None:
             # self.find_ball()
         # self.wm.align_neck_with_body()
-        return self.wm.is_ball_owned_by_enemy() and self.wm.ball.distance < 30
+        # chase if we're the first of our team to reach the ball
+        mine = own_intercept(self.intercepts)
+        if mine is not None:
+            return first_intercept(self.intercepts, self.wm.side, self.wm) is mine
+        return self.wm.is_ball_owned_by_enemy() and self.wm.ball.distance < PARAMS["chase_radius"]
 
-    # move to ball, if enemy owns it
+    # move to ball, where we can first intercept it
     def move_to_ball(self):
-        print "move_to_ball"
-        self.wm.ah.dash(60)
+        self.log.info("move_to_ball")
+        mine = own_intercept(self.intercepts)
+        if mine is not None and self.wm.abs_body_dir is not None:
+            self.run_to_point(mine.point, PARAMS["intercept_dash"])
+        else:
+            self.wm.ah.dash(PARAMS["intercept_dash"])
         return 
 
     # defensive, when ball isn't ours, and has entered our side of the field
@@ -303,12 +381,12 @@ class Agent(baseAgent):
         # self.defaultaction()
         if self.wm.ball is not None or self.wm.ball.direction is not None:
             b_coords = self.wm.get_object_absolute_coords(self.wm.ball)
-            return self.wm.is_ball_owned_by_enemy() and self.wm.euclidean_distance(self.own_goal_pos, b_coords) < 55.0
+            return self.wm.is_ball_owned_by_enemy() and self.wm.euclidean_distance(self.own_goal_pos, b_coords) < PARAMS["defend_radius"]
         return False
 
     # defend
     def move_to_defend(self):
-        print "move_to_defend"
+        self.log.info("move_to_defend")
         q = self.wm.get_nearest_enemy()
         if q == None:
             return False
@@ -316,14 +394,11 @@ class Agent(baseAgent):
         qDir = self.wm.get_angle_to_point(q_coords)
         qDistToOurGoal = self.wm.euclidean_distance(self.own_goal_pos, q_coords)
         # if close to the goal, aim at it
-        if qDistToOurGoal < 55:
-            self.wm.turn_body_to_point(q_coords)
+        if qDistToOurGoal < PARAMS["defend_radius"]:
+            self.run_to_point(q_coords, PARAMS["defend_dash"])
         # otherwise aim at own goalpos, run there to defend
         else:
-            self.wm.turn_body_to_point(self.own_goal_pos)
-
-        self.wm.align_neck_with_body()
-        self.wm.ah.dash(80)
+            self.run_to_point(self.own_goal_pos, PARAMS["defend_dash"])
         return
 
     # when our team has ball, and self is not close enough to goalpos. advance to enemy goalpos
@@ -332,39 +407,56 @@ class Agent(baseAgent):
 
     # if our team has the ball n u r striker
     def move_to_enemy_goalpos(self):
-        print "move_to_enemy_goalpos"
+        self.log.info("move_to_enemy_goalpos")
         if self.wm.is_ball_kickable():
             # kick with 100% extra effort at enemy goal
             self.wm.kick_to(self.enemy_goal_pos, 1.0)
-        self.wm.turn_body_to_point(self.enemy_goal_pos)
-        self.wm.align_neck_with_body()
-        self.wm.ah.dash(70)
+        self.run_to_point(self.attacking_point(), PARAMS["advance_dash"])
         return
 
+    # where the positioning policy puts a striker with the ball where it is,
+    # or the enemy goal if we can't place the ball
+    def attacking_point(self):
+        b_coords = None
+        if self.wm.ball is not None:
+            b_coords = self.wm.get_object_absolute_coords(self.wm.ball)
+        if b_coords is None or self.wm.abs_coords[0] is None:
+            return self.enemy_goal_pos
+        return self.positioning.waypoint("striker",
+                self.wm.side == WorldModel.SIDE_L, self.wm.abs_coords, b_coords)
+
 
     def decisionLoop(self):
+        rec = self.recorder
+        rec.begin(self.wm.sim_time)
         try:
             self.find_ball()
+            self.intercepts = self.interceptor.predict(self.wm)
             # if should shoot, full power
-            if self.shall_shoot():
-                return self.shoot()
-            # else shd pass to closest teammate
-            elif self.shall_pass():
-                return self.passes()
+            if rec.check(SHOOT, self.shall_shoot):
+                return rec.take(SHOOT, self.shoot)
+            # else shd pass to best placed teammate
+            elif rec.check(PASS, self.shall_pass):
+                return rec.take(PASS, self.passes)
             # else shd dribble
-            elif self.shall_dribble():
-                return self.dribble()
-            elif self.shall_move_to_ball():
-                return self.move_to_ball()
-            elif self.shall_move_to_defend():
-                return self.move_to_defend()
-            elif self.shall_move_to_enemy_goalpos():
-                return self.move_to_enemy_goalpos()
+            elif rec.check(DRIBBLE, self.shall_dribble):
+                return rec.take(DRIBBLE, self.dribble)
+            elif rec.check(MOVE_TO_BALL, self.shall_move_to_ball):
+                return rec.take(MOVE_TO_BALL, self.move_to_ball)
+            elif rec.check(MOVE_TO_DEFEND, self.shall_move_to_defend):
+                return rec.take(MOVE_TO_DEFEND, self.move_to_defend)
+            elif rec.check(MOVE_TO_ENEMY_GOALPOS, self.shall_move_to_enemy_goalpos):
+                return rec.take(MOVE_TO_ENEMY_GOALPOS, self.move_to_enemy_goalpos)
             else:
-                return self.defaultaction()
+                return rec.take(DEFAULT, self.defaultaction)
         except:
             # print "exceptions thrown, using fallback"
+            rec.fail(sys.exc_info()[0])
             self.defaultaction()
+        finally:
+            rec.end()
+            self.experience.record(self.wm, self.enemy_goal_pos,
+                    rec.last_branch())
         
 
 
@@ -3,8 +3,13 @@
 # The defender agent
 
 import random
+import sys
 from soccerpy.agent import Agent as baseAgent
 from soccerpy.world_model import WorldModel
+from soccerpy.flight_recorder import FlightRecorder
+from parameters import PARAMS
+from navigation import Navigator
+import positioning
 
 # methods from actionHandler are
 # CATCH = "catch"(rel_direction)
@@ -22,11 +27,33 @@ from soccerpy.world_model import WorldModel
 # mdp
 # 
 
+# branches of the decision loop, in order, as ids for the flight recorder
+RETURN_TO_GOAL, PASS, MOVE_TO_BALL, MOVE_TO_DEFEND, DEFAULT = range(5)
+BRANCHES = ["return_to_goal", "pass", "move_to_ball", "move_to_defend",
+        "default"]
+
 class Agent(baseAgent):
     """
     The extended Agent class with specific heuritics
     """
 
+    def setup_environment(self):
+        """
+        Sets up the base agent's variables, plus the decision flight recorder,
+        the navigator and the positioning policy.
+        """
+
+        baseAgent.setup_environment(self)
+
+        # records which branch every decision took, and why
+        self.recorder = FlightRecorder(BRANCHES)
+
+        # finds our way around other players
+        self.navigator = Navigator(self.wm, self.log)
+
+        # where to stand off the ball
+        self.positioning = positioning.load()
+
     def think(self):
         """
         Performs a single step of thinking for our agent.  Gets called on every
@@ -39,7 +66,7 @@ class Agent(baseAgent):
 
         # take places on the field by uniform number
         if not self.in_kick_off_formation:
-            print "the side is", self.wm.side
+            self.log.info("side", side=self.wm.side)
 
             # used to flip x coords for other side
             side_mod = 1
@@ -97,11 +124,11 @@ class Agent(baseAgent):
 
     # check if ball is close to self
     def ball_close(self):
-        return self.wm.ball.distance < 10
+        return self.wm.ball.distance < PARAMS["ball_close"]
 
     # check if enemy goalpost is close enough
     def goalpos_close(self):
-        return self.wm.get_distance_to_point(self.enemy_goal_pos) < 20
+        return self.wm.get_distance_to_point(self.enemy_goal_pos) < PARAMS["goalpos_close"]
 
     # check if path to target's coordinate is clear, by direction
     def is_clear(self, target_coords):
@@ -116,7 +143,7 @@ class Agent(baseAgent):
         tDist = self.wm.get_distance_to_point(target_coords)
 
         # the closest teammate is closer, or angle is clear
-        return tDist < qDist or abs(qDir - tDir) > 20
+        return tDist < qDist or abs(qDir - tDir) > PARAMS["clear_angle"]
 
 
     # Action decisions start
@@ -146,11 +173,11 @@ class Agent(baseAgent):
                     if self.wm.ball is not None:
                         if (self.wm.ball.direction is not None and
                                 -7 <= self.wm.ball.direction <= 7):
-                            if self.wm.get_distance_to_point(self.own_goal_pos) < 40:
-                                self.wm.ah.dash(50)
+                            if self.wm.get_distance_to_point(self.own_goal_pos) < PARAMS["home_radius"]:
+                                self.wm.ah.dash(PARAMS["kickoff_dash"])
                             else:
                                 self.wm.turn_body_to_point(self.own_goal_pos)
-                                self.wm.ah.dash(50)
+                                self.wm.ah.dash(PARAMS["retreat_dash"])
                         else:
                             self.wm.turn_body_to_point((0, 0))
 
@@ -175,11 +202,11 @@ class Agent(baseAgent):
             else:
                 # move towards ball
                 if -7 <= self.wm.ball.direction <= 7:
-                    if self.wm.get_distance_to_point(self.own_goal_pos) < 40:
-                        self.wm.ah.dash(65)
+                    if self.wm.get_distance_to_point(self.own_goal_pos) < PARAMS["home_radius"]:
+                        self.wm.ah.dash(PARAMS["chase_dash"])
                     else:
                         self.wm.turn_body_to_point(self.own_goal_pos)
-                        self.wm.ah.dash(50)
+                        self.wm.ah.dash(PARAMS["retreat_dash"])
                 else:
                     # face ball
                     self.wm.ah.turn(self.wm.ball.direction / 2)
@@ -194,7 +221,7 @@ class Agent(baseAgent):
 
     # do shoot
     def shoot(self):
-        print "shoot"
+        self.log.info("shoot")
         return self.wm.kick_to(self.enemy_goal_pos, 1.0)
 
     # condition for passing to the closest teammate
@@ -212,13 +239,13 @@ class Agent(baseAgent):
 
     # do passes
     def passes(self):
-        print "pass"
+        self.log.info("pass")
         p = self.wm.get_nearest_teammate()
         if p == None:
             return False
         p_coords = self.wm.get_object_absolute_coords(p)
         dist = self.wm.get_distance_to_point(p_coords)
-        power_ratio = 2*dist/55.0
+        power_ratio = dist/PARAMS["pass_range"]
         # kick to closest teammate, power is scaled
         return self.wm.kick_to(p_coords, power_ratio)
 
@@ -232,15 +259,14 @@ class Agent(baseAgent):
 
     # dribble: turn body, kick, then run towards ball
     def dribble(self):
-        print "dribbling"
+        self.log.info("dribbling")
         self.wm.kick_to(self.enemy_goal_pos, 1.0)
         self.wm.turn_body_to_point(self.enemy_goal_pos)
         self.wm.align_neck_with_body()
-        if self.wm.get_distance_to_point(self.own_goal_pos) < 40:
-            self.wm.ah.dash(50)
+        if self.wm.get_distance_to_point(self.own_goal_pos) < PARAMS["home_radius"]:
+            self.wm.ah.dash(PARAMS["dribble_dash"])
         else:
-            self.wm.turn_body_to_point(self.own_goal_pos)
-            self.wm.ah.dash(50)
+            self.run_to_point(self.own_goal_pos, PARAMS["retreat_dash"])
         return
 
     # if enemy has the ball, and not too far move towards it
@@ -248,16 +274,15 @@ class Agent(baseAgent):
         # while self.wm.ball is None:
             # self.find_ball()
         # self.wm.align_neck_with_body()
-        return self.wm.is_ball_owned_by_enemy() and self.wm.ball.distance < 30
+        return self.wm.is_ball_owned_by_enemy() and self.wm.ball.distance < PARAMS["chase_radius"]
 
     # move to ball, if enemy owns it
     def move_to_ball(self):
-        print "move_to_ball"
-        if self.wm.get_distance_to_point(self.own_goal_pos) < 40:
-            self.wm.ah.dash(60)
+        self.log.info("move_to_ball")
+        if self.wm.get_distance_to_point(self.own_goal_pos) < PARAMS["home_radius"]:
+            self.wm.ah.dash(PARAMS["intercept_dash"])
         else:
-            self.wm.turn_body_to_point(self.own_goal_pos)
-            self.wm.ah.dash(50)
+            self.run_to_point(self.own_goal_pos, PARAMS["retreat_dash"])
         return 
 
     # defensive, when ball isn't ours, and has entered our side of the field
@@ -265,12 +290,12 @@ class Agent(baseAgent):
         # self.defaultaction()
         if self.wm.ball is not None or self.wm.ball.direction is not None:
             b_coords = self.wm.get_object_absolute_coords(self.wm.ball)
-            return self.wm.is_ball_owned_by_enemy() and self.wm.euclidean_distance(self.own_goal_pos, b_coords) < 55.0
+            return self.wm.is_ball_owned_by_enemy() and self.wm.euclidean_distance(self.own_goal_pos, b_coords) < PARAMS["defend_radius"]
         return False
 
     # defend
     def move_to_defend(self):
-        print "move_to_defend"
+        self.log.info("move_to_defend")
         q = self.wm.get_nearest_enemy()
         if q == None:
             return False
@@ -278,18 +303,18 @@ class Agent(baseAgent):
         qDir = self.wm.get_angle_to_point(q_coords)
         qDistToOurGoal = self.wm.euclidean_distance(self.own_goal_pos, q_coords)
         # if close to the goal, aim at it
-        if qDistToOurGoal < 55:
+        if qDistToOurGoal < PARAMS["defend_radius"]:
             self.wm.turn_body_to_point(q_coords)
-        # otherwise aim at own goalpos, run there to defend
+        # otherwise take up our place between the ball and our goal
         else:
-            self.wm.turn_body_to_point(self.own_goal_pos)
+            self.run_to_point(self.defensive_point(), PARAMS["defend_dash"])
+            return
 
         self.wm.align_neck_with_body()
-        if self.wm.get_distance_to_point(self.own_goal_pos) < 40:
-            self.wm.ah.dash(80)
+        if self.wm.get_distance_to_point(self.own_goal_pos) < PARAMS["home_radius"]:
+            self.wm.ah.dash(PARAMS["defend_dash"])
         else:
-            self.wm.turn_body_to_point(self.own_goal_pos)
-            self.wm.ah.dash(50)
+            self.run_to_point(self.own_goal_pos, PARAMS["retreat_dash"])
         return
 
     # when our team has ball, and self is not close enough to goalpos. advance to enemy goalpos
@@ -298,48 +323,74 @@ class Agent(baseAgent):
 
     # if our team has the ball n u r striker
     def move_to_enemy_goalpos(self):
-        print "move_to_enemy_goalpos"
+        self.log.info("move_to_enemy_goalpos")
         if self.wm.is_ball_kickable():
             # kick with 100% extra effort at enemy goal
             self.wm.kick_to(self.enemy_goal_pos, 1.0)
         self.wm.turn_body_to_point(self.enemy_goal_pos)
         self.wm.align_neck_with_body()
-        if self.wm.get_distance_to_point(self.own_goal_pos) < 40:
-            self.wm.ah.dash(70)
+        if self.wm.get_distance_to_point(self.own_goal_pos) < PARAMS["home_radius"]:
+            self.wm.ah.dash(PARAMS["advance_dash"])
         else:
-            self.wm.turn_body_to_point(self.own_goal_pos)
-            self.wm.ah.dash(50)
+            self.run_to_point(self.own_goal_pos, PARAMS["retreat_dash"])
+        return
+
+
+    # if strayed too far from own goal
+    def shall_return_to_goal(self):
+        return self.wm.get_distance_to_point(self.own_goal_pos) > PARAMS["defender_stray"]
+
+    # head back toward own goal
+    def return_to_goal(self):
+        # print "overstepping"
+        self.run_to_point(self.own_goal_pos, PARAMS["return_dash"])
         return
 
+    # run to a point, around anyone in the way
+    def run_to_point(self, point, power):
+        self.navigator.go_to(point, power)
+
+    # where the positioning policy puts a defender with the ball where it is,
+    # or our own goal if we can't place the ball
+    def defensive_point(self):
+        b_coords = None
+        if self.wm.ball is not None:
+            b_coords = self.wm.get_object_absolute_coords(self.wm.ball)
+        if b_coords is None or self.wm.abs_coords[0] is None:
+            return self.own_goal_pos
+        return self.positioning.waypoint("defender",
+                self.wm.side == WorldModel.SIDE_L, self.wm.abs_coords, b_coords)
 
     def decisionLoop(self):
+        rec = self.recorder
+        rec.begin(self.wm.sim_time)
         try:
             self.find_ball()
-            if self.wm.get_distance_to_point(self.own_goal_pos) > 15:
-                # print "overstepping"
-                self.wm.turn_body_to_point(self.own_goal_pos)
-                self.wm.ah.dash(70)
-                return
+            if rec.check(RETURN_TO_GOAL, self.shall_return_to_goal):
+                return rec.take(RETURN_TO_GOAL, self.return_to_goal)
             # if should shoot, full power
             # if self.shall_shoot():
                 # return self.shoot()
             # else shd pass to closest teammate
-            elif self.shall_pass():
-                return self.passes()
+            elif rec.check(PASS, self.shall_pass):
+                return rec.take(PASS, self.passes)
             # else shd dribble
             # elif self.shall_dribble():
                 # return self.dribble()
-            elif self.shall_move_to_ball():
-                return self.move_to_ball()
-            elif self.shall_move_to_defend():
-                return self.move_to_defend()
+            elif rec.check(MOVE_TO_BALL, self.shall_move_to_ball):
+                return rec.take(MOVE_TO_BALL, self.move_to_ball)
+            elif rec.check(MOVE_TO_DEFEND, self.shall_move_to_defend):
+                return rec.take(MOVE_TO_DEFEND, self.move_to_defend)
             # elif self.shall_move_to_enemy_goalpos():
                 # return self.move_to_enemy_goalpos()
             else:
-                return self.defaultaction()
+                return rec.take(DEFAULT, self.defaultaction)
         except:
             # print "exceptions thrown, using fallback"
+            rec.fail(sys.exc_info()[0])
             self.defaultaction()
+        finally:
+            rec.end()
         
 
 
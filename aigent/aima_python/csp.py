@@ -3,7 +3,8 @@
 from __future__ import generators
 from utils import *
 import search
-import types
+import types, collections
+import numpy as np
 
 class CSP(search.Problem):
     """This class describes finite-domain Constraint Satisfaction Problems.
@@ -30,6 +31,9 @@ class CSP(search.Problem):
         unassign(var, a)        Do del a[var], plus other bookkeeping
         nconflicts(var, val, a) Return the number of other variables that
                                 conflict with var=val
+        conflict_counts(var, a) Return the nconflicts of every value of var
+        support(A, a, B, vals)  Return which of vals B can take with A=a,
+                                as a bitset; used by BitsetCSP
         curr_domains[var]       Slot: remaining consistent values for var
                                 Used by constraint propagation routines.
     The following methods are used only by graph_search and tree_search:
@@ -40,6 +44,9 @@ class CSP(search.Problem):
         display(a)              Print a human-readable representation
         """
 
+    # whether BitsetCSP should find every support once and keep it
+    tabulate = True
+
     def __init__(self, vars, domains, neighbors, constraints):
         "Construct a CSP problem. If vars is empty, it becomes domains.keys()."
         vars = vars or domains.keys()
@@ -76,6 +83,22 @@ class CSP(search.Problem):
             return val2 != None and not self.constraints(var, val, var2, val2)
         return count_if(conflict, self.neighbors[var])
 
+    def conflict_counts(self, var, assignment):
+        "Return the nconflicts of every value of var's domain, in order."
+        return [self.nconflicts(var, val, assignment)
+                for val in self.domains[var]]
+
+    def support(self, A, a, B, values):
+        """Return the values of B consistent with A=a, as a bitset: bit k is
+        set if B=values[k] is. Used by BitsetCSP; subclasses with a faster
+        way to tell can override it, and set tabulate to False if that is
+        cheaper than keeping them all."""
+        bits = 0
+        for k, b in enumerate(values):
+            if self.constraints(A, a, B, b):
+                bits |= 1 << k
+        return bits
+
     def forward_check(self, var, val, assignment):
         "Do forward checking (current domain reduction) for this assignment."
         if self.curr_domains:
@@ -238,8 +261,257 @@ def min_conflicts(csp, max_steps=1000000):
 def min_conflicts_value(csp, var, current):
     """Return the value that will give var the least number of conflicts.
     If there is a tie, choose at random."""
-    return argmin_random_tie(csp.domains[var],
-                             lambda val: csp.nconflicts(var, val, current)) 
+    counts = np.asarray(csp.conflict_counts(var, current))
+    return csp.domains[var][random.choice(np.flatnonzero(
+        counts == counts.min()))]
+
+#______________________________________________________________________________
+# Bitset CSPs
+
+def bit_count(bits):
+    "The number of bits set in an int."
+    return bin(bits).count('1')
+
+def bit_indices(bits):
+    """The indices of the bits set in an int, lowest first.
+    >>> list(bit_indices(0b10110))
+    [1, 2, 4]
+    """
+    while bits:
+        low = bits & -bits
+        yield low.bit_length() - 1
+        bits ^= low
+
+class BitsetCSP:
+    """A CSP compiled for fast search. Variables, and the values of each
+    one's domain, are numbered, and current domains are bitsets: ints whose
+    bit k is set while the k-th value is left. The values of B consistent
+    with A=a are asked of csp.support, as a bitset, and unless the CSP says
+    otherwise all of them are found up front and kept in tables, so the
+    constraint is never called again.
+
+    Every change to a domain is pushed on a trail, along with what the
+    domain was, and undone by popping the trail back to a mark; so
+    backtracking costs no more than the changes it undoes. AC-3 keeps, for
+    every arc and value, the last support it found (its residue), and only
+    looks for another once that one is gone from the domain. min_conflicts
+    keeps how many conflicts every value of every variable has up to date
+    as variables change, along with the set of variables in conflict.
+    >>> b = BitsetCSP(australia); a = b.backtracking_search()
+    >>> australia.goal_test(a), b.nassigns
+    (True, 7)
+    >>> z = BitsetCSP(Zebra()); a = z.backtracking_search(mac=True)
+    >>> a['Zebra'], a['Water'], z.csp.goal_test(a)
+    (5, 1, True)
+    >>> random.seed(0); len(BitsetCSP(NQueensCSP(50)).min_conflicts())
+    50
+    """
+
+    def __init__(self, csp):
+        self.csp = csp
+        self.vars = list(csp.vars)
+        index = dict((v, i) for i, v in enumerate(self.vars))
+        self.values = [list(csp.domains[v]) for v in self.vars]
+        self.neighbors = [[index[B] for B in csp.neighbors[A] if B != A]
+                          for A in self.vars]
+        self.full = [(1 << len(values)) - 1 for values in self.values]
+        self.domains = list(self.full)
+        self.trail = []
+        self.residues = {}
+        self.nassigns = 0
+        self.tables = None
+        if csp.tabulate:
+            self.tables = [dict((j, [self.find_support(i, a, j)
+                                     for a in range(len(self.values[i]))])
+                                for j in self.neighbors[i])
+                           for i in range(len(self.vars))]
+
+    def find_support(self, i, a, j):
+        return self.csp.support(self.vars[i], self.values[i][a],
+                                self.vars[j], self.values[j])
+
+    def support(self, i, a, j):
+        "The bitset of the values of j consistent with i=a."
+        if self.tables is None:
+            return self.find_support(i, a, j)
+        return self.tables[i][j][a]
+
+    def prune(self, i, domain):
+        "Narrow the domain of i to the given bitset, on the trail."
+        self.trail.append((i, self.domains[i]))
+        self.domains[i] = domain
+
+    def undo(self, mark):
+        "Undo every change since the trail was mark long."
+        trail, domains = self.trail, self.domains
+        while len(trail) > mark:
+            i, domain = trail.pop()
+            domains[i] = domain
+
+    def revise(self, i, j):
+        "Remove the values of i with no support left in j; return if any."
+        domain, other = self.domains[i], self.domains[j]
+        residues = self.residues.get((i, j))
+        if residues is None:
+            residues = self.residues[i, j] = [-1] * len(self.values[i])
+        removed = 0
+        for a in bit_indices(domain):
+            r = residues[a]
+            if r >= 0 and other >> r & 1:
+                continue
+            s = self.support(i, a, j) & other
+            if s:
+                residues[a] = (s & -s).bit_length() - 1
+            else:
+                removed |= 1 << a
+        if removed:
+            self.prune(i, domain & ~removed)
+        return removed != 0
+
+    def ac3(self, queue=None):
+        """Make the arcs (i, j) in queue, by default all of them, consistent.
+        Return False if a domain is emptied. [Fig. 5.7]"""
+        if queue is None:
+            queue = [(i, j) for i in range(len(self.vars))
+                     for j in self.neighbors[i]]
+        queued = set(queue)
+        queue = collections.deque(queued)
+        while queue:
+            arc = queue.popleft()
+            queued.discard(arc)
+            i, j = arc
+            if self.revise(i, j):
+                if not self.domains[i]:
+                    return False
+                for k in self.neighbors[i]:
+                    if k != j and (k, i) not in queued:
+                        queued.add((k, i))
+                        queue.append((k, i))
+        return True
+
+    def assign(self, i, a, assigned, fc, mac):
+        """Set i=a, narrowing the domains of its unassigned neighbors if fc
+        or mac, then making every arc into them consistent if mac. Return
+        False if that empties a domain, or without either, if a neighbor's
+        value is inconsistent with a."""
+        self.nassigns += 1
+        self.prune(i, 1 << a)
+        if not (fc or mac):
+            return all(self.support(i, a, j) >> assigned[j] & 1
+                       for j in self.neighbors[i] if assigned[j] is not None)
+        changed = []
+        for j in self.neighbors[i]:
+            if assigned[j] is None:
+                domain = self.domains[j]
+                narrowed = domain & self.support(i, a, j)
+                if narrowed != domain:
+                    if not narrowed:
+                        return False
+                    self.prune(j, narrowed)
+                    changed.append(j)
+        return not mac or self.ac3([(k, j) for j in changed
+                                    for k in self.neighbors[j] if k != i])
+
+    def backtracking_search(self, mcv=True, fc=True, mac=False):
+        """Search for a consistent assignment, returned as a {var: val}
+        dict, or None if there is none. The next variable is the one with
+        the fewest values left if mcv, else the first; values are tried
+        in order. With fc or mac every assignment is propagated as assign
+        does. The search keeps its own stack, so it goes as deep as there
+        are variables; the domains are as they were again once it is done.
+        [Fig. 5.3]"""
+        domains, start = self.domains, len(self.trail)
+        if mac and not self.ac3():
+            self.undo(start)
+            return None
+        assigned = [None] * len(self.vars)
+        unassigned = set(range(len(self.vars)))
+
+        def choose():
+            if mcv:
+                return min(unassigned,
+                           key=lambda k: (bit_count(domains[k]), k))
+            return min(unassigned)
+
+        stack = []
+        while True:
+            if not unassigned:
+                self.undo(start)
+                return dict((self.vars[i], self.values[i][a])
+                            for i, a in enumerate(assigned))
+            i = choose()
+            unassigned.remove(i)
+            stack.append([i, domains[i], len(self.trail)])
+            while stack:
+                frame = stack[-1]
+                i, untried, mark = frame
+                self.undo(mark)
+                if not untried:
+                    stack.pop()
+                    assigned[i] = None
+                    unassigned.add(i)
+                    continue
+                low = untried & -untried
+                frame[1] = untried ^ low
+                assigned[i] = a = low.bit_length() - 1
+                if self.assign(i, a, assigned, fc, mac):
+                    break
+            else:
+                self.undo(start)
+                return None
+
+    def min_conflicts(self, max_steps=1000000):
+        """Solve by min-conflicts hill climbing, like min_conflicts, but
+        with counts[i][k], the number of neighbors whose values rule out
+        the k-th value of i, kept up to date: a move only changes the
+        counts of the mover's neighbors, and only for the values they
+        rule out. The variables in conflict are kept in a list, with their
+        places in it, so picking one at random costs O(1).
+        Returns a {var: val} dict, or None after max_steps."""
+        n = len(self.vars)
+        counts = [[0] * len(values) for values in self.values]
+        current = [None] * n
+        conflicted, place = [], {}
+
+        def check(i):
+            bad = current[i] is not None and counts[i][current[i]] > 0
+            if bad and i not in place:
+                place[i] = len(conflicted)
+                conflicted.append(i)
+            elif not bad and i in place:
+                last = conflicted.pop()
+                k = place.pop(i)
+                if last != i:
+                    conflicted[k] = last
+                    place[last] = k
+
+        def move(j, b):
+            old, current[j] = current[j], b
+            self.nassigns += 1
+            for i in self.neighbors[j]:
+                c, full = counts[i], self.full[i]
+                if old is not None:
+                    for k in bit_indices(full & ~self.support(j, old, i)):
+                        c[k] -= 1
+                for k in bit_indices(full & ~self.support(j, b, i)):
+                    c[k] += 1
+                check(i)
+            check(j)
+
+        def best(j):
+            c = counts[j]
+            least = min(c)
+            return random.choice([k for k, x in enumerate(c) if x == least])
+
+        for j in range(n):
+            move(j, best(j))
+        for step in xrange(max_steps):
+            if not conflicted:
+                return dict((self.vars[i], self.values[i][a])
+                            for i, a in enumerate(current))
+            j = random.choice(conflicted)
+            move(j, best(j))
+        return None
 
 #______________________________________________________________________________
 # Map-Coloring Problems
@@ -323,20 +595,39 @@ class NQueensCSP(CSP):
         ups[i]       Number of queens in the / diagonal
                      such that their (x, y) coordinates have x-y+n-1 = i
     We increment/decrement these counts each time a queen is placed/moved from
-    a row/diagonal. So moving is O(1), as is nconflicts.  But choosing
-    a variable, and a best value for the variable, are each O(n).
-    If you want, you can keep track of conflicted vars, then variable
-    selection will also be O(1).
+    a row/diagonal. So moving is O(1), as is nconflicts.  The counts are
+    numpy arrays, so the nconflicts of every value of a var, which is what
+    choosing a best value for it takes, is three vectorized adds.
+    We also keep which queens are on each row and diagonal, so that after a
+    move only the queens on the lines it left and joined need checking,
+    and the list of conflicted vars is kept up to date; so variable
+    selection is O(1) too.
     >>> len(backtracking_search(NQueensCSP(8)))
     8
     >>> len(min_conflicts(NQueensCSP(8)))
     8
+    >>> c = NQueensCSP(4); a = {}; c.assign(0, 0, a); c.assign(1, 2, a)
+    >>> c.conflict_counts(2, a), c.conflicted_vars(a)
+    (array([1, 1, 2, 1]), [])
+    >>> c.assign(2, 1, a); sorted(c.conflicted_vars(a))
+    [1, 2]
+    >>> bin(c.support(0, 0, 1, range(4)))
+    '0b1100'
     """
+
+    # supports are cheap to find from the values, and n^3 bits to keep
+    tabulate = False
+
     def __init__(self, n):
         """Initialize data structures for n Queens."""
         CSP.__init__(self, range(n), UniversalDict(range(n)),
                      UniversalDict(range(n)), queen_constraint)
-        update(self, rows=[0]*n, ups=[0]*(2*n - 1), downs=[0]*(2*n - 1))
+        update(self, rows=np.zeros(n, int), ups=np.zeros(2*n - 1, int),
+               downs=np.zeros(2*n - 1, int),
+               row_queens=[set() for i in range(n)],
+               up_queens=[set() for i in range(2*n - 1)],
+               down_queens=[set() for i in range(2*n - 1)],
+               conflicted=[], place={})
 
     def nconflicts(self, var, val, assignment): 
         """The number of conflicts, as recorded with each assignment.
@@ -348,6 +639,23 @@ class NQueensCSP(CSP):
             c -= 3
         return c
 
+    def conflict_counts(self, var, assignment):
+        "The nconflicts of every value of var, as an array."
+        n = len(self.vars)
+        c = self.rows + self.downs[var:var+n] + self.ups[var:var+n][::-1]
+        val = assignment.get(var, None)
+        if val is not None:
+            c[val] -= 3
+        return c
+
+    def support(self, A, a, B, values):
+        "The rows B can take with A=a: all but a's row and diagonals."
+        n, d = len(self.vars), B - A
+        bits = 1 << a
+        if 0 <= a + d < n: bits |= 1 << (a + d)
+        if 0 <= a - d < n: bits |= 1 << (a - d)
+        return ((1 << n) - 1) & ~bits
+
     def assign(self, var, val, assignment):
         "Assign var, and keep track of conflicts."
         oldval = assignment.get(var, None)
@@ -356,12 +664,17 @@ class NQueensCSP(CSP):
                 self.record_conflict(assignment, var, oldval, -1)
             self.record_conflict(assignment, var, val, +1)
             CSP.assign(self, var, val, assignment)
+            self.check_lines(assignment, var, oldval)
+            self.check_lines(assignment, var, val)
 
     def unassign(self, var, assignment):
         "Remove var from assignment (if it is there) and track conflicts."
         if var in assignment:
-            self.record_conflict(assignment, var, assignment[var], -1)
-        CSP.unassign(self, var, assignment)
+            val = assignment[var]
+            self.record_conflict(assignment, var, val, -1)
+            CSP.unassign(self, var, assignment)
+            self.check(var, None)
+            self.check_lines(assignment, var, val)
         
     def record_conflict(self, assignment, var, val, delta):
         "Record conflicts caused by addition or deletion of a Queen."
@@ -369,6 +682,41 @@ class NQueensCSP(CSP):
         self.rows[val] += delta
         self.downs[var + val] += delta
         self.ups[var - val + n - 1] += delta
+        change = (delta > 0 and set.add) or set.discard
+        change(self.row_queens[val], var)
+        change(self.down_queens[var + val], var)
+        change(self.up_queens[var - val + n - 1], var)
+
+    def check_lines(self, assignment, var, val):
+        "Recheck whether the queens on var=val's lines are conflicted."
+        if val is None:
+            return
+        n = len(self.vars)
+        for line in (self.row_queens[val], self.down_queens[var + val],
+                     self.up_queens[var - val + n - 1]):
+            for q in line:
+                self.check(q, assignment[q])
+
+    def check(self, var, val):
+        "Keep var in the conflicted list exactly when var=val conflicts."
+        n = len(self.vars)
+        bad = val is not None and (self.rows[val] + self.downs[var+val] +
+                                   self.ups[var-val+n-1]) > 3
+        place = self.place
+        if bad and var not in place:
+            place[var] = len(self.conflicted)
+            self.conflicted.append(var)
+        elif not bad and var in place:
+            last = self.conflicted.pop()
+            i = place.pop(var)
+            if last != var:
+                self.conflicted[i] = last
+                place[last] = i
+
+    def conflicted_vars(self, current):
+        """The vars in conflict, as kept up to date by assign. This is the
+        list itself, so copy it before assigning if it is to be kept."""
+        return self.conflicted
 
     def display(self, assignment):
         "Print the queens and the nconflicts values (for debugging)."
@@ -1,7 +1,9 @@
 """Learn to estimate functions  from examples. (Chapters 18-20)"""
 
 from utils import *
-import agents, random, operator
+import agents, random, operator, heapq, json, copy, multiprocessing
+import itertools, os, shutil
+import numpy as np
 
 #______________________________________________________________________________
 
@@ -41,7 +43,8 @@ class DataSet:
             self.examples = parse_csv(DataFile(name+'.csv').read())
         else:
             self.examples = examples
-        map(self.check_example, self.examples)
+        if self.values:
+            map(self.check_example, self.examples)
         # Attrs are the indicies of examples, unless otherwise stated.
         if not attrs and self.examples:
             attrs = range(len(self.examples[0]))
@@ -62,12 +65,15 @@ class DataSet:
         self.target = self.attrnum(target)
         exclude = map(self.attrnum, exclude)
         if inputs:
-            self.inputs = removall(self.target, inputs)
+            self.inputs = removeall(self.target, map(self.attrnum, inputs))
         else:
             self.inputs = [a for a in self.attrs
                            if a is not self.target and a not in exclude]
         if not self.values:
-            self.values = map(unique, zip(*self.examples))
+            if hasattr(self.examples, 'unique_values'):
+                self.values = self.examples.unique_values()
+            else:
+                self.values = map(unique, zip(*self.examples))
 
     def add_example(self, example):
         """Add an example to the list of examples, checking it first."""
@@ -91,6 +97,13 @@ class DataSet:
         else:
             return attr
 
+    def column(self, attr):
+        "Return the values of attr in every example, as an array."
+        a = self.attrnum(attr)
+        if hasattr(self.examples, 'column'):
+            return self.examples.column(a)
+        return np.array([e[a] for e in self.examples])
+
     def sanitize(self, example):
        "Return a copy of example, with non-input attributes replaced by 0."
        return [i in self.inputs and example[i] for i in range(len(example))] 
@@ -125,6 +138,253 @@ def mean_boolean_error(predictions, targets):
     return mean([(p != t)   for p, t in zip(predictions, targets)])
 
 
+#______________________________________________________________________________
+# Examples stored by column
+
+class ColumnStore:
+    r"""Examples held as one typed numpy array per attribute, rather than a
+    list of lists. A column holds ints, floats, or, for any other values,
+    the int32 code of each value in the column's list of levels. It reads
+    like a list of examples (len, indexing, slicing and iteration give
+    examples as lists), so a DataSet can be made of one; column() gives a
+    whole attribute as an array. A store saved with save() is read back by
+    load() as memory maps, so that opening it costs nothing and processes
+    that read the same store share its pages.
+    >>> store = read_csv_columns(['1, 2.5, a\n', ' 2, 3, b\n', ' 3, 1, a\n'])
+    >>> store.kinds, store.levels[2], len(store)
+    (['i', 'f', 'c'], ['a', 'b'], 3)
+    >>> store[1], store.column(2)
+    ([2, 3.0, 'b'], array(['a', 'b', 'a'], dtype=object))
+    """
+
+    def __init__(self, columns, kinds, levels, values=None):
+        update(self, columns=columns, kinds=kinds, levels=levels,
+               values=values)
+
+    def __len__(self):
+        return len(self.columns[0]) if self.columns else 0
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return ColumnStore([c[i] for c in self.columns], self.kinds,
+                               self.levels)
+        return [self.decode(a, c[i].item())
+                for a, c in enumerate(self.columns)]
+
+    def __iter__(self, chunk=4096):
+        for start in range(0, len(self), chunk):
+            columns = [self.decoded(a, c[start:start + chunk])
+                       for a, c in enumerate(self.columns)]
+            for example in zip(*columns):
+                yield list(example)
+
+    def __repr__(self):
+        return '<ColumnStore: %d examples, %d attributes>' % (
+            len(self), len(self.columns))
+
+    def decode(self, a, x):
+        return self.levels[a][x] if self.kinds[a] == 'c' else x
+
+    def decoded(self, a, values):
+        "The list of values of attribute a for an array of its column."
+        if self.kinds[a] == 'c':
+            return [self.levels[a][x] for x in values.tolist()]
+        return values.tolist()
+
+    def column(self, a):
+        """The values of attribute a as an array: the column itself for ints
+        and floats, an array of objects for other values."""
+        if self.kinds[a] == 'c':
+            return np.array(self.levels[a], dtype=object)[self.columns[a]]
+        return self.columns[a]
+
+    def unique_values(self):
+        """The distinct values of each attribute, as DataSet.values: a list
+        of the levels, or a sorted array of the numbers. Found once, and kept
+        by save()."""
+        if self.values is None:
+            self.values = [self.levels[a] if kind == 'c' else np.unique(c)
+                           for a, (kind, c) in enumerate(zip(self.kinds,
+                                                             self.columns))]
+        return self.values
+
+    def save(self, path):
+        """Save the store in the directory at path: one .npy file per column
+        and one of the distinct values of each numeric column, and the kinds
+        and levels in columns.json."""
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        for a, c in enumerate(self.columns):
+            np.save(os.path.join(path, '%d.npy' % a), np.asarray(c))
+        self.save_index(path)
+
+    def save_index(self, path):
+        "Save all but the columns themselves: their values, kinds and levels."
+        values = self.unique_values()
+        for a, kind in enumerate(self.kinds):
+            if kind != 'c':
+                np.save(os.path.join(path, '%d.values.npy' % a), values[a])
+        with open(os.path.join(path, 'columns.json'), 'w') as f:
+            json.dump({'kinds': self.kinds, 'levels': self.levels}, f)
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        "Read back a store written by save, memory mapped unless mmap=False."
+        with open(os.path.join(path, 'columns.json')) as f:
+            meta = json.load(f)
+        kinds = [str(k) for k in meta['kinds']]
+        levels = [l and [str(v) if isinstance(v, unicode) else v for v in l]
+                  for l in meta['levels']]
+        mode = 'r' if mmap else None
+        columns = [np.load(os.path.join(path, '%d.npy' % a), mmap_mode=mode)
+                   for a in range(len(kinds))]
+        values = [levels[a] if k == 'c' else
+                  np.load(os.path.join(path, '%d.values.npy' % a),
+                          mmap_mode=mode)
+                  for a, k in enumerate(kinds)]
+        return cls(columns, kinds, levels, values)
+
+class ColumnWriter:
+    r"""Build a ColumnStore in the directory at path a chunk of rows at a
+    time, so that one bigger than memory can be written from a stream of
+    rows. The kind of every column ('i', 'f' or 'c') is given up front, and
+    levels are numbered as they come. Chunks are appended to raw files,
+    which close() turns into the files ColumnStore.load reads; it returns
+    the store, memory mapped.
+    >>> import tempfile; path = tempfile.mkdtemp()
+    >>> w = ColumnWriter(path, ['i', 'f', 'c'])
+    >>> w.write([[1, 2], [0.5, 1.5], ['a', 'b']]); w.write([[3], [2.5], ['a']])
+    >>> store = w.close(); list(store), store.levels[2]
+    ([[1, 0.5, 'a'], [2, 1.5, 'b'], [3, 2.5, 'a']], ['a', 'b'])
+    >>> w = ColumnWriter(tempfile.mkdtemp(), ['i', 'f', 'c'])
+    >>> w.write([[0], [0.0], ['b']]); w.write_store(store, chunk_rows=2)
+    >>> list(w.close())[:2]
+    [[0, 0.0, 'b'], [1, 0.5, 'a']]
+    """
+
+    dtypes = {'i': np.int64, 'f': np.float64, 'c': np.int32}
+
+    def __init__(self, path, kinds):
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        update(self, path=path, kinds=list(kinds), n=0,
+               codes=[{} for k in kinds],
+               files=[open(os.path.join(path, '%d.part' % a), 'wb')
+                      for a in range(len(kinds))])
+
+    def write(self, columns):
+        "Append a chunk of rows, given as one sequence of values per column."
+        for a, (kind, values) in enumerate(zip(self.kinds, columns)):
+            if kind == 'c':
+                values = to_codes(list(values), self.codes[a])
+            np.asarray(values, dtype=self.dtypes[kind]).tofile(self.files[a])
+        self.n += len(columns[0]) if columns else 0
+
+    def write_store(self, store, chunk_rows=65536):
+        """Append every row of a ColumnStore of the same kinds, chunk_rows
+        at a time, so that a memory mapped store is never read in whole."""
+        for start in range(0, len(store), chunk_rows):
+            part = store[start:start + chunk_rows]
+            self.write([part.decoded(a, c)
+                        for a, c in enumerate(part.columns)])
+
+    def close(self):
+        "Finish the store, and return it."
+        for a, (kind, f) in enumerate(zip(self.kinds, self.files)):
+            f.close()
+            part = os.path.join(self.path, '%d.part' % a)
+            with open(os.path.join(self.path, '%d.npy' % a), 'wb') as out:
+                np.lib.format.write_array_header_1_0(out, {
+                    'descr': np.lib.format.dtype_to_descr(
+                        np.dtype(self.dtypes[kind])),
+                    'fortran_order': False, 'shape': (self.n,)})
+                with open(part, 'rb') as data:
+                    shutil.copyfileobj(data, out)
+            os.remove(part)
+        levels = [sorted(c, key=c.get) if k == 'c' else None
+                  for c, k in zip(self.codes, self.kinds)]
+        mode = 'r' if self.n else None  # empty arrays can't be mapped
+        columns = [np.load(os.path.join(self.path, '%d.npy' % a),
+                           mmap_mode=mode) for a in range(len(self.kinds))]
+        store = ColumnStore(columns, self.kinds, levels)
+        store.save_index(self.path)
+        return store
+
+def read_csv_columns(input, delim=',', chunk_rows=65536):
+    r"""Read comma-delimited lines from a file (or any iterable of lines)
+    into a ColumnStore, chunk_rows lines at a time, so that only one chunk
+    is ever held as strings. Blank lines are skipped. Fields are read as by
+    num_or_str: a column is of ints if all its fields are ints, else of
+    floats if they are all numbers, and of levels otherwise.
+    >>> s = read_csv_columns(['1, 2, 3', '', '0, 2.5, na'], chunk_rows=1)
+    >>> list(s), s.kinds
+    ([[1, 2.0, 3], [0, 2.5, 'na']], ['i', 'f', 'c'])
+    """
+    lines = iter(input)
+    chunks = kinds = codes = None
+    while True:
+        block = list(itertools.islice(lines, chunk_rows))
+        if not block:
+            break
+        rows = [line.split(delim) for line in block if line.strip() != '']
+        if not rows:
+            continue
+        if chunks is None:
+            d = len(rows[0])
+            chunks, kinds = [[] for a in range(d)], ['i'] * d
+            codes = [{} for a in range(d)]
+        for a, fields in enumerate(zip(*rows)):
+            chunk, kind = parse_column(fields, kinds[a], codes[a])
+            if kind == 'c' and kinds[a] != 'c':
+                # earlier chunks were numbers; make them levels too
+                chunks[a] = [to_codes(c.tolist(), codes[a]) for c in chunks[a]]
+            kinds[a] = kind
+            chunks[a].append(chunk)
+    if chunks is None:
+        return ColumnStore([], [], [])
+    columns = [np.concatenate(c).astype({'i': np.int64, 'f': np.float64,
+                                         'c': np.int32}[k])
+               for c, k in zip(chunks, kinds)]
+    levels = [sorted(codes[a], key=codes[a].get) if k == 'c' else None
+              for a, k in enumerate(kinds)]
+    return ColumnStore(columns, kinds, levels)
+
+def parse_column(fields, kind, codes):
+    """Parse a chunk of one column's fields, as the kind of column it has
+    been so far ('i', 'f' or 'c') or a wider one. Return the array and its
+    kind. Levels are numbered in codes."""
+    fields = np.array(fields)
+    if kind == 'i':
+        try:
+            return fields.astype(np.int64), 'i'
+        except ValueError:
+            kind = 'f'
+    if kind == 'f':
+        try:
+            return fields.astype(np.float64), 'f'
+        except ValueError:
+            pass
+    # only parse each distinct field once
+    distinct, inverse = np.unique(fields, return_inverse=True)
+    return to_codes(map(num_or_str, distinct.tolist()), codes)[inverse], 'c'
+
+def to_codes(values, codes):
+    "The int32 array of the codes of values, numbering new ones in codes."
+    return np.array([codes.setdefault(v, len(codes)) for v in values],
+                    dtype=np.int32)
+
+def columnar_dataset(source, delim=',', chunk_rows=65536, **fields):
+    """Build a DataSet of a ColumnStore: read from a CSV file if source is
+    the path to one, or loaded (memory mapped) if it is a directory written
+    by ColumnStore.save. Other arguments are DataSet fields."""
+    if os.path.isdir(source):
+        store = ColumnStore.load(source)
+    else:
+        with open(source) as f:
+            store = read_csv_columns(f, delim, chunk_rows)
+    return DataSet(examples=store, **fields)
+
+
 #______________________________________________________________________________
 
 class Learner:
@@ -154,82 +414,337 @@ class MajorityLearner(Learner):
 #______________________________________________________________________________
 
 class NaiveBayesLearner(Learner):
-    
+    """Naive Bayes: predict the class c with the highest log P(c) plus the
+    sum over the inputs a of log P(example[a] | c), each probability
+    estimated from counts with Laplace (add one) smoothing. Every value of
+    every input seen in training gets a row of one count table, with a
+    column per class, so training is a scatter-add of the examples' rows
+    and scoring sums one row per input of a table of log counts. Values
+    never seen share row 0, which stays empty. Numbers are counted by value
+    like anything else. partial_fit learns more examples, of new classes
+    and values or not, without starting over.
+    >>> examples = [[x % 3, x % 2, 'yes' if x % 3 == 0 else 'no']
+    ...             for x in range(30)]
+    >>> nb = NaiveBayesLearner(); nb.train(DataSet(examples=examples))
+    >>> nb.predict([0, 1, None]), nb.predict([2, 0, None])
+    ('yes', 'no')
+    >>> nb.partial_fit([[7, 0, 'maybe']] * 3)
+    >>> nb.predict_batch([[7, 1, None], [0, 0, None], [2, 1, None]])
+    ['maybe', 'yes', 'no']
+    """
+
     def train(self, dataset):
-        """Just count the target/attr/val occurences.
-        Count how many times each value of each attribute occurs.
-        Store count in N[targetvalue][attr][val]. Let N[attr][None] be the
-        sum over all vals."""
-        N = {}
-        ## Initialize to 0
-        for gv in self.dataset.values[self.dataset.target]:
-            N[gv] = {}
-            for attr in self.dataset.attrs:
-                N[gv][attr] = {}
-                for val in self.dataset.values[attr]:
-                    N[gv][attr][val] = 0
-                    N[gv][attr][None] = 0
-        ## Go thru examples
-        for example in self.dataset.examples:
-            Ngv = N[example[self.dataset.target]]
-            for attr in self.dataset.attrs:
-                Ngv[attr][example[attr]] += 1
-                Ngv[attr][None] += 1
-        self._N = N
-
-    def N(self, targetval, attr, attrval):
-       "Return the count in the training data of this combination."
-       try:
-          return self._N[targetval][attr][attrval]
-       except KeyError:
-          return 0
-
-    def P(self, targetval, attr, attrval):
-        """Smooth the raw counts to give a probability estimate.
-        Estimate adds 1 to numerator and len(possible vals) to denominator."""
-        return ((self.N(targetval, attr, attrval) + 1.0) /
-                (self.N(targetval, attr, None) + len(self.dataset.values[attr])))
+        self.dataset = dataset
+        self.inputs = list(dataset.inputs)
+        self.classes, self.class_codes = [], {}
+        self.codes = [{} for a in self.inputs]
+        self.coders = zip(self.codes, self.inputs)
+        self.counts = np.zeros((1, 0), dtype=np.int64)
+        self.log_counts = np.zeros((1, 0))
+        self.class_counts = np.zeros(0, dtype=np.int64)
+        self.partial_fit(dataset.examples)
+
+    def partial_fit(self, examples):
+        "Count more examples, adding any new classes and values."
+        X = self.encode(examples, grow=True)
+        y = np.array([self.class_codes.setdefault(c, len(self.class_codes))
+                      for c in example_column(examples, self.dataset.target)],
+                     dtype=np.intp)
+        for c in sorted(self.class_codes, key=self.class_codes.get)[
+                len(self.classes):]:
+            self.classes.append(c)
+        # make room for new values and classes; new cells are all 0
+        rows = 1 + sum(map(len, self.codes)) - len(self.counts)
+        cols = len(self.classes) - len(self.class_counts)
+        if rows or cols:
+            self.counts = np.pad(self.counts, ((0, rows), (0, cols)),
+                                 'constant')
+            self.log_counts = np.pad(self.log_counts, ((0, rows), (0, cols)),
+                                     'constant')
+            self.class_counts = np.pad(self.class_counts, (0, cols),
+                                       'constant')
+        Y = np.repeat(y[:, np.newaxis], X.shape[1], axis=1)
+        np.add.at(self.counts, (X, Y), 1)
+        np.add.at(self.class_counts, y, 1)
+        self.log_counts[X, Y] = np.log1p(self.counts[X, Y])
+        # log P(c), less the log of the denominator of every P(value | c)
+        n = self.class_counts
+        values = np.array(map(len, self.codes))
+        self.base = (np.log(n + 1.) - np.log(n.sum() + len(n)) -
+                     np.log(n[:, np.newaxis] + values).sum(axis=1))
+
+    def encode(self, examples, grow=False):
+        """The (n, inputs) array of the count table rows of the examples'
+        inputs. A value not seen yet gets a new row if grow, else row 0."""
+        X = np.zeros((len(examples), len(self.inputs)), dtype=np.intp)
+        for i, (codes, a) in enumerate(self.coders):
+            values = example_column(examples, a)
+            if grow:
+                for v in set(values).difference(codes):
+                    codes[v] = 1 + sum(map(len, self.codes))
+            X[:, i] = [codes.get(v, 0) for v in values]
+        return X
+
+    def log_scores(self, examples):
+        """The (n, classes) array of log P(c) + sum log P(value | c) of
+        every example and class."""
+        X = self.encode(examples)
+        scores = np.tile(self.base, (len(X), 1))
+        for i in range(X.shape[1]):
+            scores += self.log_counts[X[:, i]]
+        return scores
 
     def predict(self, example):
-        """Predict the target value for example. Consider each possible value,
-        choose the most likely, by looking at each attribute independently."""
-        possible_values = self.dataset.values[self.dataset.target]
-        def class_probability(targetval):
-            return product([self.P(targetval, a, example[a])
-                            for a in self.dataset.inputs], 1)
-        return argmax(possible_values, class_probability)
+        rows = [codes.get(example[a], 0) for codes, a in self.coders]
+        scores = self.log_counts[rows].sum(axis=0) + self.base
+        return self.classes[scores.argmax()]
+
+    def predict_batch(self, examples):
+        "Predict the target of each of a list of examples."
+        return [self.classes[c] for c in self.log_scores(examples).argmax(
+            axis=1)]
+
+def example_column(examples, a):
+    """The values of attribute a of the examples, as a list, with NaN as
+    None so that unknown values are all the same. Only a ColumnStore, or a
+    view of one, is read a column at a time: an array made of a list of
+    examples would turn a column of mixed types into strings.
+    >>> ds = DataSet(examples=[[v, v == 1] for v in [1, 2, '?'] * 20])
+    >>> example_column(subset(ds, [0, 2]).examples, 0)
+    [1, '?']
+    >>> nb = NaiveBayesLearner(); nb.train(subset(ds, range(60))); test(nb, ds)
+    1.0
+    """
+    store = examples
+    while isinstance(store, ExampleView):
+        store = store.examples
+    if not isinstance(store, ColumnStore):
+        return [e[a] for e in examples]
+    values = examples.column(a)
+    if values.dtype.kind == 'f' and np.isnan(values).any():
+        values = np.where(np.isnan(values), None, values)
+    return values.tolist()
 
 #______________________________________________________________________________
 
 class NearestNeighborLearner(Learner):
+    """k-NearestNeighbor: the k nearest neighbors vote. When every input is
+    numeric, neighbors are found with a KDTree over the inputs, measured by
+    the Minkowski distance of order p (1, 2 or infinity) after multiplying
+    each input by its scale. Otherwise every example is compared with
+    self.distance, the fraction of attributes that differ.
+    >>> examples = [[x, y, x + y > 10] for x in range(10) for y in range(10)]
+    >>> nn = NearestNeighborLearner(k=3)
+    >>> nn.train(DataSet(examples=examples))
+    >>> nn.predict([2.2, 3.1, None]), nn.predict([8, 9.5, None])
+    (False, True)
+    >>> nn.add([20, 20, 'far']); nn.predict([19, 21, None])
+    True
+    >>> nn1 = NearestNeighborLearner(k=1); nn1.train(DataSet(examples=examples))
+    >>> nn1.add([20, 20, 'far']); nn1.predict([19, 21, None])
+    'far'
+    >>> nn.predict_batch([[0, 0, None], [9, 9, None]])
+    [False, True]
+    """
+
+    def __init__(self, k=1, p=2, scale=None, leaf_size=64):
+        update(self, k=k, p=p, scale=scale, leaf_size=leaf_size)
+
+    def train(self, dataset):
+        self.dataset = dataset
+        self.inputs = list(dataset.inputs)
+        self.examples = list(dataset.examples)
+        self.targets = [e[dataset.target] for e in self.examples]
+        if all(isnumber(e[a]) for e in self.examples for a in self.inputs):
+            self.tree = KDTree(self.points(self.examples), self.p,
+                               self.scale, self.leaf_size)
+        else:
+            self.tree = None
 
-    def __init__(self, k=1):
-        "k-NearestNeighbor: the k nearest neighbors vote."
-        self.k = k
+    def points(self, examples):
+        "The (n, inputs) array of the inputs of examples."
+        return np.array([[e[a] for a in self.inputs] for e in examples],
+                        dtype=float).reshape(len(examples), len(self.inputs))
+
+    def add(self, example):
+        "Learn one more example, without training again."
+        self.examples.append(example)
+        self.targets.append(example[self.dataset.target])
+        if self.tree is not None:
+            self.tree.insert(self.points([example]))
+
+    def neighbors(self, example):
+        "Return the numbers of the k training examples nearest to example."
+        k = min(self.k, len(self.examples))
+        if self.tree is not None:
+            return self.tree.query(self.points([example])[0], k)[1]
+        return [i for d, i in heapq.nsmallest(
+            k, ((self.distance(e, example), i)
+                for i, e in enumerate(self.examples)))]
 
     def predict(self, example):
         """With k=1, find the point closest to example.
         With k>1, find k closest, and have them vote for the best."""
-        if self.k == 1:
-            neighbor = argmin(self.dataset.examples,
-                              lambda e: self.distance(e, example))
-            return neighbor[self.dataset.target]
-        else:
-            ## Maintain a sorted list of (distance, example) pairs.
-            ## For very large k, a PriorityQueue would be better
-            best = [] 
-            for e in examples:
-                d = self.distance(e, example)
-                if len(best) < k: 
-                    e.append((d, e))
-                elif d < best[-1][0]:
-                    best[-1] = (d, e)
-                    best.sort()
-            return mode([e[self.dataset.target] for (d, e) in best])
+        return mode([self.targets[i] for i in self.neighbors(example)])
+
+    def predict_batch(self, examples):
+        "Predict the target of each of a list of examples."
+        if self.tree is None:
+            return map(self.predict, examples)
+        ids = self.tree.query_batch(self.points(examples),
+                                    min(self.k, len(self.examples)))[1]
+        return [mode([self.targets[i] for i in row]) for row in ids]
 
     def distance(self, e1, e2):
         return mean_boolean_error(e1, e2)
 
+def minkowski(diffs, p=2):
+    """Minkowski distances of order p along the last axis of an array of
+    differences. p=2 is the Euclidean distance, p=1 the Manhattan distance
+    and p=infinity the Chebyshev distance.
+    >>> [float(minkowski(np.array([3., -4.]), p)) for p in (1, 2, infinity)]
+    [7.0, 5.0, 4.0]
+    """
+    diffs = np.abs(diffs)
+    if p == 2:
+        return np.sqrt((diffs * diffs).sum(axis=-1))
+    elif p == 1:
+        return diffs.sum(axis=-1)
+    elif p == infinity:
+        return diffs.max(axis=-1)
+    return (diffs ** p).sum(axis=-1) ** (1. / p)
+
+class KDTree:
+    """A k-d tree over n points of d dimensions, for finding the k points
+    nearest to a query point. Each node covers a range of the points, kept
+    contiguous in one array; inner nodes split theirs at the median of
+    their widest dimension. Leaves hold at most leaf_size points, whose
+    distances are computed together. A search visits the nearer child
+    first, and skips the farther one if the distance to its side of the
+    split, accumulated over the splits above it, is more than that of the
+    k-th nearest point found so far. [Arya and Mount, 1993]
+
+    Points inserted after the tree is built are kept in a separate array
+    that is searched exhaustively, and the tree is rebuilt with them once
+    they make up more than 'rebuild' of all the points. Points are numbered
+    in the order they were given, inserted ones after the rest.
+    >>> t = KDTree([[0, 0], [1, 0], [0, 2], [5, 5], [4, 4]], leaf_size=1)
+    >>> t.query([0.9, 0.2], 2)
+    (array([0.2236068 , 0.92195445]), array([1, 0]))
+    >>> t.insert([[1, 0.1]]); t.query([0.9, 0.2], 2)[1]
+    array([5, 1])
+    >>> t.query_batch([[5, 6], [0, 1.9]], 1)[1].ravel()
+    array([3, 2])
+    """
+
+    def __init__(self, points, p=2, scale=None, leaf_size=64, rebuild=.05):
+        points = np.asarray(points, dtype=float)
+        update(self, p=p, leaf_size=leaf_size, rebuild=rebuild,
+               scale=None if scale is None else np.asarray(scale, float))
+        self.build(self.scaled(points))
+
+    def scaled(self, points):
+        points = np.atleast_2d(np.asarray(points, dtype=float))
+        if self.scale is not None:
+            points = points * self.scale
+        return points
+
+    def build(self, points):
+        "Build the tree over an (n, d) array of scaled points."
+        n = len(points)
+        order = np.arange(n)
+        start, end, dim, split, left, right = [], [], [], [], [], []
+        agenda = [(0, n, None, None)]
+        while agenda:
+            i, j, parent, side = agenda.pop()
+            node = len(start)
+            if parent is not None:
+                (left if side == 0 else right)[parent] = node
+            start.append(i); end.append(j); left.append(-1); right.append(-1)
+            dim.append(0); split.append(0.)
+            if j - i > self.leaf_size:
+                box = points[order[i:j]]
+                widest = int(np.argmax(box.max(axis=0) - box.min(axis=0)))
+                m = (j - i) // 2
+                order[i:j] = order[i:j][np.argpartition(box[:, widest], m)]
+                dim[node] = widest
+                split[node] = float(points[order[i + m], widest])
+                agenda.append((i + m, j, node, 1))
+                agenda.append((i, i + m, node, 0))
+        update(self, points=points[order], ids=order, start=start, end=end,
+               dim=dim, split=split, left=left, right=right,
+               extra=np.empty((0, points.shape[1])), n=n)
+
+    def __len__(self):
+        return self.n + len(self.extra)
+
+    def insert(self, points):
+        "Add more points to search, rebuilding the tree if it's time to."
+        self.extra = np.vstack([self.extra, self.scaled(points)])
+        if len(self.extra) > max(self.rebuild * len(self), self.leaf_size):
+            everything = np.empty((len(self), self.points.shape[1]))
+            everything[self.ids] = self.points
+            everything[self.n:] = self.extra
+            self.build(everything)
+
+    def query(self, x, k=1):
+        """Return the distances and numbers of the k points nearest x, as
+        arrays, nearest first."""
+        x = self.scaled(x)[0]
+        p, inf = self.p, self.p == infinity
+        # distances are compared as their pth powers, which saves roots
+        power = (lambda d: d) if inf else (lambda d: d ** p)
+        best = []  # a heap of (-distance, number) of the k nearest so far
+        def consider(dists, ids):
+            for i in np.argsort(dists)[:k]:
+                d = dists[i]
+                if len(best) < k:
+                    heapq.heappush(best, (-d, ids[i]))
+                elif d < -best[0][0]:
+                    heapq.heapreplace(best, (-d, ids[i]))
+                else:
+                    break
+        if len(self.extra):
+            consider(minkowski(self.extra - x, p),
+                     np.arange(self.n, len(self)))
+        xs = x.tolist()
+        # (node, bound on the pth power of the distance to it, and the
+        # offsets from x to it along each dimension that bound adds up)
+        stack = [(0, 0., [0.] * len(xs))]
+        while stack:
+            node, bound, offsets = stack.pop()
+            if len(best) == k and bound >= power(-best[0][0]):
+                continue
+            near = self.left[node]
+            if near < 0:
+                i, j = self.start[node], self.end[node]
+                consider(minkowski(self.points[i:j] - x, p), self.ids[i:j])
+                continue
+            far = self.right[node]
+            dim = self.dim[node]
+            diff = xs[dim] - self.split[node]
+            if diff > 0:
+                near, far = far, near
+            diff = abs(diff)
+            if inf:
+                stack.append((far, max(bound, diff), offsets))
+            else:
+                far_offsets = offsets[:]
+                far_offsets[dim] = diff
+                stack.append((far, bound - offsets[dim] ** p + diff ** p,
+                              far_offsets))
+            stack.append((near, bound, offsets))
+        best.sort(reverse=True)
+        return (np.array([-d for d, i in best]),
+                np.array([i for d, i in best], dtype=np.intp))
+
+    def query_batch(self, X, k=1):
+        """Return (n, k) arrays of the distances and numbers of the k points
+        nearest each of n points."""
+        results = [self.query(x, k) for x in np.atleast_2d(X)]
+        return (np.array([d for d, i in results]).reshape(-1, k),
+                np.array([i for d, i in results]).reshape(-1, k))
+
 #______________________________________________________________________________
 
 class DecisionTree:
@@ -352,6 +867,211 @@ def information_content(values):
 
 #______________________________________________________________________________
 
+### Decision trees over arrays: binary splits on thresholds of numeric
+### attributes and on single values of the others, learned from count vectors
+### over presorted columns, and compiled to flat arrays for fast prediction.
+
+def entropy_of_counts(counts):
+    """Bits of information in each row of class counts (the last axis).
+    >>> entropy_of_counts([[1, 1], [4, 0], [0, 0]])
+    array([1., 0., 0.])
+    """
+    counts = np.asarray(counts, dtype=float)
+    n = counts.sum(axis=-1)
+    p = counts / np.maximum(n, 1)[..., np.newaxis]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(p > 0, -p * np.log2(p), 0.).sum(axis=-1)
+
+class FlatDecisionTree:
+    """A binary decision tree stored as parallel arrays, one entry per node.
+    Node i tests attribute attr[i] of an example: a numeric attribute goes
+    to node left[i] if it is <= threshold[i], any other goes there if it
+    equals test[i]; otherwise the example goes to right[i]. Leaves have
+    left[i] == -1 and predict classes[value[i]]. Predicting an example
+    walks Python lists, so takes a few microseconds; predict_batch walks a
+    whole array of encoded examples down the tree at once."""
+
+    def __init__(self, attrs, equal, threshold, test, left, right, value,
+                 classes, encoders):
+        update(self, attr=np.array(attrs, dtype=np.intp),
+               equal=np.array(equal, dtype=bool),
+               threshold=np.array(threshold, dtype=float),
+               left=np.array(left, dtype=np.intp),
+               right=np.array(right, dtype=np.intp),
+               value=np.array(value, dtype=np.intp),
+               classes=list(classes), encoders=encoders)
+        self.nodes = zip(attrs, equal, test, left, right, value)
+
+    def predict(self, example):
+        "Follow the example's attribute values from the root to a leaf."
+        nodes, i = self.nodes, 0
+        attr, equal, test, left, right, value = nodes[0]
+        while left >= 0:
+            x = example[attr]
+            if (x == test) if equal else (x <= test):
+                i = left
+            else:
+                i = right
+            attr, equal, test, left, right, value = nodes[i]
+        return self.classes[value]
+
+    def predict_batch(self, X):
+        """Return the class numbers of a batch of encoded examples (see
+        encode), an (n, attrs) array, by moving them all a level at a time."""
+        X = np.asarray(X, dtype=float)
+        rows = np.arange(len(X))
+        node = np.zeros(len(X), dtype=np.intp)
+        active = self.left[node] >= 0
+        while active.any():
+            r, i = rows[active], node[active]
+            x = X[r, self.attr[i]]
+            go_left = np.where(self.equal[i], x == self.threshold[i],
+                               x <= self.threshold[i])
+            node[r] = np.where(go_left, self.left[i], self.right[i])
+            active = self.left[node] >= 0
+        return self.value[node]
+
+    def encode(self, examples):
+        "Turn examples into an array for predict_batch; see encode_examples."
+        return encode_examples(examples, self.encoders)
+
+    def __len__(self):
+        return len(self.nodes)
+
+def encode_examples(examples, encoders):
+    """Turn examples into an (n, attrs) float array: attributes with no
+    encoder as they are, others as the number their encoder gives their
+    value, or -1 for a value it doesn't know. Attributes with an empty
+    encoder are left out, as 0."""
+    X = np.zeros((len(examples), len(encoders)))
+    for a, codes in enumerate(encoders):
+        if codes is None:
+            X[:, a] = [e[a] for e in examples]
+        elif codes:
+            X[:, a] = [codes.get(e[a], -1) for e in examples]
+    return X
+
+class ArrayDecisionTreeLearner(Learner):
+    """Learn a binary FlatDecisionTree, splitting on whichever attribute
+    test has the highest information gain. Numeric attributes are split at
+    a threshold, any other at a single value against the rest. Information
+    gain is computed from class count vectors: every numeric column is
+    sorted once, kept sorted as the examples are split, and scanned with a
+    running count of the classes below each threshold, so that every
+    threshold is tried in one pass. Growing stops at max_depth, or where a
+    split would leave fewer than min_leaf examples on a side.
+    >>> examples = [[x / 10., (x / 10.) % 2 == 1, 'odd' if x % 2 else 'even',
+    ...              x % 20 >= 10] for x in range(40)]
+    >>> ds = DataSet(examples=examples)
+    >>> dt = ArrayDecisionTreeLearner()
+    >>> dt.train(ds)
+    >>> test(dt, ds)
+    1.0
+    >>> dt.predict([2.5, False, 'odd', None]), dt.predict([3.5, True, 'x', 0])
+    (False, True)
+    >>> len(dt.tree), list(dt.tree.predict_batch(dt.tree.encode(examples[9:12])))
+    (7, [0, 1, 1])
+    """
+
+    def __init__(self, max_depth=None, min_leaf=1):
+        update(self, max_depth=max_depth, min_leaf=min_leaf)
+
+    def train(self, dataset):
+        self.dataset = dataset
+        self.tree = self.grow(dataset)
+
+    def predict(self, example):
+        return self.tree.predict(example)
+
+    def grow(self, dataset):
+        "Grow the tree for the dataset, one node at a time, widest first."
+        examples, inputs = dataset.examples, dataset.inputs
+        classes = sorted(unique(e[dataset.target] for e in examples))
+        y = np.array([classes.index(c) for c in
+                      [e[dataset.target] for e in examples]], dtype=np.intp)
+        C = len(classes)
+        encoders = [None] * len(dataset.attrs)
+        for a in dataset.attrs:
+            if a not in inputs:
+                encoders[a] = {}
+            elif not all(isnumber(e[a]) for e in examples):
+                values = unique(e[a] for e in examples)
+                encoders[a] = dict((v, i) for i, v in enumerate(values))
+        self.encoders = encoders
+        X = encode_examples(examples, encoders)
+        onehot = np.eye(C, dtype=np.intp)[y]
+        # each input's example numbers, in increasing order of its values
+        columns = [np.argsort(X[:, a], kind='mergesort') for a in inputs]
+        nodes = []
+        agenda = [(columns, 0)]
+        while agenda:
+            columns, depth = agenda.pop(0)
+            rows = columns[0]
+            counts = onehot[rows].sum(axis=0)
+            node = [-1, False, 0., None, -1, -1, int(np.argmax(counts))]
+            nodes.append(node)
+            if (counts.max() == len(rows) or depth == self.max_depth
+                    or len(rows) < 2 * self.min_leaf):
+                continue
+            split = self.best_split(X, y, onehot, counts, inputs, columns)
+            if split is None:
+                continue
+            a, equal, threshold, test = split
+            x = X[rows, a]
+            goes_left = np.zeros(len(X), dtype=bool)
+            goes_left[rows] = (x == threshold) if equal else (x <= threshold)
+            node[:4] = [a, equal, threshold, test]
+            for k, side in [(4, goes_left), (5, ~goes_left)]:
+                node[k] = len(nodes) + len(agenda)
+                agenda.append(([c[side[c]] for c in columns], depth + 1))
+        attrs, equal, threshold, test, left, right, value = zip(*nodes)
+        return FlatDecisionTree(attrs, equal, threshold, test, left, right,
+                                value, classes, encoders)
+
+    def best_split(self, X, y, onehot, counts, inputs, columns):
+        """Return (attr, equal, threshold, test) for the split of the examples
+        in columns with the highest information gain, or None if none gains."""
+        n, best, best_gain = len(columns[0]), None, 1e-12
+        parent = entropy_of_counts(counts)
+        m = self.min_leaf
+        for a, rows in zip(inputs, columns):
+            x = X[rows, a]
+            if self.encoders[a] is None:
+                # below[i] are the counts of the examples up to rows[i]
+                below = np.cumsum(onehot[rows], axis=0)[:-1]
+                nl = np.arange(1, n)
+                ok = (x[1:] != x[:-1]) & (nl >= m) & (n - nl >= m)
+                if not ok.any():
+                    continue
+                below, nl = below[ok], nl[ok]
+                remainder = (nl * entropy_of_counts(below) + (n - nl) *
+                             entropy_of_counts(counts - below)) / n
+                i = np.argmin(remainder)
+                if parent - remainder[i] > best_gain:
+                    j = np.nonzero(ok)[0][i]
+                    t = (x[j] + x[j + 1]) / 2.
+                    best, best_gain = (a, False, t, t), parent - remainder[i]
+            else:
+                codes = x.astype(np.intp)
+                V = len(self.encoders[a])
+                C = len(counts)
+                equal = np.bincount(codes * C + y[rows],
+                                    minlength=V * C).reshape(V, C)
+                nl = equal.sum(axis=1)
+                ok = (nl >= m) & (n - nl >= m)
+                if not ok.any():
+                    continue
+                remainder = np.where(ok, (nl * entropy_of_counts(equal) +
+                    (n - nl) * entropy_of_counts(counts - equal)) / n, np.inf)
+                v = np.argmin(remainder)
+                if parent - remainder[v] > best_gain:
+                    test = [k for k, c in self.encoders[a].items() if c == v][0]
+                    best, best_gain = (a, True, float(v), test), \
+                                      parent - remainder[v]
+        return best
+
+#______________________________________________________________________________
+
 ### A decision list is implemented as a list of (test, value) pairs.
 
 class DecisionListLearner(Learner):
@@ -376,34 +1096,249 @@ class DecisionListLearner(Learner):
         NotImplemented
 #______________________________________________________________________________
 
-class NeuralNetLearner(Learner):
-   """Layered feed-forward network."""
+class FeatureEncoder:
+    """Turns the inputs of examples into vectors of numbers, for learners
+    that need them: a numeric input becomes one column, standardized to
+    mean 0 and deviation 1 over the training examples, and any other input
+    one column per value it took in training, 1 for the example's value and
+    0 for the rest. A value not seen in training has all its columns 0.
+    The plan is a list of (attr, column, codes, mean, deviation), one per
+    input, where codes maps every value of a non-numeric input to its
+    column and is None for numeric ones; fit_features makes it."""
+
+    def __init__(self, plan):
+        self.plan = plan
+        self.inputs = [a for a, col, codes, mu, sd in plan]
+        self.width = max([col + len(codes or [0])
+                          for a, col, codes, mu, sd in plan] or [0])
+
+    def encode(self, examples):
+        "The (n, width) array of the inputs of examples."
+        X = np.zeros((len(examples), self.width))
+        for a, col, codes, mu, sd in self.plan:
+            if codes is None:
+                X[:, col] = [(e[a] - mu) / sd for e in examples]
+            else:
+                for i, e in enumerate(examples):
+                    c = codes.get(e[a])
+                    if c is not None:
+                        X[i, c] = 1.
+        return X
+
+    def encode_into(self, example, x):
+        "Write the inputs of one example into the array x, allocating nothing."
+        x.fill(0.)
+        for a, col, codes, mu, sd in self.plan:
+            if codes is None:
+                x[col] = (example[a] - mu) / sd
+            else:
+                c = codes.get(example[a])
+                if c is not None:
+                    x[c] = 1.
+
+def fit_features(dataset, examples=None):
+    """Return the FeatureEncoder for the inputs of the dataset's examples,
+    or of the given ones.
+    >>> enc = fit_features(DataSet(examples=[[1, 'a', 0], [3, 'b', 1]]))
+    >>> enc.encode([[2, 'b', None], [5, 'c', None]])
+    array([[0., 0., 1.],
+           [3., 0., 0.]])
+    """
+    if examples is None:
+        examples = dataset.examples
+    plan, width = [], 0
+    for a in dataset.inputs:
+        column = [e[a] for e in examples]
+        if all(isnumber(v) for v in column):
+            column = np.array(column, dtype=float)
+            mu, sd = (column.mean(), column.std()) if len(column) else (0, 1)
+            plan.append((a, width, None, mu, sd if sd > 0 else 1.))
+            width += 1
+        else:
+            values = sorted(unique(column))
+            plan.append((a, width, dict((v, width + i)
+                                        for i, v in enumerate(values)), 0., 1.))
+            width += len(values)
+    return FeatureEncoder(plan)
 
-   def __init__(self, sizes):
-      self.activations = map(lambda n: [0.0 for i in range(n)], sizes)
-      self.weights = []
+class NeuralNetLearner(Learner):
+    """Layered feed-forward network. [Section 20.5] sizes are the numbers
+    of units of the hidden layers; inputs are encoded by a FeatureEncoder
+    and there is one output unit per target class. Hidden units compute
+    tanh of their weighted inputs, and the outputs are turned into class
+    probabilities by softmax. Training is minibatch gradient descent with
+    momentum on the cross-entropy of those probabilities, every batch one
+    matrix product per layer forward and two back.
+    Predicting one example writes into arrays allocated when training, so
+    it can be done every cycle of a game without allocating arrays.
+    >>> random.seed(0)
+    >>> xor = ContinuousXor(400)
+    >>> net = NeuralNetLearner([8], epochs=300)
+    >>> net.train(xor)
+    >>> test(net, xor) > .9
+    True
+    >>> net.predict([.5, 1.5, None]), net.predict([1.5, 1.5, None])
+    (True, False)
+    """
 
-   def train(self, dataset):
-      NotImplemented
+    def __init__(self, sizes=[10], epochs=100, batch_size=32,
+                 learning_rate=.1, momentum=.9, seed=0):
+        update(self, sizes=list(sizes), epochs=epochs, batch_size=batch_size,
+               learning_rate=learning_rate, momentum=momentum, seed=seed)
 
-   def predict(self, example):
-      NotImplemented
+    def train(self, dataset):
+        self.dataset = dataset
+        examples = dataset.examples
+        self.encoder = fit_features(dataset)
+        self.classes = sorted(unique(e[dataset.target] for e in examples))
+        X = self.encoder.encode(examples)
+        Y = np.zeros((len(examples), len(self.classes)))
+        index = dict((c, i) for i, c in enumerate(self.classes))
+        Y[np.arange(len(examples)),
+          [index[e[dataset.target]] for e in examples]] = 1.
+        rng = np.random.RandomState(self.seed)
+        sizes = [X.shape[1]] + self.sizes + [len(self.classes)]
+        self.weights = [rng.normal(0, 1. / np.sqrt(n), (n, m))
+                        for n, m in zip(sizes[:-1], sizes[1:])]
+        self.biases = [np.zeros(m) for m in sizes[1:]]
+        self.fit(X, Y, rng)
+        self.buffers()
+
+    def fit(self, X, Y, rng):
+        "Run the given number of epochs of minibatch gradient descent."
+        params = self.weights + self.biases
+        velocity = [np.zeros_like(p) for p in params]
+        for epoch in range(self.epochs):
+            order = rng.permutation(len(X))
+            for i in range(0, len(X), self.batch_size):
+                batch = order[i:i + self.batch_size]
+                grads = self.gradients(X[batch], Y[batch])
+                for p, v, g in zip(params, velocity, grads):
+                    v *= self.momentum
+                    v -= self.learning_rate * g
+                    p += v
+
+    def forward(self, X):
+        "Return the activations of every layer for a batch of inputs."
+        activations = [X]
+        for W, b in zip(self.weights[:-1], self.biases[:-1]):
+            activations.append(np.tanh(np.dot(activations[-1], W) + b))
+        z = np.dot(activations[-1], self.weights[-1]) + self.biases[-1]
+        z = np.exp(z - z.max(axis=1)[:, np.newaxis])
+        activations.append(z / z.sum(axis=1)[:, np.newaxis])
+        return activations
+
+    def gradients(self, X, Y):
+        """Back-propagate the cross-entropy of a batch. [Fig. 20.25] Return
+        the gradients of the weights then the biases, layer by layer."""
+        activations = self.forward(X)
+        delta = (activations[-1] - Y) / len(X)
+        gW, gb = [], []
+        for l in range(len(self.weights) - 1, -1, -1):
+            gW.insert(0, np.dot(activations[l].T, delta))
+            gb.insert(0, delta.sum(axis=0))
+            if l > 0:
+                delta = np.dot(delta, self.weights[l].T) * (
+                    1 - activations[l] ** 2)
+        return gW + gb
+
+    def buffers(self):
+        "Allocate the arrays that predicting one example works in."
+        self.x = np.zeros(self.encoder.width)
+        self.units = [np.zeros(len(b)) for b in self.biases]
+
+    def scores(self, example):
+        """Return the output units' weighted inputs for one example, one per
+        class, higher for likelier ones. The array is reused by the next
+        call."""
+        self.encoder.encode_into(example, self.x)
+        h = self.x
+        last = len(self.weights) - 1
+        for l, (W, b, out) in enumerate(zip(self.weights, self.biases,
+                                            self.units)):
+            np.dot(h, W, out=out)
+            out += b
+            if l < last:
+                np.tanh(out, out=out)
+            h = out
+        return h
 
-class NNUnit:
-   """Unit of a neural net."""
-   def __init__(self): 
-       NotImplemented
+    def predict(self, example):
+        return self.classes[self.scores(example).argmax()]
+
+    def predict_batch(self, examples):
+        "Predict the target of each of a list of examples."
+        P = self.forward(self.encoder.encode(examples))[-1]
+        return [self.classes[i] for i in P.argmax(axis=1)]
+
+    def save(self, path):
+        """Save the trained network to a numpy .npz file. The classes and
+        the encoder's values are kept as JSON, so must be JSON values."""
+        encoder = [(a, col, codes and sorted(codes.items(),
+                                             key=lambda (v, c): c), mu, sd)
+                   for a, col, codes, mu, sd in self.encoder.plan]
+        arrays = dict(('W%d' % i, W) for i, W in enumerate(self.weights))
+        arrays.update(('b%d' % i, b) for i, b in enumerate(self.biases))
+        np.savez(path, layers=len(self.weights),
+                 meta=json.dumps({'classes': self.classes, 'sizes': self.sizes,
+                                  'encoder': encoder}), **arrays)
+
+    @classmethod
+    def load(cls, path):
+        "Read back a network written by save, ready to predict."
+        data = np.load(path)
+        meta = json.loads(str(data['meta']))
+        net = cls(meta['sizes'])
+        net.classes = meta['classes']
+        net.weights = [data['W%d' % i] for i in range(int(data['layers']))]
+        net.biases = [data['b%d' % i] for i in range(int(data['layers']))]
+        plan = [(a, col, codes and dict(map(tuple, codes)), mu, sd)
+                for a, col, codes, mu, sd in meta['encoder']]
+        net.encoder = FeatureEncoder(plan)
+        net.buffers()
+        return net
 
 class PerceptronLearner(NeuralNetLearner):
+    """A network with no hidden layer: one unit per class, each a weighted
+    sum of the inputs, trained together by softmax regression. It can only
+    tell apart classes that are linearly separable. [Section 20.5]
+    >>> random.seed(0)
+    >>> maj = Majority(5, 200)
+    >>> p = PerceptronLearner(epochs=50)
+    >>> p.train(maj)
+    >>> test(p, maj)
+    1.0
+    """
+
+    def __init__(self, epochs=100, batch_size=32, learning_rate=.1,
+                 momentum=.9, seed=0):
+        NeuralNetLearner.__init__(self, [], epochs, batch_size, learning_rate,
+                                  momentum, seed)
 
-   def predict(self, example):
-      return sum([])
 #______________________________________________________________________________
 
 class Linearlearner(Learner):
-   """Fit a linear model to the data."""
+    """Fit a linear model to the data: the least-squares weights of the
+    inputs, encoded by a FeatureEncoder, for a numeric target.
+    >>> ds = DataSet(examples=[[x, 'ab'[x % 2], 3 * x + 2 * (x % 2) + 1]
+    ...                        for x in range(10)])
+    >>> lin = Linearlearner(); lin.train(ds)
+    >>> round(lin.predict([20, 'b', None]), 6)
+    63.0
+    """
 
-   NotImplemented
+    def train(self, dataset):
+        self.dataset = dataset
+        self.encoder = fit_features(dataset)
+        X = self.encoder.encode(dataset.examples)
+        X = np.hstack([X, np.ones((len(X), 1))])
+        y = np.array([e[dataset.target] for e in dataset.examples], float)
+        self.w = np.linalg.lstsq(X, y, rcond=None)[0]
+        self.x = np.zeros(self.encoder.width)
+
+    def predict(self, example):
+        self.encoder.encode_into(example, self.x)
+        return float(np.dot(self.x, self.w[:-1]) + self.w[-1])
 #______________________________________________________________________________
 
 class EnsembleLearner(Learner):
@@ -440,75 +1375,194 @@ def test(learner, dataset, examples=None, verbose=0):
                output, desired, example)
     return right / len(examples)
 
+class ExampleView:
+    """The examples of a sequence at the given indices, in that order, as
+    a read-only sequence that copies none of them."""
+
+    def __init__(self, examples, indices):
+        self.examples = examples
+        self.indices = np.asarray(indices, dtype=np.intp)
+
+    def __len__(self):
+        return len(self.indices)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return ExampleView(self.examples, self.indices[i])
+        return self.examples[self.indices[i]]
+
+    def __iter__(self):
+        examples = self.examples
+        for i in self.indices:
+            yield examples[i]
+
+    def column(self, a):
+        "The values of attribute a at the indices, as an array."
+        if hasattr(self.examples, 'column'):
+            return self.examples.column(a)[self.indices]
+        return np.array([e[a] for e in self])
+
+    def __repr__(self):
+        return '<ExampleView: %d of %d examples>' % (len(self),
+                                                    len(self.examples))
+
+def subset(dataset, indices):
+    """Return a DataSet like the given one, but whose examples are only
+    those at the given indices. Nothing is copied, and the dataset is left
+    as it was.
+    >>> ds = DataSet(examples=[[i, i % 2] for i in range(10)])
+    >>> s = subset(ds, [7, 2]); [e for e in s.examples], s.target
+    ([[7, 1], [2, 0]], 1)
+    """
+    view = copy.copy(dataset)
+    view.examples = ExampleView(dataset.examples, indices)
+    return view
+
 def train_and_test(learner, dataset, start, end):
     """Reserve dataset.examples[start:end] for test; train on the remainder.
     Return the proportion of examples correct on the test examples."""
-    examples = dataset.examples
+    n = len(dataset.examples)
+    return score_split(learner, dataset, (
+        range(0, start) + range(end, n), range(start, end)))
+
+def score_split(learner, dataset, split):
+    """Train the learner on the examples at the first indices of split, and
+    return the proportion of those at the second that it gets right."""
+    train, held_out = split
+    learner.train(subset(dataset, train))
+    return test(learner, dataset, ExampleView(dataset.examples, held_out))
+
+def kfold_splits(n, k, seed):
+    """Shuffle range(n) by the seed and cut it into k folds; return the
+    (train, test) indices of holding out each fold in turn.
+    >>> [map(list, s) for s in kfold_splits(5, 2, seed=0)]
+    [[[3, 4], [2, 0, 1]], [[2, 0, 1], [3, 4]]]
+    """
+    folds = np.array_split(np.random.RandomState(seed).permutation(n), k)
+    return [(np.concatenate(folds[:i] + folds[i+1:]), folds[i])
+            for i in range(k)]
+
+# What score_splits hands to the processes of a pool it makes: they are
+# forked with it, so the dataset is never copied into them.
+_evaluation = None
+
+def _score_shared(split):
+    learner, dataset = _evaluation
+    return score_split(learner, dataset, split)
+
+def _score_task(task):
+    # a pool of threads would otherwise train one learner on several splits
+    learner, dataset, split = task
+    return score_split(copy.copy(learner), dataset, split)
+
+def score_splits(learner, dataset, splits, processes=None, pool=None):
+    """Return score_split of every (train, test) split of the dataset. With
+    processes=1 they are scored here, one after another. Otherwise they are
+    spread over a pool: the given one, which is sent the learner and dataset
+    with every split, or else a new one of that many processes (by default
+    one per CPU), which starts out with them."""
+    global _evaluation
+    if processes == 1 and pool is None:
+        return [score_split(learner, dataset, s) for s in splits]
+    if pool is not None:
+        return pool.map(_score_task, [(learner, dataset, s) for s in splits])
+    _evaluation = (learner, dataset)
+    pool = multiprocessing.Pool(processes)
     try:
-        dataset.examples = examples[:start] + examples[end:]
-        learner.dataset = dataset 
-        learner.train(dataset)
-        return test(learner, dataset, examples[start:end])
+        return pool.map(_score_shared, splits)
     finally:
-        dataset.examples = examples
+        pool.close()
+        pool.join()
+        _evaluation = None
 
-def cross_validation(learner, dataset, k=10, trials=1):
+def cross_validation(learner, dataset, k=10, trials=1, seed=None,
+                     processes=None, pool=None):
     """Do k-fold cross_validate and return their mean.
     That is, keep out 1/k of the examples for testing on each of k runs.
-    Shuffle the examples first; If trials>1, average over several shuffles."""
+    Shuffle the examples first; If trials>1, average over several shuffles.
+    The shuffles are drawn from the seed, by default a random one, so the
+    same seed gives the same folds. All folds of all trials are scored at
+    once by score_splits, and the dataset is not changed.
+    >>> ds = Parity(2, 100)
+    >>> cross_validation(ArrayDecisionTreeLearner(), ds, k=5, trials=2,
+    ...                  seed=1, processes=2)
+    1.0
+    """
+    n = len(dataset.examples)
     if k == None:
-        k = len(dataset.examples)
-    if trials > 1:
-        return mean([cross_validation(learner, dataset, k, trials=1)
-                     for t in range(trials)])
-    else:
-        n = len(dataset.examples)
-        random.shuffle(dataset.examples)
-        return mean([train_and_test(learner, dataset, i*(n/k), (i+1)*(n/k))
-                     for i in range(k)])
-    
-def leave1out(learner, dataset):
+        k = n
+    if seed is None:
+        seed = random.randrange(2**31)
+    splits = []
+    for t in range(trials):
+        splits += kfold_splits(n, k, seed + t)
+    return mean(score_splits(learner, dataset, splits, processes, pool))
+
+def leave1out(learner, dataset, processes=None, pool=None):
     "Leave one out cross-validation over the dataset."
-    return cross_validation(learner, dataset, k=len(dataset.examples))
-
-def learningcurve(learner, dataset, trials=10, sizes=None):
+    return cross_validation(learner, dataset, k=len(dataset.examples),
+                            processes=processes, pool=pool)
+
+def learningcurve(learner, dataset, trials=10, sizes=None, seed=None,
+                  processes=None, pool=None):
+    """Return (size, score) pairs of the learner trained on that many random
+    examples and tested on the rest, averaged over trials. All trials of all
+    sizes are scored at once by score_splits."""
+    n = len(dataset.examples)
     if sizes == None:
-        sizes = range(2, len(dataset.examples)-10, 2)
-    def score(learner, size):
-        random.shuffle(dataset.examples)
-        return train_and_test(learner, dataset, 0, size)
-    return [(size, mean([score(learner, size) for t in range(trials)]))
-            for size in sizes]
+        sizes = range(2, n-10, 2)
+    if seed is None:
+        seed = random.randrange(2**31)
+    splits = []
+    for size in sizes:
+        for t in range(trials):
+            order = np.random.RandomState(seed + t).permutation(n)
+            splits.append((order[:size], order[size:]))
+    scores = score_splits(learner, dataset, splits, processes, pool)
+    return [(size, mean(scores[i*trials:(i+1)*trials]))
+            for i, size in enumerate(sizes)]
 
 #______________________________________________________________________________
 # The rest of this file gives Data sets for machine learning problems.
 
-orings = DataSet(name='orings', target='Distressed',
+def DataFileSet(make=None, **kwds):
+    """Build a DataSet read from the AIMA data directory, with make (by
+    default DataSet) and the given fields, or return None if its file is not
+    there. The data directory does not come with every copy of this code."""
+    try:
+        return (make or DataSet)(**kwds)
+    except IOError:
+        return None
+
+orings = DataFileSet(name='orings', target='Distressed',
                  attrnames="Rings Distressed Temp Pressure Flightnum")
 
 
-zoo = DataSet(name='zoo', target='type', exclude=['name'],
+zoo = DataFileSet(name='zoo', target='type', exclude=['name'],
               attrnames="name hair feathers eggs milk airborne aquatic " +
               "predator toothed backbone breathes venomous fins legs tail " +
               "domestic catsize type") 
 
 
-iris = DataSet(name="iris", target="class",
+iris = DataFileSet(name="iris", target="class",
                attrnames="sepal-len sepal-width petal-len petal-width class")
 
 #______________________________________________________________________________
 # The Restaurant example from Fig. 18.2
 
+restaurant_attrnames = ('Alternate Bar Fri/Sat Hungry Patrons Price '
+                        + 'Raining Reservation Type WaitEstimate Wait')
+
 def RestaurantDataSet(examples=None):
     "Build a DataSet of Restaurant waiting examples."
     return DataSet(name='restaurant', target='Wait', examples=examples,
-                  attrnames='Alternate Bar Fri/Sat Hungry Patrons Price '
-                   + 'Raining Reservation Type WaitEstimate Wait')
+                   attrnames=restaurant_attrnames)
 
-restaurant = RestaurantDataSet()
+restaurant = DataFileSet(RestaurantDataSet)
 
 def T(attrname, branches):
-    return DecisionTree(restaurant.attrnum(attrname), attrname, branches)
+    return DecisionTree(restaurant_attrnames.split().index(attrname),
+                        attrname, branches)
 
 Fig[18,2] = T('Patrons',
              {'None': 'No', 'Some': 'Yes', 'Full':
@@ -574,13 +1628,18 @@ def ContinuousXor(n):
 
 def compare(algorithms=[MajorityLearner, NaiveBayesLearner, 
                         NearestNeighborLearner, DecisionTreeLearner],
-            datasets=[iris, orings, zoo, restaurant, SyntheticRestaurant(20),
-                      Majority(7, 100), Parity(7, 100), Xor(100)],
-            k=10, trials=1):
+            datasets=None, k=10, trials=1):
     """Compare various learners on various datasets using cross-validation.
-    Print results as a table."""
+    Print results as a table. By default, the datasets are the ones above,
+    leaving out any whose file is missing."""
+    if datasets is None:
+        datasets = [d for d in [iris, orings, zoo, restaurant] if d]
+        if restaurant:
+            datasets.append(SyntheticRestaurant(20))
+        datasets += [Majority(7, 100), Parity(7, 100), Xor(100),
+                     ContinuousXor(100)]
     print_table([[a.__name__.replace('Learner','')] +
                  [cross_validation(a(), d, k, trials) for d in datasets]
                  for a in algorithms],
-                header=[''] + [d.name[0:7] for d in datasets], round=2)
+                header=[''] + [d.name[0:7] for d in datasets], numfmt='%.2f')
     
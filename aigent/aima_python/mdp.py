@@ -4,9 +4,15 @@ First we define an MDP, and the special case of a GridMDP, in which
 states are laid out in a 2-dimensional grid.  We also represent a policy
 as a dictionary of {state:action} pairs, and a Utility function as a
 dictionary of {state:number} pairs.  We then define the value_iteration 
-and policy_iteration algorithms."""
+and policy_iteration algorithms.
+
+For MDPs with many thousands of states, ArrayMDP holds the same model in
+numpy arrays, and array_value_iteration and array_policy_iteration solve it
+with whole-array Bellman backups instead of a loop over states."""
 
 from utils import *
+import math
+import numpy as np
 
 class MDP:
     """A Markov Decision Process, defined by an initial state, transition model,
@@ -136,7 +142,181 @@ def policy_evaluation(pi, U, mdp, k=20):
     R, T, gamma = mdp.R, mdp.T, mdp.gamma
     for i in range(k):
         for s in mdp.states:
-            U[s] = R(s) + gamma * sum([p * U[s] for (p, s1) in T(s, pi[s])])
+            U[s] = R(s) + gamma * sum([p * U[s1] for (p, s1) in T(s, pi[s])])
+    return U
+
+#______________________________________________________________________________
+# Array-backed MDPs
+
+class ArrayMDP:
+    """An MDP held in numpy arrays. States are numbered 0..n-1, in the order of
+    the states list, and actions 0..m-1, in the order of actlist. Transitions
+    are sparse, with at most K outcomes per state and action: doing action a
+    in state s leads to state succ[a, k, s] with probability prob[a, k, s].
+    allowed[a, s] says whether action a can be done in state s at all. In
+    terminal states no action can be done, and their utility is their reward.
+    reward is an array of n rewards."""
+
+    def __init__(self, states, actlist, succ, prob, reward, terminals=(),
+                 allowed=None, gamma=.9):
+        n, m = len(states), len(actlist)
+        if allowed is None:
+            allowed = np.ones((m, n), dtype=bool)
+        update(self, states=list(states), actlist=list(actlist),
+               succ=np.asarray(succ, dtype=np.intp),
+               prob=np.asarray(prob, dtype=float),
+               reward=np.asarray(reward, dtype=float),
+               allowed=np.asarray(allowed, dtype=bool), gamma=gamma)
+        self.index = dict((s, i) for i, s in enumerate(self.states))
+        self.terminal = np.zeros(n, dtype=bool)
+        self.terminal[[self.index[s] for s in terminals]] = True
+        self.allowed[:, self.terminal] = False
+
+    def Q(self, U):
+        """The (m, n) array of the expected utility of the outcome of every
+        action in every state, -infinity for actions that can't be done."""
+        Q = (self.prob * U[self.succ]).sum(axis=1)
+        Q[~self.allowed] = -infinity
+        return Q
+
+    def backup(self, Q):
+        "The utilities of one Bellman backup, given Q."
+        U = self.reward.copy()
+        live = ~self.terminal
+        U[live] += self.gamma * Q[:, live].max(axis=0)
+        return U
+
+    def to_dict(self, values):
+        """Convert an array of utilities, or of action numbers as returned by
+        array_best_policy, to a {state: value} or {state: action} dict."""
+        values = np.asarray(values)
+        if values.dtype.kind == 'i':
+            return dict((s, if_(a < 0, None, lambda: self.actlist[a]))
+                        for s, a in zip(self.states, values))
+        return dict(zip(self.states, values.tolist()))
+
+def array_mdp(mdp):
+    """Convert any MDP to an ArrayMDP, by asking it for every transition.
+    >>> m = array_mdp(Fig[17,1])
+    >>> U = m.to_dict(array_value_iteration(m, .01))
+    >>> V = value_iteration(Fig[17,1], .01)
+    >>> max([abs(U[s] - V[s]) for s in V]) < .01
+    True
+    """
+    states = list(mdp.states)
+    actlist = [a for a in mdp.actlist]
+    index = dict((s, i) for i, s in enumerate(states))
+    n, m = len(states), len(actlist)
+    K = max([len(mdp.T(s, a)) for s in states for a in mdp.actions(s)
+             if a is not None] or [1])
+    succ = np.tile(np.arange(n), (m, K, 1))
+    prob = np.zeros((m, K, n))
+    allowed = np.zeros((m, n), dtype=bool)
+    for i, s in enumerate(states):
+        for a in mdp.actions(s):
+            if a is None:
+                continue
+            j = actlist.index(a)
+            allowed[j, i] = True
+            for k, (p, s1) in enumerate(mdp.T(s, a)):
+                succ[j, k, i] = index[s1]
+                prob[j, k, i] = p
+    return ArrayMDP(states, actlist, succ, prob, [mdp.R(s) for s in states],
+                    mdp.terminals, allowed, mdp.gamma)
+
+class ArrayGridMDP(ArrayMDP):
+    """A grid MDP built straight into arrays, for grids too big to build state
+    by state. rewards is an array indexed by [x, y], with NaN for obstacles.
+    An action is an (x, y) step, which may be diagonal, or (0, 0) to stay put.
+    Actions that move go in their direction rotated by turns[k] degrees, with
+    probability probs[k]; by default that's 0.8 straight on, and 0.1 each
+    to the right and to the left, as in GridMDP. Steps off the grid or into
+    an obstacle leave the state unchanged.
+    >>> grid = ArrayGridMDP([[-0.04, -0.04, -0.04], [-0.04, float('nan'), -0.04],
+    ...                      [-0.04, -0.04, -0.04], [-0.04, -1, +1]],
+    ...                     terminals=[(3, 2), (3, 1)])
+    >>> pi, U = array_policy_iteration(grid)
+    >>> grid.to_dict(pi) == policy_iteration(Fig[17,1])
+    True
+    """
+
+    def __init__(self, rewards, terminals=(), actlist=orientations, gamma=.9,
+                 probs=(0.8, 0.1, 0.1), turns=(0, -90, 90)):
+        rewards = np.asarray(rewards, dtype=float)
+        cols, rows = rewards.shape
+        open_ = ~np.isnan(rewards)
+        xs, ys = np.nonzero(open_)
+        states = zip(xs.tolist(), ys.tolist())
+        number = np.full(rewards.shape, -1, dtype=np.intp)
+        number[xs, ys] = np.arange(len(states))
+        m, K = len(actlist), len(probs)
+        succ = np.empty((m, K, len(states)), dtype=np.intp)
+        prob = np.empty((m, K, len(states)))
+        for j, a in enumerate(actlist):
+            for k, (p, turn) in enumerate(zip(probs, turns)):
+                angle = math.radians(turn)
+                dx = int(round(a[0] * math.cos(angle) - a[1] * math.sin(angle)))
+                dy = int(round(a[0] * math.sin(angle) + a[1] * math.cos(angle)))
+                x1 = xs + dx; y1 = ys + dy
+                ok = (x1 >= 0) & (x1 < cols) & (y1 >= 0) & (y1 < rows)
+                ok[ok] = open_[x1[ok], y1[ok]]
+                succ[j, k] = np.where(ok, number[np.where(ok, x1, 0),
+                                                 np.where(ok, y1, 0)],
+                                      np.arange(len(states)))
+                prob[j, k] = p
+        ArrayMDP.__init__(self, states, actlist, succ, prob, rewards[xs, ys],
+                          terminals, None, gamma)
+        update(self, cols=cols, rows=rows, number=number)
+
+    def to_grid(self, values, fill=np.nan):
+        "Lay an array of per-state values out as a [x, y] array."
+        values = np.asarray(values)
+        grid = np.full((self.cols, self.rows), fill, dtype=values.dtype)
+        open_ = self.number >= 0
+        grid[open_] = values[self.number[open_]]
+        return grid
+
+def array_value_iteration(mdp, epsilon=0.001):
+    """Solve an ArrayMDP by value iteration, backing up all states at once.
+    Returns the array of utilities. [Fig. 17.4]"""
+    U = np.zeros(len(mdp.states))
+    while True:
+        U1 = mdp.backup(mdp.Q(U))
+        delta = np.abs(U1 - U).max()
+        U = U1
+        if delta < epsilon * (1 - mdp.gamma) / mdp.gamma:
+            return U
+
+def array_best_policy(mdp, U):
+    """Given an ArrayMDP and an array of utilities, return the best action
+    number in every state, -1 in terminal states. (Equation 17.4)"""
+    return np.where(mdp.terminal, -1, mdp.Q(U).argmax(axis=0))
+
+def array_policy_iteration(mdp, k=20, U=None):
+    """Solve an ArrayMDP by modified policy iteration: evaluate the policy
+    approximately with k backups, then improve it, until it stops changing.
+    Returns (policy, utilities) arrays. [Fig. 17.7]"""
+    if U is None:
+        U = np.zeros(len(mdp.states))
+    pi = array_best_policy(mdp, U)
+    while True:
+        U = array_policy_evaluation(pi, U, mdp, k)
+        pi1 = array_best_policy(mdp, U)
+        if (pi1 == pi).all():
+            return pi, U
+        pi = pi1
+
+def array_policy_evaluation(pi, U, mdp, k=20):
+    """Return the utilities after k backups of U under the policy pi, an array
+    of action numbers."""
+    live = np.nonzero(~mdp.terminal)[0]
+    succ = mdp.succ[pi[live], :, live]
+    prob = mdp.prob[pi[live], :, live]
+    U = np.array(U, dtype=float)
+    for i in range(k):
+        U1 = mdp.reward.copy()
+        U1[live] += mdp.gamma * (prob * U[succ]).sum(axis=1)
+        U = U1
     return U
 
 
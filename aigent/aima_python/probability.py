@@ -4,7 +4,8 @@
 from utils import *
 from logic import extend
 import agents
-import bisect, random
+import bisect, random, itertools, math, time
+import numpy as np
 
 #______________________________________________________________________________
 
@@ -110,22 +111,61 @@ def enumerate_joint(vars, values, P):
 #______________________________________________________________________________
 
 class BayesNet:
+    """A Bayes net of Boolean variables, given as BayesNodes, each added
+    after its parents."""
+
     def __init__(self, nodes=[]):
-        update(self, nodes=[], vars=[])
+        update(self, nodes=[], vars=[], evidence={}, plans={})
         for node in nodes:
             self.add(node)
 
     def add(self, node):
         self.nodes.append(node)
         self.vars.append(node.variable)
+        self.plans.clear()
 
     def observe(self, var, val):
         self.evidence[var] = val
 
+    def variable_node(self, var):
+        return self.nodes[self.vars.index(var)]
+
 class BayesNode:
+    """A Boolean variable of a BayesNet, with its parents and its
+    conditional probability table. The cpt gives P(variable=True): a number
+    with no parents, otherwise a dict keyed by the parents' values, a tuple
+    of them, or the value itself with one parent. It is also kept as an
+    array, see cpt_table."""
+
     def __init__(self, variable, parents, cpt):
         if isinstance(parents, str): parents = parents.split()
-        update(self, variable=variable, parents=parents, cpt=cpt)
+        update(self, variable=variable, parents=parents, cpt=cpt,
+               table=cpt_table(len(parents), cpt))
+
+    def p(self, value, event):
+        "P(variable=value | the parents' values in event)."
+        index = tuple(int(event[v]) for v in self.parents) + (int(value),)
+        return self.table[index]
+
+def cpt_table(k, cpt):
+    """The array of P(variable | parents) of a variable with k parents, with
+    an axis per parent and then one for the variable, each indexed by False
+    (0) and True (1).
+    >>> cpt_table(1, {T: .9, F: .05})[1]
+    array([0.1, 0.9])
+    """
+    table = np.empty((2,) * (k + 1))
+    for values in itertools.product((F, T), repeat=k):
+        if k == 0:
+            p = cpt
+        elif values in cpt:
+            p = cpt[values]
+        else:
+            p = cpt[values[0]]
+        index = tuple(map(int, values))
+        table[index + (1,)] = p
+        table[index + (0,)] = 1. - p
+    return table
 
 node = BayesNode
 
@@ -145,27 +185,339 @@ burglary = BayesNet([
   ])
 #______________________________________________________________________________
 
-def elimination_ask(X, e, bn):
-    "[Fig. 14.10]"
-    factors = []
-    for var in reverse(bn.vars):
-        factors.append(Factor(var, e)) 
-        if is_hidden(var, X, e):
-            factors = sum_out(var, factors)
+class Factor:
+    """A function of some Boolean variables, as an array with an axis per
+    variable indexed by False (0) and True (1).
+    >>> f = Factor(['A'], [.4, .6]).pointwise_product(Factor(['B', 'A'],
+    ...                                                      [[1, 2], [3, 4]]))
+    >>> f.variables, f.values.tolist()
+    (['A', 'B'], [[0.4, 1.2000000000000002], [1.2, 2.4]])
+    >>> f.sum_out('A').values.tolist()
+    [1.6, 3.6]
+    """
+
+    def __init__(self, variables, values):
+        update(self, variables=list(variables),
+               values=np.asarray(values, dtype=float))
+
+    def pointwise_product(self, other):
+        "The product of two factors, over the variables of both."
+        variables = self.variables + [v for v in other.variables
+                                      if v not in self.variables]
+        return Factor(variables,
+                      self.expand(variables) * other.expand(variables))
+
+    def expand(self, variables):
+        """Our values with their axes in the order of the given variables, a
+        superset of ours, and of size 1 along the variables not ours, ready
+        to broadcast against a factor over all of them."""
+        order = sorted(range(len(self.variables)),
+                       key=lambda i: variables.index(self.variables[i]))
+        return self.values.transpose(order).reshape(
+            [2 if v in self.variables else 1 for v in variables])
+
+    def sum_out(self, var):
+        "Sum var out of the factor."
+        i = self.variables.index(var)
+        return Factor(self.variables[:i] + self.variables[i + 1:],
+                      self.values.sum(axis=i))
+
+    def normalize(self):
+        "Return the ProbDist of the factor's one variable."
+        assert len(self.variables) == 1
+        dist = ProbDist(self.variables[0])
+        total = self.values.sum()
+        for val in (F, T):
+            dist[val] = self.values[int(val)] / total
+        return dist
+
+def elimination_ask(X, e, bn, order=None):
+    """Return P(X|e) in the BayesNet bn, by variable elimination. Only the
+    ancestors of X and e are relevant, the other variables sum to 1. The
+    hidden ones are summed out in the given order, by default that of
+    min_fill_order. [Fig. 14.11]
+    >>> p = elimination_ask('Burglary', dict(JohnCalls=T, MaryCalls=T),
+    ...                     burglary)
+    >>> round(p[T], 4), round(p[F], 4)
+    (0.2842, 0.7158)
+    """
+    relevant, plan = elimination_plan(X, e, bn)
+    factors = [make_factor(var, e, bn) for var in relevant]
+    for var in order or plan:
+        factors = sum_out(var, factors)
     return pointwise_product(factors).normalize()
 
+def elimination_plan(X, e, bn):
+    """The relevant variables of a query of X given evidence on the
+    variables of e, and the min_fill_order of the hidden ones. A plan only
+    depends on which variables are observed, not their values, so bn keeps
+    it for the next query like it."""
+    key = (X, tuple(sorted(e)))
+    if key not in bn.plans:
+        relevant = ancestors(bn, [X] + e.keys())
+        relevant = [var for var in bn.vars if var in relevant]
+        hidden = [var for var in relevant if var != X and var not in e]
+        scopes = [[v for v in bn.variable_node(var).parents + [var]
+                   if v not in e] for var in relevant]
+        bn.plans[key] = relevant, min_fill_order(hidden, scopes)
+    return bn.plans[key]
+
+def ancestors(bn, variables):
+    "The set of the given variables and all their ancestors in bn."
+    result, agenda = set(), list(variables)
+    while agenda:
+        var = agenda.pop()
+        if var not in result:
+            result.add(var)
+            agenda.extend(bn.variable_node(var).parents)
+    return result
+
+def make_factor(var, e, bn):
+    """The factor of var's node in bn given the evidence e: its CPT, over
+    var and its parents, less the variables fixed by e."""
+    node = bn.variable_node(var)
+    variables = node.parents + [var]
+    index = tuple(int(e[v]) if v in e else slice(None) for v in variables)
+    return Factor([v for v in variables if v not in e], node.table[index])
+
 def pointwise_product(factors):
-    pass
+    return reduce(Factor.pointwise_product, factors)
 
 def sum_out(var, factors):
-    pass
+    "Eliminate var from the factors, replacing those over it by their sum."
+    result, var_factors = [], []
+    for f in factors:
+        (var_factors if var in f.variables else result).append(f)
+    result.append(pointwise_product(var_factors).sum_out(var))
+    return result
+
+def min_fill_order(variables, scopes):
+    """An order to eliminate the variables in, chosen greedily: every time,
+    the one whose elimination adds the fewest edges between its neighbors,
+    where variables are neighbors if they share one of the scopes, the
+    lists of variables of the factors. Ties go to the one with the fewest
+    neighbors, then to the first given.
+    >>> min_fill_order(['A', 'B', 'C'], ['AB', 'BC', 'AD'])
+    ['C', 'B', 'A']
+    """
+    neighbors = {}
+    for scope in scopes:
+        for v in scope:
+            neighbors.setdefault(v, set()).update(scope)
+    for v in neighbors:
+        neighbors[v].discard(v)
+    rank = dict((v, i) for i, v in enumerate(variables))
+
+    def cost(v):
+        ns = list(neighbors[v])
+        fill = sum(1 for i in range(len(ns)) for j in range(i)
+                   if ns[j] not in neighbors[ns[i]])
+        return fill, len(ns), rank[v]
+
+    order, left = [], set(variables)
+    while left:
+        var = min(left, key=cost)
+        order.append(var)
+        left.remove(var)
+        ns = neighbors.pop(var)
+        for v in ns:
+            neighbors[v].discard(var)
+            neighbors[v].update(ns - set([v]))
+    return order
+
+def joint_distribution(bn):
+    """The JointProbDist of all the variables of bn, for enumerate_joint_ask.
+    It has an entry for every assignment of them, so is only for small nets.
+    >>> P = joint_distribution(burglary)
+    >>> p = enumerate_joint_ask('Burglary', dict(JohnCalls=T, MaryCalls=T), P)
+    >>> round(p[T], 4)
+    0.2842
+    """
+    f = pointwise_product([make_factor(var, {}, bn) for var in bn.vars])
+    P = JointProbDist(f.variables)
+    for values in itertools.product((F, T), repeat=len(f.variables)):
+        P[values] = f.values[tuple(map(int, values))]
+    return P
 
 #______________________________________________________________________________
 
 def prior_sample(bn):
-    x = {}
-    for xi in bn.vars:
-        x[xi.var] = xi.sample([x])
-    
+    """Return an event drawn from the prior of bn, a {var: val} dict.
+    [Fig. 14.13]"""
+    return dict((var, bool(values[0]))
+                for var, values in prior_samples(bn, 1).items())
+
+def prior_samples(bn, n, rng=np.random):
+    """Draw n events from the prior of bn at once, as {var: array of n 0s
+    and 1s}. Each variable is drawn for all the events together, given the
+    values drawn for its parents.
+    >>> s = prior_samples(burglary, 100000, np.random.RandomState(0))
+    >>> abs(s['JohnCalls'].mean() - .0521) < .005
+    True
+    """
+    samples = {}
+    for node in bn.nodes:
+        samples[node.variable] = (rng.random_sample(n) <
+                                  true_probs(node, samples)).astype(np.intp)
+    return samples
+
+def true_probs(node, samples):
+    "P(variable=True | parents) of the node, for every event in samples."
+    return node.table[tuple(samples[v] for v in node.parents) + (1,)]
+
+def sample_batches(N, batch, budget=None):
+    """The sizes of batches of N samples in all, cut short once budget
+    seconds have gone by; at least one batch is always drawn."""
+    deadline = budget and time.time() + budget
+    drawn = 0
+    while drawn < N:
+        n = min(batch, N - drawn)
+        yield n
+        drawn += n
+        if deadline and time.time() > deadline:
+            return
+
+def sample_estimate(X, weights, **diagnostics):
+    """The ProbDist of X from the total weights of the samples where X is
+    False and True. Its diagnostics attribute holds the keyword arguments:
+    samples (how many were drawn) and ess (how many independent ones they
+    are worth) at least, and the standard error of P(X=True), stderr,
+    unless it is given."""
+    Q = ProbDist(X)
+    total = float(weights.sum())
+    for val in (F, T):
+        Q[val] = weights[int(val)] / total if total else float('nan')
+    if 'stderr' not in diagnostics:
+        ess = diagnostics['ess']
+        diagnostics['stderr'] = (math.sqrt(Q[T] * Q[F] / ess) if ess
+                                 else float('nan'))
+    Q.diagnostics = diagnostics
+    return Q
+
+def rejection_sampling(X, e, bn, N=10000, budget=None, batch=4096,
+                       rng=np.random):
+    """Estimate P(X|e) from N events drawn from the prior of bn, keeping
+    those that agree with e. Batches of events are drawn at once, until N
+    or budget seconds are up. [Fig. 14.14]
+    >>> p = rejection_sampling('Burglary', dict(Alarm=T), burglary, 200000,
+    ...                        rng=np.random.RandomState(0))
+    >>> abs(p[T] - .3736) < 4 * p.diagnostics['stderr']
+    True
+    """
+    counts, drawn = np.zeros(2), 0
+    for n in sample_batches(N, batch, budget):
+        samples = prior_samples(bn, n, rng)
+        agree = np.ones(n, dtype=bool)
+        for var, val in e.items():
+            agree &= samples[var] == int(val)
+        counts += np.bincount(samples[X][agree], minlength=2)
+        drawn += n
+    return sample_estimate(X, counts, samples=drawn, ess=counts.sum())
+
+def likelihood_weighting(X, e, bn, N=10000, budget=None, batch=4096,
+                         rng=np.random):
+    """Estimate P(X|e) from N events of bn that agree with e, each weighted
+    by the likelihood of the evidence given its parents. Only ancestors of
+    X and e are sampled, and batches of events are drawn at once, until N
+    or budget seconds are up. ess is that of the weights, (sum w)^2 /
+    sum w^2. [Fig. 14.15]
+    >>> p = likelihood_weighting('Burglary', dict(JohnCalls=T, MaryCalls=T),
+    ...                          burglary, 100000, rng=np.random.RandomState(0))
+    >>> abs(p[T] - .2842) < 4 * p.diagnostics['stderr']
+    True
+    """
+    relevant = ancestors(bn, [X] + e.keys())
+    nodes = [node for node in bn.nodes if node.variable in relevant]
+    weights, total, squares, drawn = np.zeros(2), 0., 0., 0
+    for n in sample_batches(N, batch, budget):
+        samples, w = {}, np.ones(n)
+        for node in nodes:
+            var = node.variable
+            if var in e:
+                p = true_probs(node, samples)
+                w *= p if e[var] else 1. - p
+                samples[var] = np.repeat(np.intp(e[var]), n)
+            else:
+                samples[var] = (rng.random_sample(n) <
+                                true_probs(node, samples)).astype(np.intp)
+        weights += np.bincount(samples[X], weights=w, minlength=2)
+        total += w.sum()
+        squares += (w * w).sum()
+        drawn += n
+    return sample_estimate(X, weights, samples=drawn,
+                           ess=total * total / squares if squares else 0.)
+
+def gibbs_ask(X, e, bn, N=10000, chains=100, burn_in=50, budget=None,
+              rng=np.random):
+    """Estimate P(X|e) by Gibbs sampling: a step draws every unobserved
+    variable in turn given its Markov blanket. The given number of chains
+    run side by side as arrays, started from likelihood weighting's
+    events, and are counted after burn_in steps, until N samples in all or
+    budget seconds are up. Only ancestors of X and e are sampled.
+    The diagnostics are the Gelman-Rubin rhat of X across chains, near 1
+    once they have mixed, and the stderr of P(X=True) and ess from the
+    spread of the chains' estimates. [Fig. 14.16]
+    >>> p = gibbs_ask('Burglary', dict(JohnCalls=T, MaryCalls=T), burglary,
+    ...               100000, rng=np.random.RandomState(0))
+    >>> abs(p[T] - .2842) < 4 * p.diagnostics['stderr']
+    True
+    """
+    relevant = ancestors(bn, [X] + e.keys())
+    nodes = [node for node in bn.nodes if node.variable in relevant]
+    hidden = [node for node in nodes if node.variable not in e]
+    children = dict((node.variable, [c for c in nodes
+                                     if node.variable in c.parents])
+                    for node in hidden)
+    values = [np.zeros(chains, dtype=np.intp), np.ones(chains, dtype=np.intp)]
+    state = {}
+    for node in nodes:
+        if node.variable in e:
+            state[node.variable] = values[int(e[node.variable])]
+        else:
+            state[node.variable] = (rng.random_sample(chains) <
+                                    true_probs(node, state)).astype(np.intp)
+    deadline = budget and time.time() + budget
+    counts, steps, step = np.zeros(chains), 0, 0
+    while steps * chains < N:
+        for node in hidden:
+            var, p = node.variable, []
+            parents = tuple(state[v] for v in node.parents)
+            for value in values:
+                state[var] = value
+                q = node.table[parents + (value,)]
+                for c in children[var]:
+                    q = q * c.table[tuple(state[v] for v in c.parents) +
+                                    (state[c.variable],)]
+                p.append(q)
+            state[var] = (rng.random_sample(chains) * (p[0] + p[1]) <
+                          p[1]).astype(np.intp)
+        step += 1
+        if deadline and time.time() > deadline:
+            if steps >= 2:
+                break
+            burn_in = 0
+        if step > burn_in:
+            counts += state[X]
+            steps += 1
+    return sample_estimate(X, np.array([chains * steps - counts.sum(),
+                                        counts.sum()]),
+                           samples=chains * steps, **chain_diagnostics(
+                               counts / steps, steps))
+
+def chain_diagnostics(means, n):
+    """The Gelman-Rubin rhat, stderr and ess of the estimates of P(X=True)
+    made by chains of n samples each, the given means of X in each."""
+    p, m = means.mean(), len(means)
+    within = np.mean(means * (1 - means)) * n / max(n - 1, 1)
+    between = n * means.var(ddof=1) if m > 1 else 0.
+    pooled = (n - 1.) / n * within + between / n
+    if within > 0:
+        rhat = math.sqrt(pooled / within)
+    else:
+        rhat = 1. if between == 0 else float('inf')
+    stderr = means.std(ddof=1) / math.sqrt(m) if m > 1 else float('nan')
+    ess = min(p * (1 - p) / stderr ** 2, m * n) if stderr > 0 else m * n
+    return dict(rhat=rhat, stderr=stderr, ess=ess)
+
 #______________________________________________________________________________        
 
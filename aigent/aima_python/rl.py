@@ -1,8 +1,17 @@
 """Reinforcement Learning (Chapter 21)
-"""
+
+PassiveTDAgent learns the utilities of a fixed policy from its percepts, as
+in the book.  For learning action values from many thousands of transitions,
+the same updates are done on whole batches of numpy arrays: TabularQ holds
+Q(s, a) for numbered states, LinearQ approximates it from tile-coded features
+of continuous states, and ReplayBuffer keeps transitions to learn from in
+fixed-size arrays.  q_learning_targets and sarsa_targets compute the TD
+targets of a batch of transitions at once, and batch_q_learning replays a
+buffer into a Q."""
 
 from utils import *
 import agents
+import numpy as np
 
 class PassiveADPAgent(agents.Agent):
     """Passive (non-learning) agent that uses adaptive dynamic programming
@@ -10,6 +19,370 @@ class PassiveADPAgent(agents.Agent):
     NotImplementedError
 
 class PassiveTDAgent(agents.Agent):
-    """Passive (non-learning) agent that uses temporal differences to learn
-    utility estimates. [Fig. 21.4]"""
-    NotImplementedError
+    """Passive agent that uses temporal differences to learn utility
+    estimates of a fixed policy. [Fig. 21.4] Percepts are (state, reward)
+    pairs, and the learning rate falls with the number of visits to a state.
+    >>> from mdp import Fig
+    >>> north, east = (0, 1), (1, 0)
+    >>> pi = {(0, 0): north, (0, 1): north, (0, 2): east, (1, 2): east,
+    ...       (2, 2): east}
+    >>> agent = PassiveTDAgent(pi, Fig[17,1].terminals, gamma=1)
+    >>> for trial in range(200):
+    ...     for s in [(0, 0), (0, 1), (0, 2), (1, 2), (2, 2), (3, 2)]:
+    ...         a = agent.program((s, Fig[17,1].R(s)))
+    >>> agent.U[(3, 2)], abs(agent.U[(0, 0)] - .8) < .01
+    (1, True)
+    """
+
+    def __init__(self, pi, terminals, gamma=.9, alpha=None):
+        agents.Agent.__init__(self)
+        if alpha is None:
+            alpha = lambda n: 60. / (59 + n)
+        update(self, pi=pi, terminals=terminals, gamma=gamma, alpha=alpha,
+               U={}, Ns={}, s=None, a=None, r=None)
+
+        def program(percept):
+            s1, r1 = percept
+            U, Ns, s, r = self.U, self.Ns, self.s, self.r
+            if s1 not in U:
+                U[s1] = r1
+            if s is not None:
+                Ns[s] = Ns.get(s, 0) + 1
+                U[s] += self.alpha(Ns[s]) * (r + self.gamma * U[s1] - U[s])
+            if s1 in self.terminals:
+                self.s = self.a = self.r = None
+            else:
+                self.s, self.a, self.r = s1, self.pi[s1], r1
+            return self.a
+        self.program = program
+
+def td_update(U, states, rewards, next_states, done, alpha, gamma=.9):
+    """Do the passive TD update of Fig. 21.4 for a batch of transitions at
+    once, on an array U of the utilities of numbered states. Rewards are
+    those received on each transition, and the utility of next_states is
+    left out where done. States seen more than once in a batch get a step
+    for each. Returns the TD errors.
+    >>> U = np.zeros(3)
+    >>> td_update(U, [0, 1, 1], [0., 1., 1.], [1, 2, 2], [False, True, True],
+    ...           alpha=.5)
+    array([0., 1., 1.])
+    >>> U
+    array([0., 1., 0.])
+    """
+    states = np.asarray(states, dtype=np.intp)
+    targets = np.asarray(rewards, dtype=float) + gamma * np.where(
+        done, 0., U[np.asarray(next_states, dtype=np.intp)])
+    errors = targets - U[states]
+    np.add.at(U, states, alpha * errors)
+    return errors
+
+#______________________________________________________________________________
+# Action values held in arrays
+
+class TabularQ:
+    """Action values Q(s, a) of states 0..n-1 and actions 0..m-1, in one
+    (n, m) array. values and update work on whole batches of states.
+    >>> Q = TabularQ(3, 2)
+    >>> Q.update([0, 0, 2], [1, 1, 0], [1., 1., -1.], alpha=.5)
+    array([ 1.,  1., -1.])
+    >>> Q.values([0, 2])
+    array([[ 0. ,  1. ],
+           [-0.5,  0. ]])
+    """
+
+    def __init__(self, n_states, n_actions, initial=0.):
+        self.n_actions = n_actions
+        self.table = np.full((n_states, n_actions), initial, dtype=float)
+
+    def values(self, states):
+        "The (batch, m) action values of a batch of states."
+        return self.table[np.asarray(states, dtype=np.intp)]
+
+    def update(self, states, actions, targets, alpha):
+        """Move Q(s, a) towards each target by alpha times its error, and
+        return the errors. Pairs seen more than once in a batch get a step
+        for each, all computed from the values before the batch."""
+        states = np.asarray(states, dtype=np.intp)
+        actions = np.asarray(actions, dtype=np.intp)
+        errors = np.asarray(targets, dtype=float) - self.table[states, actions]
+        np.add.at(self.table, (states, actions), alpha * errors)
+        return errors
+
+class TileCoder:
+    """Tile coding of states in the box from low to high into binary
+    features. [Section 21.4] Each of 'tilings' grids of 'tiles' tiles a side
+    covers the box, every one shifted from the last by a fraction of a tile
+    (and by different fractions along different dimensions), so a state is in
+    exactly one tile of each grid and nearby states share most of them.
+    Features are numbered 0..size-1.
+    >>> coder = TileCoder([0, 0], [1, 1], tilings=4, tiles=2)
+    >>> coder.size
+    36
+    >>> coder.active([[.1, .1], [.12, .1], [.9, .9]])
+    array([[ 0,  9, 18, 27],
+           [ 0,  9, 18, 27],
+           [ 4, 17, 26, 35]])
+    """
+
+    def __init__(self, low, high, tilings=8, tiles=8):
+        low, high = np.asarray(low, dtype=float), np.asarray(high, dtype=float)
+        d = len(low)
+        width = (high - low) / tiles
+        # tiling t is shifted by t (2i + 1) / tilings of a tile along
+        # dimension i, wrapping around, so that no two dimensions line up.
+        # a shifted grid needs one more tile a side to cover the box.
+        shifts = (np.arange(tilings)[:, np.newaxis] * (2 * np.arange(d) + 1)
+                  % tilings) / float(tilings)
+        update(self, low=low, high=high, tilings=tilings, tiles=tiles,
+               width=width, offsets=shifts * width,
+               strides=(tiles + 1) ** np.arange(d)[::-1],
+               size=tilings * (tiles + 1) ** d)
+
+    def active(self, states):
+        """The (batch, tilings) features active in a batch of (batch, d)
+        states, or the (tilings,) features of a single state."""
+        states = np.asarray(states, dtype=float)
+        single = states.ndim == 1
+        x = np.clip(np.atleast_2d(states), self.low, self.high) - self.low
+        # (batch, tilings, d) tile coordinates, one per grid
+        tiles = np.floor((x[:, np.newaxis] + self.offsets) / self.width)
+        tiles = np.minimum(tiles.astype(np.intp), self.tiles)
+        features = (np.dot(tiles, self.strides) +
+                    np.arange(self.tilings) * (self.tiles + 1) ** len(self.low))
+        if single:
+            return features[0]
+        return features
+
+class LinearQ:
+    """Action values as linear functions of tile-coded features of the
+    state, one weight per action and feature. [Section 21.4] Q(s, a) is the
+    sum of a's weights of the features active in s. Since a state has one
+    active feature per tiling, alpha is divided among them, so that an update
+    moves Q(s, a) by alpha times its error, as for a TabularQ.
+    >>> Q = LinearQ(TileCoder([0], [1], tilings=4, tiles=4), 2)
+    >>> Q.update([[.5], [.5]], [0, 1], [1., -1.], alpha=.5)
+    array([ 1., -1.])
+    >>> Q.values([[.5], [.55], [0.]])
+    array([[ 0.5, -0.5],
+           [ 0.5, -0.5],
+           [ 0. ,  0. ]])
+    """
+
+    def __init__(self, coder, n_actions, initial=0.):
+        self.coder = coder
+        self.n_actions = n_actions
+        self.weights = np.full((n_actions, coder.size),
+                               initial / float(coder.tilings))
+
+    def values(self, states):
+        "The (batch, m) action values of a batch of states."
+        features = self.coder.active(np.atleast_2d(states))
+        return self.weights[:, features].sum(axis=2).T
+
+    def update(self, states, actions, targets, alpha):
+        """Move Q(s, a) towards each target by alpha times its error, by
+        gradient descent on the weights, and return the errors."""
+        features = self.coder.active(np.atleast_2d(states))
+        actions = np.asarray(actions, dtype=np.intp)[:, np.newaxis]
+        errors = (np.asarray(targets, dtype=float) -
+                  self.weights[actions, features].sum(axis=1))
+        step = alpha / float(self.coder.tilings) * errors
+        np.add.at(self.weights, (actions, features), step[:, np.newaxis])
+        return errors
+
+    def save(self, path):
+        "Save the coder and weights to a numpy .npz file."
+        c = self.coder
+        np.savez_compressed(path, low=c.low, high=c.high,
+                            tilings=c.tilings, tiles=c.tiles,
+                            weights=self.weights)
+
+    @staticmethod
+    def load(path):
+        "Read back a LinearQ written by save."
+        data = np.load(path)
+        coder = TileCoder(data['low'], data['high'], int(data['tilings']),
+                          int(data['tiles']))
+        Q = LinearQ(coder, len(data['weights']))
+        Q.weights[:] = data['weights']
+        return Q
+
+def q_learning_targets(Q, rewards, next_states, done, gamma=.9):
+    """The Q-learning targets r + gamma max_a' Q(s', a') of a batch of
+    transitions, or just r where the episode ended. [Fig. 21.8]"""
+    best = Q.values(next_states).max(axis=1)
+    return np.asarray(rewards, dtype=float) + gamma * np.where(done, 0., best)
+
+def sarsa_targets(Q, rewards, next_states, next_actions, done, gamma=.9):
+    """The SARSA targets r + gamma Q(s', a') of a batch of transitions, with
+    a' the action actually taken in s', or just r where the episode ended."""
+    done = np.asarray(done, dtype=bool)
+    next_actions = np.where(done, 0, next_actions)
+    values = Q.values(next_states)[np.arange(len(done)), next_actions]
+    return np.asarray(rewards, dtype=float) + gamma * np.where(done, 0., values)
+
+#______________________________________________________________________________
+# Learning from replayed experience
+
+class ReplayBuffer:
+    """The last 'capacity' transitions (s, a, r, s', a', done), in arrays
+    allocated up front and written round-robin, so that the oldest
+    transitions make way for new ones. States are arrays of state_shape, ()
+    for numbered states. a' is the action taken in s', -1 where unknown.
+    >>> buf = ReplayBuffer(3)
+    >>> for s in range(5):
+    ...     buf.add(s, 0, float(s), s + 1, done=(s == 4))
+    >>> len(buf), buf.count
+    (3, 5)
+    >>> buf.transitions()[0]
+    array([2, 3, 4])
+    """
+
+    def __init__(self, capacity, state_shape=(), state_dtype=np.intp):
+        shape = (capacity,) + tuple(state_shape)
+        update(self, capacity=capacity, count=0,
+               s=np.zeros(shape, dtype=state_dtype),
+               a=np.zeros(capacity, dtype=np.int32),
+               r=np.zeros(capacity, dtype=np.float32),
+               s2=np.zeros(shape, dtype=state_dtype),
+               a2=np.full(capacity, -1, dtype=np.int32),
+               done=np.zeros(capacity, dtype=bool))
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    def add(self, s, a, r, s2, done=False, a2=-1):
+        "Keep one transition."
+        row = self.count % self.capacity
+        self.s[row], self.a[row], self.r[row] = s, a, r
+        self.s2[row], self.a2[row], self.done[row] = s2, a2, done
+        self.count += 1
+
+    def add_batch(self, s, a, r, s2, done, a2=None):
+        "Keep a batch of transitions, given as arrays, at once."
+        n = len(a)
+        if a2 is None:
+            a2 = np.full(n, -1)
+        # of more transitions than fit, only the last ones would be kept
+        keep = slice(max(n - self.capacity, 0), n)
+        rows = (self.count + np.arange(n)[keep]) % self.capacity
+        for name, values in zip(('s', 'a', 'r', 's2', 'a2', 'done'),
+                                (s, a, r, s2, a2, done)):
+            getattr(self, name)[rows] = np.asarray(values)[keep]
+        self.count += n
+
+    def batch(self, rows):
+        "The (s, a, r, s', a', done) arrays of the given rows."
+        return (self.s[rows], self.a[rows], self.r[rows], self.s2[rows],
+                self.a2[rows], self.done[rows])
+
+    def sample(self, n, rng=np.random):
+        "A batch of n transitions drawn at random, with replacement."
+        return self.batch(rng.randint(len(self), size=n))
+
+    def transitions(self):
+        "All the transitions kept, oldest first."
+        n = len(self)
+        return self.batch((np.arange(n) + self.count - n) % self.capacity)
+
+    def save(self, path):
+        "Save the transitions kept, oldest first, to a numpy .npz file."
+        s, a, r, s2, a2, done = self.transitions()
+        np.savez_compressed(path, s=s, a=a, r=r, s2=s2, a2=a2, done=done)
+
+    @staticmethod
+    def load(path, capacity=None):
+        """Read back transitions written by save, into a buffer of the given
+        capacity, by default just big enough for them."""
+        data = np.load(path)
+        n = len(data['a'])
+        buf = ReplayBuffer(capacity or max(n, 1), data['s'].shape[1:],
+                           data['s'].dtype)
+        buf.add_batch(data['s'], data['a'], data['r'], data['s2'],
+                      data['done'], data['a2'])
+        return buf
+
+def batch_q_learning(Q, buffer, batches, batch_size=32, alpha=.1, gamma=.9,
+                     sarsa=False, rng=np.random):
+    """Learn Q from 'batches' batches of transitions drawn from the buffer,
+    by Q-learning, or by SARSA where the next actions are known. Returns the
+    mean absolute TD error of every batch.
+    >>> buf = ReplayBuffer(10)
+    >>> buf.add_batch([0, 1], [0, 1], [0., 1.], [1, 0], [False, True])
+    >>> Q = TabularQ(2, 2)
+    >>> errors = batch_q_learning(Q, buf, 500, batch_size=2, gamma=.5,
+    ...                           rng=np.random.RandomState(0))
+    >>> np.round(Q.table, 2)
+    array([[0.5, 0. ],
+           [0. , 1. ]])
+    """
+    errors = np.empty(batches)
+    for i in range(batches):
+        s, a, r, s2, a2, done = buffer.sample(batch_size, rng)
+        if sarsa:
+            done = done | (a2 < 0)
+            targets = sarsa_targets(Q, r, s2, a2, done, gamma)
+        else:
+            targets = q_learning_targets(Q, r, s2, done, gamma)
+        errors[i] = np.abs(Q.update(s, a, targets, alpha)).mean()
+    return errors
+
+class QLearningAgent(agents.Agent):
+    """Q-learning agent with epsilon-greedy exploration. [Fig. 21.8]
+    Percepts are (state, reward, done) triples: the state we are in, in the
+    form Q.values takes, the reward for the last action, and whether the
+    episode just ended. Actions are numbers 0..m-1. Every transition is kept
+    in the replay buffer, and every 'every' steps a batch of batch_size is
+    drawn from it and learned; without a buffer, each transition is learned
+    as it comes. With sarsa set, it learns the values of the actions it
+    takes, exploration included, rather than of the best ones.
+    >>> Q = TabularQ(2, 2)
+    >>> agent = QLearningAgent(Q, epsilon=.5, alpha=.5,
+    ...                        rng=np.random.RandomState(1))
+    >>> for episode in range(50):
+    ...     a = agent.program((0, 0., False))
+    ...     a = agent.program((1, float(a), True))
+    >>> int(np.argmax(Q.table[0]))
+    1
+    """
+
+    def __init__(self, Q, epsilon=.1, alpha=.1, gamma=.9, buffer=None,
+                 batch_size=32, every=1, sarsa=False, rng=np.random):
+        agents.Agent.__init__(self)
+        update(self, Q=Q, epsilon=epsilon, alpha=alpha, gamma=gamma,
+               buffer=buffer, batch_size=batch_size, every=every, sarsa=sarsa,
+               rng=rng, s=None, a=None, steps=0)
+
+        def program(percept):
+            s1, r, done = percept
+            a1 = None if done else self.choose(s1)
+            if self.s is not None:
+                self.learn(self.s, self.a, r, s1, done,
+                           -1 if a1 is None else a1)
+            self.s, self.a = (None, None) if done else (s1, a1)
+            return a1
+        self.program = program
+
+    def choose(self, s):
+        "Pick an action in state s, at random with probability epsilon."
+        if self.rng.random_sample() < self.epsilon:
+            return int(self.rng.randint(self.Q.n_actions))
+        return int(np.argmax(self.Q.values([s])[0]))
+
+    def learn(self, s, a, r, s1, done, a1):
+        "Learn from one transition, or from a batch of replayed ones."
+        self.steps += 1
+        if self.buffer is None:
+            batch = ([s], [a], [r], [s1], np.array([a1]), np.array([done]))
+        else:
+            self.buffer.add(s, a, r, s1, done, a1)
+            if self.steps % self.every or len(self.buffer) < self.batch_size:
+                return
+            batch = self.buffer.sample(self.batch_size, self.rng)
+        s, a, r, s1, a1, done = batch
+        if self.sarsa:
+            targets = sarsa_targets(self.Q, r, s1, a1, done | (a1 < 0),
+                                    self.gamma)
+        else:
+            targets = q_learning_targets(self.Q, r, s1, done, self.gamma)
+        self.Q.update(s, a, targets, self.alpha)
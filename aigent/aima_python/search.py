@@ -44,7 +44,7 @@ class Problem:
         and action. The default method costs 1 for every step in the path."""
         return c + 1
 
-    def value(self):
+    def value(self, state):
         """For optimization problems, each state has a value.  Hill-climbing
         and related algorithms try to maximize this value."""
         abstract
@@ -190,9 +190,23 @@ def best_first_graph_search(problem, f):
     first search; if f is node.depth then we have depth-first search.
     There is a subtlety: the line "f = memoize(f, 'f')" means that the f
     values will be cached on the nodes as they are computed. So after doing
-    a best first search you can examine the f values of the path returned."""
+    a best first search you can examine the f values of the path returned.
+    Unlike graph_search, the fringe holds at most one node per state: a
+    cheaper path to a state already on the fringe replaces the queued node,
+    and a dearer one is dropped. [Fig. 3.14]"""
     f = memoize(f, 'f')
-    return graph_search(problem, PriorityQueue(min, f))
+    closed = {}
+    fringe = PriorityQueue(min, f, key=lambda node: node.state)
+    fringe.append(Node(problem.initial))
+    while fringe:
+        node = fringe.pop()
+        if problem.goal_test(node.state):
+            return node
+        closed[node.state] = True
+        for child in node.expand(problem):
+            if child.state not in closed:
+                fringe.append(child)
+    return None
 
 greedy_best_first_graph_search = best_first_graph_search
     # Greedy best-first search is accomplished by specifying f(n) = h(n).
@@ -236,8 +250,11 @@ def hill_climbing(problem):
     stopping when no neighbor is better. [Fig. 4.11]"""
     current = Node(problem.initial)
     while True:
-        neighbor = argmax(expand(node, problem), Node.value)
-        if neighbor.value() <= current.value():
+        neighbors = current.expand(problem)
+        if not neighbors:
+            return current.state
+        neighbor = argmax(neighbors, lambda node: problem.value(node.state))
+        if problem.value(neighbor.state) <= problem.value(current.state):
             return current.state
         current = neighbor
 
@@ -246,14 +263,18 @@ def exp_schedule(k=20, lam=0.005, limit=100):
     return lambda t: if_(t < limit, k * math.exp(-lam * t), 0)
 
 def simulated_annealing(problem, schedule=exp_schedule()):
-    "[Fig. 4.5]"
+    """Wander to random neighbors, always taking better ones and worse ones
+    with a probability that falls with the temperature. [Fig. 4.5]"""
     current = Node(problem.initial)
     for t in xrange(sys.maxint):
         T = schedule(t)
         if T == 0:
-            return current
-        next = random.choice(expand(node. problem))
-        delta_e = next.path_cost - current.path_cost
+            return current.state
+        neighbors = current.expand(problem)
+        if not neighbors:
+            return current.state
+        next = random.choice(neighbors)
+        delta_e = problem.value(next.state) - problem.value(current.state)
         if delta_e > 0 or probability(math.exp(delta_e/T)):
             current = next
 
@@ -279,41 +300,107 @@ def genetic_search(problem, fitness_fn, ngen=1000, pmut=0.0, n=20):
     fitness_fn = lambda s: - problem.path_cost(0, s, None, s)
     return genetic_algorithm(states, fitness_fn, ngen, pmut)
 
-def genetic_algorithm(population, fitness_fn, ngen=1000, pmut=0.0):
-    """[Fig. 4.7]"""
-    def reproduce(p1, p2):
-        c = random.randrange(len(p1))
-        return p1[:c] + p2[c:]
-
+def genetic_algorithm(population, fitness_fn, ngen=1000, pmut=0.0,
+                      mutate=lambda child: child.mutate()):
+    """Evolve a population of sequences by weighted selection, single point
+    crossover and mutation with probability pmut. mutate(child) returns the
+    mutated child; by default individuals mutate themselves. [Fig. 4.7]"""
     for i in range(ngen):
+        select = weighted_sampler(population, map(fitness_fn, population))
         new_population = []
-        for i in len(population):
-            p1, p2 = random_weighted_selections(population, 2, fitness_fn)
-            child = reproduce(p1, p2)
-            if random.uniform(0,1) > pmut:
-                child.mutate()
+        for i in range(len(population)):
+            child = reproduce(select(), select())
+            if random.uniform(0,1) < pmut:
+                child = mutate(child)
             new_population.append(child)
         population = new_population
     return argmax(population, fitness_fn)
 
+def parallel_genetic_algorithm(population, fitness_fn, ngen=1000, pmut=0.0,
+                               mutate=lambda child: child.mutate(),
+                               elitism=0, tournament=0, pool=None,
+                               key=tuple, cache=None):
+    """Like genetic_algorithm, but each generation is evaluated all at once
+    by pool.map, so fitness_fn runs on as many cores as the pool has. pool
+    defaults to a multiprocessing.Pool with a process per core, which needs
+    a fitness_fn that pickles; pass a multiprocessing.dummy.Pool for one that
+    doesn't, or one that waits on other processes anyway. Fitnesses are
+    cached in the dict cache by key(individual), so nothing is evaluated
+    twice. The elitism fittest individuals of each generation carry over
+    unchanged. Parents are the fittest of tournament individuals picked at
+    random, or if tournament is 0, picked with probability in proportion to
+    fitness, which then must not be negative. Returns the fittest individual
+    of the last generation."""
+    if cache is None:
+        cache = {}
+    own_pool = pool is None
+    if own_pool:
+        import multiprocessing
+        pool = multiprocessing.Pool()
+
+    def evaluate(population):
+        new = {}
+        for x in population:
+            k = key(x)
+            if k not in cache and k not in new:
+                new[k] = x
+        keys = new.keys()
+        for k, fitness in zip(keys, pool.map(fitness_fn, [new[k] for k in keys])):
+            cache[k] = fitness
+        return [cache[key(x)] for x in population]
+
+    try:
+        for i in range(ngen):
+            fitnesses = evaluate(population)
+            if tournament:
+                select = tournament_sampler(population, fitnesses, tournament)
+            else:
+                select = weighted_sampler(population, fitnesses)
+            ranked = sorted(range(len(population)),
+                            key=lambda j: fitnesses[j], reverse=True)
+            new_population = [population[j] for j in ranked[:elitism]]
+            while len(new_population) < len(population):
+                child = reproduce(select(), select())
+                if random.uniform(0,1) < pmut:
+                    child = mutate(child)
+                new_population.append(child)
+            population = new_population
+        fitnesses = evaluate(population)
+        return population[fitnesses.index(max(fitnesses))]
+    finally:
+        if own_pool:
+            pool.close()
+            pool.join()
+
+def reproduce(p1, p2):
+    "Single point crossover of two sequences."
+    c = random.randrange(len(p1))
+    return p1[:c] + p2[c:]
+
+def weighted_sampler(seq, weights):
+    """Return a function that picks an element of seq with probability
+    weight/total, bisecting running totals that are added up just once."""
+    totals = []
+    for w in weights:
+        totals.append(w + totals[-1] if totals else w)
+    return lambda: seq[min(bisect.bisect(totals, random.uniform(0, totals[-1])),
+                           len(seq) - 1)]
+
+def tournament_sampler(seq, weights, k):
+    """Return a function that picks the element of seq with the highest
+    weight among k picked at random, with replacement."""
+    n = len(seq)
+    return lambda: seq[max([random.randrange(n) for i in range(k)],
+                           key=weights.__getitem__)]
+
 def random_weighted_selection(seq, n, weight_fn):
     """Pick n elements of seq, weighted according to weight_fn.
     That is, apply weight_fn to each element of seq, add up the total.
     Then choose an element e with probability weight[e]/total.
     Repeat n times, with replacement. """
-    totals = []; runningtotal = 0
-    for item in seq:
-        runningtotal += weight_fn(item)
-        totals.append(runningtotal)
-    selections = []
-    for s in range(n):
-        r = random.uniform(0, totals[-1])
-        for i in range(len(seq)):
-            if totals[i] > r:
-                selections.append(seq[i])
-                break
-    return selections
-    
+    select = weighted_sampler(seq, map(weight_fn, seq))
+    return [select() for s in range(n)]
+
 
 #_____________________________________________________________________________
 # The remainder of this file implements examples for the search algorithms.
@@ -734,3 +821,37 @@ def compare_graph_searchers():
                                 GraphProblem('Q', 'WA', australia)],
             header=['Searcher', 'Romania(A,B)', 'Romania(O, N)', 'Australia'])
 
+def compare_priority_queues(sizes=[250, 500, 1000, 2000, 4000], min_links=6,
+                            repeat=3):
+    """Time uniform cost search between the farthest apart cities of random
+    graphs of the given sizes, once with the old sorted list fringe and once
+    with best_first_graph_search's heap. At these sizes both grow about
+    linearly, the heap some 1.5 times faster: a list's O(n) appends and pops
+    are memory moves, cheap until the fringe runs to many thousands of nodes.
+    Building the graphs takes most of the time, so this is not one of the
+    demos in search.txt; run it by hand."""
+    def sorted_search(problem):
+        return graph_search(problem, SortedPriorityQueue(min, memoize(
+            lambda n: n.path_cost, 'f')))
+    def heap_search(problem):
+        return best_first_graph_search(problem, lambda n: n.path_cost)
+    table = []
+    for n in sizes:
+        random.seed(n)
+        g = RandomGraph(range(n), min_links, width=10*n, height=10*n)
+        locs = g.locations
+        start = argmin(g.nodes(), lambda c: locs[c][0] + locs[c][1])
+        goal = argmax(g.nodes(), lambda c: locs[c][0] + locs[c][1])
+        problem = GraphProblem(start, goal, g)
+        row = [n]
+        for searcher in (sorted_search, heap_search):
+            times = []
+            for i in range(repeat):
+                t = time.time()
+                node = searcher(problem)
+                times.append(time.time() - t)
+            row.extend([node.path_cost, '%.3f' % min(times)])
+        table.append(row)
+    print_table(table, ['Cities', 'Cost', 'Sorted list (s)', 'Cost',
+                        'Heap (s)'])
+
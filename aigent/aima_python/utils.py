@@ -3,7 +3,7 @@
 """
 
 from __future__ import generators
-import operator, math, random, copy, sys, os.path, bisect
+import operator, math, random, copy, sys, os.path, bisect, heapq
 
 #______________________________________________________________________________
 # Compatibility with Python 2.2 and 2.3
@@ -693,7 +693,68 @@ class FIFOQueue(Queue):
 class PriorityQueue(Queue):
     """A queue in which the minimum (or maximum) element (as determined by f and
     order) is returned first. If order is min, the item with minimum f(x) is
-    returned first; if order is max, then it is the item with maximum f(x)."""
+    returned first; if order is max, then it is the item with maximum f(x).
+    Ties go to the smaller (or larger) item, as in sorted order.
+    The items are kept in a binary heap, so append and pop take O(log n).
+    If key is given, the queue holds at most one item per key(x): appending
+    an item whose key is already queued keeps whichever of the two comes out
+    first, replacing the old one if need be (decrease-key). Items can be
+    looked up and removed by key with q[k], k in q and del q[k]. Replaced and
+    removed items are only marked as such, and skipped when they reach the
+    top of the heap.
+    >>> q = PriorityQueue(min, lambda x: x[1], key=lambda x: x[0])
+    >>> q.extend([('a', 5), ('b', 3), ('a', 2), ('b', 4)])
+    >>> len(q), q['a'], 'c' in q
+    (2, ('a', 2), False)
+    >>> del q['a']
+    >>> q.pop(), len(q)
+    (('b', 3), 0)
+    """
+    def __init__(self, order=min, f=lambda x: x, key=None):
+        update(self, A=[], order=order, f=f, key=key, index={}, count=0, n=0)
+    def append(self, item):
+        fx = self.f(item)
+        if self.key is not None:
+            k = self.key(item)
+            old = self.index.get(k)
+            if old is not None:
+                if fx == old[3] or self.order(fx, old[3]) != fx:
+                    return
+                old[2] = _removed; self.n -= 1
+        if self.order == min:
+            rank = (fx, item)
+        else:
+            rank = _Reversed((fx, item))
+        entry = [rank, self.count, item, fx]
+        self.count += 1; self.n += 1
+        if self.key is not None:
+            self.index[k] = entry
+        heapq.heappush(self.A, entry)
+    def __len__(self):
+        return self.n
+    def pop(self):
+        while self.A:
+            entry = heapq.heappop(self.A)
+            if entry[2] is not _removed:
+                self.n -= 1
+                if self.key is not None:
+                    del self.index[self.key(entry[2])]
+                return entry[2]
+        raise IndexError('pop from an empty PriorityQueue')
+    def __contains__(self, k):
+        if self.key is None:
+            return k in [e[2] for e in self.A if e[2] is not _removed]
+        return k in self.index
+    def __getitem__(self, k):
+        return self.index[k][2]
+    def __delitem__(self, k):
+        entry = self.index.pop(k)
+        entry[2] = _removed; self.n -= 1
+
+class SortedPriorityQueue(Queue):
+    """The same as PriorityQueue without a key, kept as a sorted list. Append
+    and pop take O(n), which is only cheap for small queues; see
+    compare_priority_queues in search.py."""
     def __init__(self, order=min, f=lambda x: x):
         update(self, A=[], order=order, f=f)
     def append(self, item):
@@ -706,6 +767,19 @@ class PriorityQueue(Queue):
         else:
             return self.A.pop()[1]
 
+class _Reversed:
+    "Wraps a value so that it sorts the other way round; for max heaps."
+    __slots__ = ['value']
+    def __init__(self, value):
+        self.value = value
+    def __lt__(self, other):
+        return other.value < self.value
+    def __eq__(self, other):
+        return self.value == other.value
+
+## Marks heap entries that were replaced or removed
+_removed = object()
+
 ## Fig: The idea is we can define things like Fig[3,10] later.
 ## Alas, it is Fig[3,10] not Fig[3.10], because that would be the same as Fig[3.1]
 Fig = {} 
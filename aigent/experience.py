@@ -0,0 +1,183 @@
+#!/usr/bin/env python
+
+# Learns the striker's decisions from the experience of its matches
+
+import glob
+import os
+import sys
+import time
+
+import numpy as np
+
+from aima_python.rl import (ReplayBuffer, TileCoder, LinearQ,
+        batch_q_learning)
+from soccerpy.flight_recorder import DEFAULT_DIRECTORY
+from soccerpy.world_model import WorldModel
+
+# the choices learned, and the decision loop branches that count as each
+ACTIONS = ["shoot", "pass", "dribble", "move"]
+SHOOT, PASS, DRIBBLE, MOVE = range(len(ACTIONS))
+BRANCH_ACTIONS = {
+    "shoot": SHOOT,
+    "pass": PASS,
+    "dribble": DRIBBLE,
+}
+
+# what a decision is made from, and the range each feature is tile coded over.
+# distances are in metres, and ones we don't know are taken as the farthest.
+FEATURES = ["ball_distance", "goal_distance", "enemy_distance",
+        "mate_distance", "kickable"]
+LOW = (0.0, 0.0, 0.0, 0.0, 0.0)
+HIGH = (40.0, 80.0, 20.0, 30.0, 1.0)
+
+def features(wm, enemy_goal):
+    """
+    Returns the FEATURES of the world model as it stands, for a player
+    attacking the given goal.
+    """
+
+    f = np.array(HIGH, dtype=np.float32)
+    f[4] = 0.0
+
+    if wm.ball is not None and wm.ball.distance is not None:
+        f[0] = wm.ball.distance
+    if wm.abs_coords[0] is not None and enemy_goal is not None:
+        f[1] = wm.get_distance_to_point(enemy_goal)
+
+    for p in wm.players:
+        if p.distance is None or p.side is None:
+            continue
+        i = 3 if p.side == wm.side else 2
+        f[i] = min(f[i], p.distance)
+
+    if wm.is_ball_kickable():
+        f[4] = 1.0
+
+    return np.minimum(f, HIGH)
+
+class ExperienceRecorder:
+    """
+    Keeps the transitions between an agent's decisions for learning them
+    offline.  Every decision is a transition from the features we decided on
+    last, through the action we took then, to the features we decide on now.
+    A goal ends the episode with a reward of 1 if we scored it and -1 if they
+    did; every other transition is worth 0.
+
+    Like the FlightRecorder, it only writes into arrays allocated up front, and
+    is written to disk at the end of the match.
+    """
+
+    def __init__(self, branches, capacity=8192, directory=DEFAULT_DIRECTORY):
+        """
+        branches: names of the decision loop's branches, in the order of their
+            ids.  those not in BRANCH_ACTIONS count as moving.
+        capacity: how many transitions are kept.
+        directory: where experience is written.
+        """
+
+        self.actions = np.array([BRANCH_ACTIONS.get(b, MOVE)
+            for b in branches], dtype=np.int32)
+        self.buffer = ReplayBuffer(capacity, (len(FEATURES),), np.float32)
+        self.directory = directory
+
+        # the features and action of our last decision, and the score then
+        self.last = None
+        self.action = None
+        self.score = None
+
+    def record(self, wm, enemy_goal, branch):
+        """
+        Records the decision just made, which took the given branch id, or -1
+        if it took none.
+        """
+
+        s = features(wm, enemy_goal)
+        a = MOVE if branch < 0 else self.actions[branch]
+
+        # goals for us and against since the last decision
+        if wm.side == WorldModel.SIDE_L:
+            score = (wm.score_l, wm.score_r)
+        else:
+            score = (wm.score_r, wm.score_l)
+        reward = 0.0
+        if self.score is not None:
+            reward = (score[0] - self.score[0]) - (score[1] - self.score[1])
+        self.score = score
+
+        if self.last is not None:
+            self.buffer.add(self.last, self.action, reward, s, reward != 0, a)
+
+        # after a goal we start over from the kick off
+        if reward != 0:
+            self.last = None
+        else:
+            self.last = s
+            self.action = a
+
+    def dump(self, name, reason):
+        """
+        Writes the transitions kept to a compressed numpy archive named after
+        the agent, the reason and the time, so that the experience of earlier
+        matches is kept too.  Returns the path written to, or None if
+        there are none yet.
+        """
+
+        if len(self.buffer) == 0:
+            return None
+
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        path = os.path.join(self.directory, "%s_%s_%d_experience.npz" % (name,
+            reason, time.time()))
+        self.buffer.save(path)
+
+        return path
+
+def train(paths, batches=20000, batch_size=64, alpha=0.05, gamma=0.99,
+        tilings=8, tiles=6, seed=0):
+    """
+    Learns the value of every action from the experience in the given files,
+    by batched Q-learning over tile-coded features.  Returns the LinearQ and
+    the mean TD error of every batch.
+    """
+
+    buffers = [ReplayBuffer.load(p) for p in paths]
+    n = sum(len(b) for b in buffers)
+    replay = ReplayBuffer(n, (len(FEATURES),), np.float32)
+    for b in buffers:
+        s, a, r, s2, a2, done = b.transitions()
+        replay.add_batch(s, a, r, s2, done, a2)
+
+    Q = LinearQ(TileCoder(LOW, HIGH, tilings, tiles), len(ACTIONS))
+    errors = batch_q_learning(Q, replay, batches, batch_size, alpha, gamma,
+            rng=np.random.RandomState(seed))
+
+    return Q, errors
+
+if __name__ == "__main__":
+    # enforce correct number of arguments, print help otherwise
+    if len(sys.argv) < 2:
+        print "args: ./experience.py <output> [experience files...]"
+        sys.exit()
+
+    paths = sys.argv[2:] or glob.glob(os.path.join(DEFAULT_DIRECTORY,
+        "*_experience.npz"))
+    if not paths:
+        print "No experience to learn from."
+        sys.exit(1)
+
+    Q, errors = train(paths)
+    Q.save(sys.argv[1])
+
+    # how the values ended up over everything we learned from
+    replay = [ReplayBuffer.load(p) for p in paths]
+    states = np.concatenate([b.transitions()[0] for b in replay])
+    values = Q.values(states)
+    print "Learned from %d transitions in %d files, saved to %s." % (
+            len(states), len(paths), sys.argv[1])
+    print "TD error: %.4f at first, %.4f at last" % (errors[:100].mean(),
+            errors[-100:].mean())
+    for i, name in enumerate(ACTIONS):
+        print "%-8s mean Q %7.4f, best in %5.1f%% of states" % (name,
+                values[:, i].mean(),
+                100.0 * np.mean(values.argmax(axis=1) == i))
@@ -0,0 +1,279 @@
+#!/usr/bin/env python
+
+# Ball interception prediction, shared by all agent types
+
+import collections
+
+import numpy as np
+
+# a solved interception: the player object (None for ourselves), the cycle
+# offset at which it first reaches the ball, and the (x, y) point it does so at.
+Intercept = collections.namedtuple("Intercept", "player cycle point")
+
+def visible_players(wm):
+    """
+    Collects every visible player with a usable distance and direction into
+    arrays.  Returns a tuple of (player objects, (n, 2) absolute coordinates,
+    boolean teammate mask).  The coordinates are computed for all players at
+    once rather than through repeated calls to get_object_absolute_coords.
+    """
+
+    players = []
+    dists = []
+    dirs = []
+    mates = []
+
+    # we can't place anybody if we don't know where we are or where we look
+    if wm.abs_neck_dir is None or wm.abs_coords[0] is None:
+        return players, np.zeros((0, 2)), np.zeros(0, dtype=bool)
+
+    for p in wm.players:
+        # skip players too far away to have a distance, or of unknown side
+        if p.distance is None or p.direction is None or p.side is None:
+            continue
+
+        players.append(p)
+        dists.append(p.distance)
+        dirs.append(p.direction)
+        mates.append(p.side == wm.side)
+
+    # object directions are relative to the neck, in degrees
+    abs_dirs = np.radians(wm.abs_neck_dir - np.array(dirs, dtype=float))
+    dists = np.array(dists, dtype=float)
+
+    coords = np.empty((len(players), 2))
+    coords[:, 0] = wm.abs_coords[0] + dists * np.cos(abs_dirs)
+    coords[:, 1] = wm.abs_coords[1] + dists * np.sin(abs_dirs)
+
+    return players, coords, np.array(mates, dtype=bool)
+
+class InterceptSolver:
+    """
+    Predicts when and where players can first reach a moving ball.
+
+    The ball's path is rolled forward over a fixed horizon of cycles using the
+    server's ball_decay, while each player is modelled as a disc that grows by
+    player_speed_max every cycle (after some cycles spent turning) plus the
+    kickable margin.  Every player is solved at once as a row of a
+    (players x cycles) array, so asking who gets to the ball first costs a few
+    array operations no matter how many players are visible.
+    """
+
+    def __init__(self, server_parameters, horizon=50, turn_cycles=1):
+        """
+        server_parameters: the ServerParameters object of the world model.
+            it's read lazily, since the server sends its parameters after we
+            connect.
+        horizon: how many cycles ahead the ball's path is predicted.
+        turn_cycles: cycles a player is assumed to lose turning to the ball.
+        """
+
+        self.server_parameters = server_parameters
+        self.horizon = horizon
+        self.turn_cycles = turn_cycles
+
+        # the per-cycle lookup tables, and the parameters they were built from
+        self.__table_key = None
+        self.travel = None
+        self.reach = None
+
+    def __update_tables(self):
+        """
+        Rebuilds the per-cycle travel and reach tables if the server parameters
+        they depend on have changed since they were last built.
+        """
+
+        sp = self.server_parameters
+        key = (sp.ball_decay, sp.player_speed_max, sp.kickable_margin)
+        if key == self.__table_key:
+            return
+
+        t = np.arange(self.horizon, dtype=float)
+
+        # a ball moving at v covers v * (1 + d + d^2 + ... + d^(t-1)) in t
+        # cycles, which is the geometric sum below.
+        self.travel = (1.0 - sp.ball_decay ** t) / (1.0 - sp.ball_decay)
+
+        # how far a player can get from its current position in t cycles
+        running = np.maximum(t - self.turn_cycles, 0)
+        self.reach = sp.player_speed_max * running + sp.kickable_margin
+
+        self.__table_key = key
+
+    def ball_path(self, ball_pos, ball_vel):
+        """
+        Returns a (horizon, 2) array of the ball's predicted position at each
+        of the next 'horizon' cycles, starting with its current position.
+        """
+
+        self.__update_tables()
+
+        pos = np.asarray(ball_pos, dtype=float)
+        vel = np.asarray(ball_vel, dtype=float)
+
+        return pos + vel * self.travel[:, np.newaxis]
+
+    def solve(self, ball_pos, ball_vel, positions):
+        """
+        Solves interception for an (n, 2) array of player positions.  Returns a
+        tuple of (cycles, points): an int array holding the first cycle each
+        player can reach the ball at (-1 if not within the horizon), and an
+        (n, 2) array of the points where that happens (the ball's last
+        predicted position for unreachable players).
+        """
+
+        path = self.ball_path(ball_pos, ball_vel)
+        positions = np.asarray(positions, dtype=float).reshape(-1, 2)
+
+        # distance from every player to every predicted ball position
+        dx = path[np.newaxis, :, 0] - positions[:, 0, np.newaxis]
+        dy = path[np.newaxis, :, 1] - positions[:, 1, np.newaxis]
+        reachable = np.hypot(dx, dy) <= self.reach[np.newaxis, :]
+
+        # argmax finds the first True in each row, rows without one get -1
+        cycles = np.where(reachable.any(axis=1), reachable.argmax(axis=1), -1)
+        points = path[np.where(cycles >= 0, cycles, self.horizon - 1)]
+
+        return cycles, points
+
+    def kick_speed(self, distances, arrival_speed):
+        """
+        Returns the initial ball speeds needed to cover the given distances and
+        still be moving at 'arrival_speed' at the end, capped at
+        ball_speed_max.  Since the ball loses (1 - ball_decay) of its speed per
+        cycle, it loses speed linearly with the distance it covers.
+        """
+
+        sp = self.server_parameters
+        needed = arrival_speed + np.asarray(distances) * (1.0 - sp.ball_decay)
+
+        return np.minimum(needed, sp.ball_speed_max)
+
+    def kick_cycles(self, distances, speeds):
+        """
+        Returns the number of cycles a ball kicked at the given initial speeds
+        takes to cover the given distances, inf where it stops short.
+        """
+
+        decay = self.server_parameters.ball_decay
+        distances = np.asarray(distances, dtype=float)
+        speeds = np.asarray(speeds, dtype=float)
+
+        # invert the geometric sum s = v * (1 - d^t) / (1 - d) for t
+        left = 1.0 - distances * (1.0 - decay) / speeds
+        cycles = np.full(left.shape, np.inf)
+        ok = left > 0
+        cycles[ok] = np.log(left[ok]) / np.log(decay)
+
+        return cycles
+
+    def line_margins(self, origin, targets, speeds, opponents, extra_reach=0.0,
+            samples=8):
+        """
+        Measures how safely balls kicked from 'origin' towards each of the (m, 2)
+        'targets' at the given initial speeds get past the (k, 2) 'opponents'.
+        Each line is sampled at 'samples' points, and at each point the cycles
+        the ball needs to get there are compared against the cycles each
+        opponent needs, widened by its kickable margin plus any per-opponent
+        'extra_reach' (eg. a goalie's catchable area).
+
+        Returns a tuple of (margins, cycles): the smallest opponent lead over
+        the ball in cycles for each line (positive means nobody gets there
+        first, inf if there are no opponents), and the ball's cycles to reach
+        each target.
+        """
+
+        sp = self.server_parameters
+
+        origin = np.asarray(origin, dtype=float)
+        targets = np.asarray(targets, dtype=float).reshape(-1, 2)
+        opponents = np.asarray(opponents, dtype=float).reshape(-1, 2)
+        speeds = np.broadcast_to(np.asarray(speeds, dtype=float),
+                (len(targets),))
+
+        # sample points along every line, excluding the origin itself
+        fractions = np.arange(1, samples + 1, dtype=float) / samples
+        deltas = targets - origin
+        lengths = np.hypot(deltas[:, 0], deltas[:, 1])
+        points = (origin + fractions[np.newaxis, :, np.newaxis] *
+                deltas[:, np.newaxis, :])
+
+        # (m, samples) cycles the ball needs to get to each sample point
+        ball_cycles = self.kick_cycles(
+                fractions[np.newaxis, :] * lengths[:, np.newaxis],
+                speeds[:, np.newaxis])
+
+        if len(opponents) == 0:
+            return np.full(len(targets), np.inf), ball_cycles[:, -1]
+
+        # (m, samples, k) cycles each opponent needs to get to each point
+        dx = points[:, :, np.newaxis, 0] - opponents[np.newaxis, np.newaxis, :, 0]
+        dy = points[:, :, np.newaxis, 1] - opponents[np.newaxis, np.newaxis, :, 1]
+        reach = sp.kickable_margin + np.asarray(extra_reach, dtype=float)
+        run = np.maximum(np.hypot(dx, dy) - reach, 0)
+        opp_cycles = run / sp.player_speed_max + self.turn_cycles
+
+        # the worst opponent lead at any point of the line
+        lead = opp_cycles - ball_cycles[:, :, np.newaxis]
+        margins = lead.reshape(len(targets), -1).min(axis=1)
+
+        return margins, ball_cycles[:, -1]
+
+    def predict(self, wm):
+        """
+        Solves interception for ourselves and every visible player in the given
+        world model.  Returns a list of Intercept tuples for those that can
+        reach the ball within the horizon, fastest first.  Our own entry has
+        None as its player.  Returns an empty list if the ball can't be placed.
+        """
+
+        # we need to know where the ball is, and where we are
+        ball = wm.ball
+        if ball is None or wm.abs_coords[0] is None:
+            return []
+
+        ball_pos = wm.get_object_absolute_coords(ball)
+        if ball_pos is None:
+            return []
+
+        # an unknown velocity is treated as a ball at rest
+        ball_vel = wm.get_object_absolute_velocity(ball) or (0.0, 0.0)
+
+        # we solve for ourselves in the first row
+        players, coords, mates = visible_players(wm)
+        positions = np.vstack((np.asarray(wm.abs_coords, dtype=float), coords))
+        cycles, points = self.solve(ball_pos, ball_vel, positions)
+
+        # list reachable intercepts in order of arrival, stable for ties
+        owners = [None] + players
+        order = np.argsort(cycles, kind="mergesort")
+        return [Intercept(owners[i], int(cycles[i]), tuple(points[i]))
+                for i in order if cycles[i] >= 0]
+
+def first_intercept(intercepts, side, wm):
+    """
+    Returns the earliest Intercept from a predicted list belonging to the given
+    side (ourselves included on our own side), or None if nobody on that side
+    can reach the ball.
+    """
+
+    for i in intercepts:
+        if i.player is None:
+            if side == wm.side:
+                return i
+        elif i.player.side == side:
+            return i
+
+    return None
+
+def own_intercept(intercepts):
+    """
+    Returns our own Intercept from a predicted list, or None if we can't reach
+    the ball within the horizon.
+    """
+
+    for i in intercepts:
+        if i.player is None:
+            return i
+
+    return None
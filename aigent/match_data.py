@@ -0,0 +1,275 @@
+#!/usr/bin/env python
+
+# Turns the recorded traffic of our matches into rows of training data
+
+import collections
+import glob
+import math
+import os
+import shutil
+import sys
+import tempfile
+import time
+from multiprocessing import Pool
+
+from aima_python.learning import ColumnStore, ColumnWriter, DataSet
+from soccerpy import handler, sp_exceptions, traffic
+from soccerpy.world_model import WorldModel
+
+# the columns of every row and their kinds, as a learning.ColumnStore holds
+# them.  distances are in metres and directions in degrees, relative to where
+# our body faces (which is not where we look once we turn our neck), and those
+# we don't know are NaN.  'action' is the primary command
+# sent that cycle, and 'outcome' whether we scored or conceded within HORIZON
+# cycles of it.
+COLUMNS = ["cycle", "play_mode", "ball_distance", "ball_direction",
+        "mate_distance", "enemy_distance", "goal_distance", "goal_direction",
+        "kickable", "action", "outcome"]
+KINDS = ["i", "c", "f", "f", "f", "f", "f", "f", "i", "c", "c"]
+FEATURES = COLUMNS[1:9]
+
+# the commands that count as an action, one of which is sent per cycle
+ACTIONS = ["kick", "dash", "turn", "move", "catch", "tackle"]
+NO_ACTION = "none"
+
+# outcomes, and how many cycles after a row a goal still counts for it
+SCORED = "scored"
+CONCEDED = "conceded"
+NO_OUTCOME = "none"
+HORIZON = 50
+
+# the goal we attack, as the agents place it, for either side
+ENEMY_GOALS = {
+    WorldModel.SIDE_L: (55, 0),
+    WorldModel.SIDE_R: (-55, 0),
+}
+
+def read_traffic(path):
+    """
+    Yields the (direction, message) of every line of a file written by a
+    soccerpy TrafficRecorder, one line at a time.
+    """
+
+    with open(path) as f:
+        for line in f:
+            msg = line[2:].rstrip("\n")
+            if msg:
+                yield line[0], msg
+
+def replay(messages):
+    """
+    Replays received messages through a MessageHandler into a fresh
+    WorldModel.  Every time the agent acted, yields (wm, commands): the world
+    model as it stood when the commands were sent, and the commands.
+
+    The same WorldModel is yielded every time and changes as soon as the
+    generator carries on, so whatever is wanted from it must be read first.
+    """
+
+    wm = WorldModel(None)
+    msg_handler = handler.MessageHandler(wm)
+    commands = []
+
+    for direction, msg in messages:
+        if direction == traffic.SENT:
+            # the server never tells us our team's name, which is how we tell
+            # teammates from enemies, so take it from our init command
+            if msg.startswith("(init "):
+                wm.teamname = msg.split()[1]
+            else:
+                commands.append(msg)
+            continue
+
+        # commands are sent all at once, so the first message after them
+        # starts the next cycle
+        if commands:
+            yield wm, commands
+            commands = []
+
+        # errors the agent got are no reason to stop replaying
+        try:
+            msg_handler.handle_message(msg)
+        except (sp_exceptions.SoccerServerError,
+                sp_exceptions.MessageTypeError):
+            pass
+
+    if commands:
+        yield wm, commands
+
+def action(commands):
+    """
+    Returns the name of the last action among the given commands, or
+    NO_ACTION if there's none.
+    """
+
+    result = NO_ACTION
+    for cmd in commands:
+        name = cmd[1:].split(" ", 1)[0].rstrip(")")
+        if name in ACTIONS:
+            result = name
+
+    return result
+
+def features(wm):
+    """
+    Returns the FEATURES of the world model as it stands, as a list.
+    """
+
+    nan = float("nan")
+    ball_distance = ball_direction = nan
+    if wm.ball is not None and wm.ball.distance is not None:
+        ball_distance = wm.ball.distance
+
+        # we see the ball relative to our head, which is turned by the neck
+        # angle relative to our body
+        if wm.neck_direction is not None:
+            ball_direction = (wm.ball.direction + wm.neck_direction +
+                    180) % 360 - 180
+
+    # the nearest teammate and enemy, by whether they're on our side
+    nearest = {True: nan, False: nan}
+    for p in wm.players:
+        if p.distance is None or p.side is None:
+            continue
+        mate = p.side == wm.side
+        if math.isnan(nearest[mate]) or p.distance < nearest[mate]:
+            nearest[mate] = p.distance
+
+    goal_distance = goal_direction = nan
+    goal = ENEMY_GOALS.get(wm.side)
+    if goal is not None and wm.abs_coords[0] is not None:
+        goal_distance = wm.get_distance_to_point(goal)
+        if wm.abs_body_dir is not None:
+            goal_direction = (wm.get_angle_to_point(goal) + 180) % 360 - 180
+
+    return [wm.play_mode, ball_distance, ball_direction, nearest[True],
+            nearest[False], goal_distance, goal_direction,
+            int(wm.is_ball_kickable())]
+
+def rows(messages, horizon=HORIZON):
+    """
+    Yields a row of COLUMNS for every cycle the agent acted in.  A row's
+    outcome is only known once a goal is scored, or 'horizon' cycles have
+    gone by without one, so only the rows of the last 'horizon' cycles are
+    ever held back.
+    """
+
+    pending = collections.deque()
+    score = None
+
+    for wm, commands in replay(messages):
+        if wm.sim_time is None:
+            continue
+
+        # rows older than the horizon are settled first, so that a goal
+        # after a long stretch without acting isn't put down to them
+        while pending and pending[0][0] < wm.sim_time - horizon:
+            yield pending.popleft() + [NO_OUTCOME]
+
+        # goals for us and against since the last row settle every row
+        # still waiting
+        if wm.side == WorldModel.SIDE_L:
+            now = (wm.score_l, wm.score_r)
+        else:
+            now = (wm.score_r, wm.score_l)
+        if score is not None and now != score:
+            outcome = SCORED if now[0] > score[0] else CONCEDED
+            while pending:
+                yield pending.popleft() + [outcome]
+        score = now
+
+        pending.append([wm.sim_time] + features(wm) + [action(commands)])
+
+    while pending:
+        yield pending.popleft() + [NO_OUTCOME]
+
+def chunks(rows, size):
+    """
+    Groups rows into chunks of at most 'size' rows, each given as one list of
+    values per column, as ColumnWriter.write takes them.
+    """
+
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == size:
+            yield zip(*chunk)
+            chunk = []
+
+    if chunk:
+        yield zip(*chunk)
+
+def extract(args):
+    """
+    Writes the rows of one traffic file to a ColumnStore of its own in the
+    directory 'part', a chunk at a time, and returns the directory.  This is
+    what runs in the worker processes, so each only ever holds one chunk of
+    rows and the rows held back by rows().
+    """
+
+    path, part, chunk_rows, horizon = args
+    writer = ColumnWriter(part, KINDS)
+    for chunk in chunks(rows(read_traffic(path), horizon), chunk_rows):
+        writer.write(chunk)
+    writer.close()
+
+    return part
+
+def build(paths, output, processes=None, chunk_rows=4096, horizon=HORIZON):
+    """
+    Extracts the rows of every traffic file, several files at once in a pool
+    of worker processes, and writes them to a ColumnStore in the directory
+    'output'.  Every file's rows are written to a store of its own on disk
+    first, which is appended to the output a chunk at a time once its turn
+    comes, so only pending file names pile up between the workers and us.
+    Returns the store, memory mapped.
+    """
+
+    writer = ColumnWriter(output, KINDS)
+    parts = tempfile.mkdtemp(prefix="parts", dir=output)
+    pool = Pool(processes)
+    try:
+        for part in pool.imap(extract, [(p, os.path.join(parts, str(i)),
+                chunk_rows, horizon) for i, p in enumerate(paths)]):
+            writer.write_store(ColumnStore.load(part), chunk_rows)
+            shutil.rmtree(part)
+    finally:
+        pool.close()
+        pool.join()
+        shutil.rmtree(parts, ignore_errors=True)
+
+    return writer.close()
+
+def dataset(path, target="action"):
+    """
+    Returns a learning.DataSet of the store at path, memory mapped, that
+    predicts the given column from the FEATURES.
+    """
+
+    return DataSet(examples=ColumnStore.load(path), attrnames=COLUMNS,
+            target=target, inputs=FEATURES, name=os.path.basename(path))
+
+if __name__ == "__main__":
+    # enforce correct number of arguments, print help otherwise
+    if len(sys.argv) < 2:
+        print "args: ./match_data.py <output dir> [traffic files...]"
+        sys.exit()
+
+    paths = sys.argv[2:] or glob.glob(os.path.join(
+        traffic.DEFAULT_DIRECTORY or "traffic", "*.traffic"))
+    if not paths:
+        print "No traffic to extract rows from."
+        sys.exit(1)
+
+    start = time.time()
+    store = build(paths, sys.argv[1])
+    print "Extracted %d rows from %d files in %.1fs, saved to %s." % (
+            len(store), len(paths), time.time() - start, sys.argv[1])
+
+    actions = store.column(COLUMNS.index("action"))
+    outcomes = store.column(COLUMNS.index("outcome"))
+    for name in sorted(set(actions)):
+        mine = outcomes[actions == name]
+        print "%-8s %7d rows, %5d before scoring, %5d before conceding" % (
+                name, len(mine), (mine == SCORED).sum(),
+                (mine == CONCEDED).sum())
@@ -0,0 +1,314 @@
+#!/usr/bin/env python
+
+# Path planning around other players, shared by all agent types
+
+import collections
+import math
+import time
+
+import numpy as np
+
+from aima_python.search import Problem, astar_search
+from intercept import visible_players
+from soccerpy import logger
+
+# how one cycle's path was found: 'reuse' if last cycle's path still held,
+# 'repair' if only its end was planned again, 'full' for a whole new plan, and
+# 'budget' if planning ran out of time and we fell back to a straight line.
+# expansions is the number of nodes A* expanded, elapsed the seconds it took.
+PlanStats = collections.namedtuple("PlanStats", "mode expansions elapsed")
+
+# the eight moves between grid cells, and their lengths in cells
+MOVES = [(di, dj) for di in (-1, 0, 1) for dj in (-1, 0, 1) if di or dj]
+MOVE_LENGTHS = dict((m, math.hypot(*m)) for m in MOVES)
+
+class BudgetExceeded(Exception):
+    """
+    Raised by a GridProblem when a search has expanded as many nodes, or taken
+    as long, as it's allowed to.
+    """
+
+class GridProblem(Problem):
+    """
+    Getting from one cell of a grid over the field to another, for the aima
+    search functions.  States are (i, j) cells and every cell connects to its
+    eight neighbours.  A move costs its length in metres, stretched by the
+    penalty of the cell it enters, so crowded cells cost more to cross but
+    never less than their length.  The straight line distance ignoring
+    penalties (octile, since moves are in eight directions) is therefore an
+    admissible heuristic.
+
+    Searches are bounded: successor raises BudgetExceeded once it has been
+    called max_expansions times, or after max_time seconds.
+    """
+
+    def __init__(self, initial, goal, penalty, cell_size, max_expansions,
+            max_time):
+        """
+        penalty: the (nx, ny) nested list of cell penalties.
+        cell_size: the width of a cell, in metres.
+        """
+
+        Problem.__init__(self, initial, goal)
+        self.penalty = penalty
+        self.cell_size = cell_size
+        self.nx = len(penalty)
+        self.ny = len(penalty[0])
+        self.max_expansions = max_expansions
+        self.deadline = time.time() + max_time
+        self.expansions = 0
+
+    def successor(self, cell):
+        self.expansions += 1
+        if (self.expansions > self.max_expansions or
+                time.time() > self.deadline):
+            raise BudgetExceeded()
+
+        i, j = cell
+        return [(m, (i + m[0], j + m[1])) for m in MOVES
+                if 0 <= i + m[0] < self.nx and 0 <= j + m[1] < self.ny]
+
+    def path_cost(self, c, cell, move, next_cell):
+        penalty = self.penalty[next_cell[0]][next_cell[1]]
+        return c + MOVE_LENGTHS[move] * self.cell_size * (1.0 + penalty)
+
+    def h(self, node):
+        di = abs(node.state[0] - self.goal[0])
+        dj = abs(node.state[1] - self.goal[1])
+        return self.cell_size * (max(di, dj) +
+                (math.sqrt(2) - 1) * min(di, dj))
+
+class Navigator:
+    """
+    Runs us to points on the field around other players, rather than straight
+    through them.
+
+    The field is split into a grid whose cells are penalized for how close
+    they are to visible players, opponents much more than teammates, and
+    paths are found with the aima A* search over it.
+
+    Plans are kept from one cycle to the next.  The goal usually moves a
+    little every cycle (a ball being chased, a player being marked), which is
+    why the plan isn't rooted at the goal as in D* Lite: that tree would have
+    to be rebuilt every cycle.  Instead, last cycle's path is checked against
+    this cycle's penalties.  If it still holds, it's reused as is.  If only
+    its end changed, because the goal moved or a player stepped onto it, just
+    that end is planned again from the last good cell.  Whole new plans are
+    only made when we've left the path, or every 'refresh_cycles' to pick up
+    shortcuts that opened up.
+
+    Only the first 'horizon' metres towards the goal are planned, since
+    players further away will have moved by the time we get there.  On top of
+    that every search is capped at 'max_expansions' nodes and 'max_time'
+    seconds, so planning never costs more than that per cycle.  When a search
+    runs out, we head straight for the goal that cycle, as we used to.  What every
+    cycle's planning took is kept in 'stats' and logged at debug level.
+    """
+
+    def __init__(self, wm, log=None, cell_size=2.5, margin=3.0,
+            enemy_penalty=4.0, mate_penalty=1.0, player_radius=4.0,
+            tolerance=0.5, repair_cells=4, refresh_cycles=20, lookahead=2,
+            horizon=20.0, max_expansions=200, max_time=0.008, dash_angle=7.0):
+        """
+        wm: the WorldModel we navigate for.
+        log: the AgentLogger plans are logged to at debug level.
+        cell_size: the width of a grid cell, in metres.
+        margin: how far outside the field lines the grid reaches, in metres.
+        enemy_penalty, mate_penalty: the penalty of a cell right where an
+            opponent or teammate stands.  it falls linearly to 0 at
+            'player_radius' metres from them.
+        tolerance: how much a cell's penalty can grow before a path through it
+            no longer holds.
+        repair_cells: how many cells before the end, or before a cell that no
+            longer holds, a repair plans again from.
+        refresh_cycles: cycles between whole new plans.
+        lookahead: how many cells down the path we aim for.
+        horizon: how far towards the goal we plan, in metres.
+        max_expansions, max_time: the bounds on every search.
+        dash_angle: the most degrees off the way to go that we still dash at.
+        """
+
+        self.wm = wm
+        self.log = log or logger.AgentLogger(logger.OFF)
+        self.cell_size = cell_size
+        self.enemy_penalty = enemy_penalty
+        self.mate_penalty = mate_penalty
+        self.player_radius = player_radius
+        self.tolerance = tolerance
+        self.repair_cells = repair_cells
+        self.refresh_cycles = refresh_cycles
+        self.lookahead = lookahead
+        self.horizon = horizon
+        self.max_expansions = max_expansions
+        self.max_time = max_time
+        self.dash_angle = dash_angle
+
+        # the grid covers the field and its margins, cell (0, 0) at the bottom
+        # left.  centers holds the (x, y) of every cell's middle.
+        self.origin = np.array((-52.5 - margin, -34.0 - margin))
+        size = np.array((105.0, 68.0)) + 2 * margin
+        self.shape = tuple(np.ceil(size / cell_size).astype(int))
+        xs = self.origin[0] + (np.arange(self.shape[0]) + 0.5) * cell_size
+        ys = self.origin[1] + (np.arange(self.shape[1]) + 0.5) * cell_size
+        self.centers = np.dstack(np.meshgrid(xs, ys, indexing="ij"))
+
+        # the current plan: its cells from where we were, the penalties they
+        # had when it was made, and the cycle it was last made from scratch.
+        self.path = []
+        self.path_penalties = []
+        self.planned_at = None
+
+        self.stats = None
+
+    def cell(self, point):
+        """
+        Returns the grid cell the given (x, y) is in, clamped to the grid.
+        """
+
+        i, j = ((np.asarray(point, dtype=float) - self.origin) //
+                self.cell_size).astype(int)
+        return (int(min(max(i, 0), self.shape[0] - 1)),
+                int(min(max(j, 0), self.shape[1] - 1)))
+
+    def center(self, cell):
+        """
+        Returns the (x, y) middle of the given grid cell.
+        """
+
+        return tuple(self.centers[cell])
+
+    def penalties(self):
+        """
+        Returns the (nx, ny) array of how crowded every cell is, from the
+        players we can see.
+        """
+
+        players, coords, mates = visible_players(self.wm)
+        penalty = np.zeros(self.shape)
+        if len(coords) == 0:
+            return penalty
+
+        # (players, nx, ny) distances from every player to every cell
+        offsets = self.centers[np.newaxis] - coords[:, np.newaxis, np.newaxis]
+        near = np.maximum(1.0 - np.hypot(offsets[..., 0], offsets[..., 1]) /
+                self.player_radius, 0.0)
+        weights = np.where(mates, self.mate_penalty, self.enemy_penalty)
+
+        return np.tensordot(weights, near, axes=1)
+
+    def plan(self, start, goal):
+        """
+        Plans a way from the (x, y) start to the (x, y) goal.  Returns the
+        list of points to pass through, starting where we are and ending at
+        the goal itself.
+        """
+
+        began = time.time()
+        penalty = self.penalties()
+        start_cell = self.cell(start)
+
+        # beyond the horizon, we plan for the point on the way there
+        start = np.asarray(start, dtype=float)
+        offset = np.asarray(goal, dtype=float) - start
+        distance = np.hypot(*offset)
+        if distance > self.horizon:
+            goal = tuple(start + offset * (self.horizon / distance))
+        goal_cell = self.cell(goal)
+        t = self.wm.sim_time
+
+        mode, expansions = self.__replan(penalty, start_cell, goal_cell, t)
+        if mode == "budget":
+            self.path = []
+            points = [tuple(start), tuple(goal)]
+        else:
+            self.path_penalties = [penalty[c] for c in self.path]
+            points = [self.center(c) for c in self.path[:-1]] + [tuple(goal)]
+
+        self.stats = PlanStats(mode, expansions, time.time() - began)
+        self.log.debug("plan", mode=mode, expansions=expansions,
+                ms=round(self.stats.elapsed * 1000, 2), cells=len(self.path))
+
+        return points
+
+    def __replan(self, penalty, start_cell, goal_cell, t):
+        """
+        Brings self.path up to date for this cycle, reusing as much of it as
+        still holds.  Returns the mode it was planned in and how many nodes
+        were expanded.
+        """
+
+        # find ourselves on the path, we've usually moved on a cell or two
+        here = None
+        for k, c in enumerate(self.path[:self.lookahead + 2]):
+            if max(abs(c[0] - start_cell[0]), abs(c[1] - start_cell[1])) <= 1:
+                here = k
+
+        stale = (self.planned_at is None or t is None or
+                t - self.planned_at >= self.refresh_cycles)
+        if here is None or stale:
+            return self.__search(penalty, start_cell, goal_cell, t, [])
+
+        path = self.path[here:]
+        penalties = np.array(self.path_penalties[here:])
+        now = np.array([penalty[c] for c in path])
+
+        # the first cell that got more crowded than when we planned through it
+        worse = np.nonzero(now > penalties + self.tolerance)[0]
+        if len(worse) == 0 and path[-1] == goal_cell:
+            self.path = path
+            return "reuse", 0
+
+        bad = worse[0] if len(worse) else len(path)
+        keep = max(bad - self.repair_cells, 1)
+        mode, expansions = self.__search(penalty, path[keep - 1], goal_cell,
+                None, path[:keep - 1])
+        if mode == "full":
+            mode = "repair"
+
+        return mode, expansions
+
+    def __search(self, penalty, from_cell, goal_cell, t, prefix):
+        """
+        Runs a bounded A* from from_cell to goal_cell, and sets self.path to
+        the given prefix followed by what it found.
+        """
+
+        problem = GridProblem(from_cell, goal_cell, penalty.tolist(),
+                self.cell_size, self.max_expansions, self.max_time)
+        try:
+            node = astar_search(problem)
+        except BudgetExceeded:
+            return "budget", problem.expansions
+
+        self.path = prefix + [n.state for n in reversed(node.path())]
+        if t is not None:
+            self.planned_at = t
+
+        return "full", problem.expansions
+
+    def go_to(self, point, power):
+        """
+        Turns or dashes, whichever gets us along our planned way to the given
+        point.  If we don't know where we are or which way we face, we just
+        dash.  Returns the stats of this cycle's plan, or None if we couldn't
+        plan.
+        """
+
+        wm = self.wm
+        if wm.abs_coords[0] is None or wm.abs_body_dir is None:
+            wm.ah.dash(power)
+            return None
+
+        points = self.plan(wm.abs_coords, point)
+        target = points[min(self.lookahead, len(points) - 1)]
+
+        # face our next waypoint first, since only one turn or dash is sent
+        # per cycle
+        rel_dir = wm.get_angle_to_point(target)
+        rel_dir = (rel_dir + 180) % 360 - 180
+        if -self.dash_angle <= rel_dir <= self.dash_angle:
+            wm.ah.dash(power)
+        else:
+            wm.ah.turn(rel_dir)
+
+        return self.stats
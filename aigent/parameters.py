@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+
+# The tunable thresholds and powers of the agents' heuristics
+
+import json
+import os
+
+# every parameter as (name, default, lowest, highest, step).  the defaults are
+# the values the heuristics were written with, and steps are what a sweep
+# moves a parameter by at a time.
+PARAMETERS = (
+    # distances, in metres
+    ("ball_close", 10.0, 2.0, 30.0, 1.0),
+    ("goalpos_close", 20.0, 8.0, 40.0, 1.0),
+    ("chase_radius", 30.0, 5.0, 60.0, 1.0),
+    ("defend_radius", 55.0, 20.0, 80.0, 1.0),
+    ("home_radius", 40.0, 15.0, 60.0, 1.0),
+    ("defender_stray", 15.0, 5.0, 40.0, 1.0),
+    ("goalie_stray", 5.0, 1.0, 20.0, 1.0),
+    ("goalie_radius", 10.0, 3.0, 25.0, 1.0),
+    # the distance a pass is kicked with full extra power for
+    ("pass_range", 27.5, 10.0, 55.0, 2.5),
+    # the angle, in degrees, an enemy has to be off a pass line to leave it clear
+    ("clear_angle", 20.0, 5.0, 60.0, 1.0),
+    # dash powers
+    ("kickoff_dash", 50.0, 20.0, 100.0, 5.0),
+    ("chase_dash", 65.0, 20.0, 100.0, 5.0),
+    ("dribble_dash", 50.0, 20.0, 100.0, 5.0),
+    ("intercept_dash", 60.0, 20.0, 100.0, 5.0),
+    ("defend_dash", 80.0, 20.0, 100.0, 5.0),
+    ("advance_dash", 70.0, 20.0, 100.0, 5.0),
+    ("retreat_dash", 50.0, 20.0, 100.0, 5.0),
+    ("return_dash", 70.0, 20.0, 100.0, 5.0),
+    ("goalie_return_dash", 30.0, 10.0, 100.0, 5.0),
+)
+
+NAMES = tuple(p[0] for p in PARAMETERS)
+DEFAULTS = tuple(p[1] for p in PARAMETERS)
+LOWS = tuple(p[2] for p in PARAMETERS)
+HIGHS = tuple(p[3] for p in PARAMETERS)
+STEPS = tuple(p[4] for p in PARAMETERS)
+
+def clip(vector):
+    """
+    Returns the given parameter vector with every value snapped to its step and
+    kept within its bounds, as a tuple.
+    """
+
+    return tuple(min(max(round((v - lo) / step) * step + lo, lo), hi)
+            for v, lo, hi, step in zip(vector, LOWS, HIGHS, STEPS))
+
+def to_dict(vector):
+    """
+    Returns a {name: value} dict for the given parameter vector.
+    """
+
+    return dict(zip(NAMES, vector))
+
+def to_vector(params):
+    """
+    Returns the parameter vector for a {name: value} dict, taking defaults for
+    any parameters left out.
+    """
+
+    return tuple(params.get(name, default)
+            for name, default in zip(NAMES, DEFAULTS))
+
+def load(source=None):
+    """
+    Returns the {name: value} parameters to play with.  'source' is a JSON
+    object of parameters, or the path to a file holding one, and defaults to
+    the AGENT_PARAMS environment variable.  Anything not given keeps its
+    default.
+    """
+
+    if source is None:
+        source = os.environ.get("AGENT_PARAMS")
+
+    params = {}
+    if source:
+        if source.lstrip().startswith("{"):
+            params = json.loads(source)
+        else:
+            with open(source) as f:
+                params = json.load(f)
+
+    unknown = set(params) - set(NAMES)
+    if unknown:
+        raise KeyError("Unknown parameters: %s" % ", ".join(sorted(unknown)))
+
+    return to_dict(to_vector(params))
+
+# the parameters this process plays with
+PARAMS = load()
@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+
+# Pass option evaluation over all visible teammates at once
+
+import collections
+
+import numpy as np
+
+from intercept import visible_players
+
+# a scored pass: its score (higher is better), the (x, y) point to kick to, the
+# teammate expected to receive it, the estimated chance it arrives, and how many
+# cycles the ball takes to get there.
+PassOption = collections.namedtuple("PassOption",
+        "score target receiver success cycles")
+
+class PassEvaluator:
+    """
+    Scores passes to every visible teammate, both to their feet and to lead
+    points around them, against every visible opponent in one vectorized pass.
+
+    A pass is safe when, at every point along its line, the ball gets there
+    before any opponent could (see InterceptSolver.line_margins), and its
+    receiver can get to the target no later than the ball does.  Safe passes
+    are then preferred by how much closer they bring the ball to the enemy goal.
+
+    The number of candidate targets is fixed by the lead pattern and capped by
+    'max_targets', so an evaluation costs the same bounded amount of array work
+    every cycle no matter how crowded the field is.
+    """
+
+    def __init__(self, solver, lead_distances=(4.0, 8.0), lead_directions=8,
+            arrival_speed=0.8, samples=8, max_targets=200, max_options=10,
+            sharpness=1.5, progress_weight=0.05):
+        """
+        solver: the InterceptSolver whose ball and player models are used.
+        lead_distances, lead_directions: lead points are sampled on circles of
+            these radii around each teammate, in this many directions.
+        arrival_speed: the speed the ball should still have at its target.
+        samples: points sampled along each pass line.
+        max_targets: cap on the total number of candidate targets.
+        max_options: how many of the best options are returned.
+        sharpness: how steeply the success estimate rises with cycle margin.
+        progress_weight: score bonus per unit of distance gained toward goal.
+        """
+
+        self.solver = solver
+        self.arrival_speed = arrival_speed
+        self.samples = samples
+        self.max_targets = max_targets
+        self.max_options = max_options
+        self.sharpness = sharpness
+        self.progress_weight = progress_weight
+
+        # unit offsets of all lead points, plus the teammate's own position
+        angles = np.arange(lead_directions) * (2 * np.pi / lead_directions)
+        offsets = [(0.0, 0.0)]
+        for r in lead_distances:
+            offsets.extend(zip(r * np.cos(angles), r * np.sin(angles)))
+        self.offsets = np.array(offsets)
+
+    def evaluate(self, wm, goal_pos):
+        """
+        Returns a list of the best PassOption tuples for the world model's
+        current state, best first.  Passes that are out of kicking range are
+        left out.  Returns an empty list if we can't place ourselves or see no
+        teammates.
+        """
+
+        if wm.abs_coords[0] is None:
+            return []
+
+        players, coords, mates = visible_players(wm)
+        if not mates.any():
+            return []
+
+        origin = np.asarray(wm.abs_coords, dtype=float)
+        receivers = [p for p, m in zip(players, mates) if m]
+        mate_coords = coords[mates]
+        opponents = coords[~mates]
+
+        # every teammate with every offset, capped at max_targets
+        targets = (mate_coords[:, np.newaxis, :] +
+                self.offsets[np.newaxis, :, :]).reshape(-1, 2)
+        owner = np.repeat(np.arange(len(receivers)), len(self.offsets))
+        targets = targets[:self.max_targets]
+        owner = owner[:self.max_targets]
+
+        # kick every target so that the ball still rolls on arrival
+        deltas = targets - origin
+        lengths = np.hypot(deltas[:, 0], deltas[:, 1])
+        speeds = self.solver.kick_speed(lengths, self.arrival_speed)
+        margins, cycles = self.solver.line_margins(origin, targets, speeds,
+                opponents, samples=self.samples)
+
+        # the receiver has to make it to its target in time for the ball
+        sp = self.solver.server_parameters
+        run = np.hypot(*(targets - mate_coords[owner]).T) - sp.kickable_margin
+        receive = (np.maximum(run, 0) / sp.player_speed_max +
+                (run > 0) * self.solver.turn_cycles)
+        margins = np.minimum(margins, cycles - receive)
+
+        # chance of success rises with the margin, score adds goal progress
+        success = 1.0 / (1.0 + np.exp(-self.sharpness *
+                np.clip(margins, -50, 50)))
+        progress = (np.hypot(*(origin - goal_pos)) -
+                np.hypot(*(targets - np.asarray(goal_pos, dtype=float)).T))
+        scores = success * (1.0 + self.progress_weight * progress)
+
+        # rank what the ball can actually reach, keeping the best few
+        order = np.argsort(-scores, kind="mergesort")
+        order = order[np.isfinite(cycles[order])][:self.max_options]
+        return [PassOption(score, tuple(target), receivers[i], chance, n)
+                for score, target, i, chance, n in zip(scores[order].tolist(),
+                    targets[order].tolist(), owner[order].tolist(),
+                    success[order].tolist(), cycles[order].tolist())]
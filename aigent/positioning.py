@@ -0,0 +1,194 @@
+#!/usr/bin/env python
+
+# Where to stand off the ball, solved offline as MDPs over the field
+
+import os
+import sys
+import time
+
+import numpy as np
+
+from aima_python.mdp import ArrayGridMDP, array_policy_iteration
+
+# the field, split into a grid of cells, and the ball's position split into
+# coarser zones.  there's one policy per role and ball zone.
+FIELD = (105.0, 68.0)
+GRID = (100, 70)
+ZONES = (6, 4)
+
+# a player moves one cell in any of eight directions per step, or stays put
+MOVES = [(dx, dy) for dx in (-1, 0, 1) for dy in (-1, 0, 1)]
+STAY = MOVES.index((0, 0))
+
+# where the tables are kept once built
+PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+        "positioning.npz")
+
+# everything is worked out as if we play on the left
+OWN_GOAL = np.array((-52.5, 0.0))
+ENEMY_GOAL = np.array((52.5, 0.0))
+
+def cell_centers(shape, size):
+    """
+    Returns the (x, y) middle of every cell of a grid of the given shape laid
+    over a field of the given size, as an (nx, ny, 2) array.
+    """
+
+    xs = (np.arange(shape[0]) + 0.5) * size[0] / shape[0] - size[0] / 2
+    ys = (np.arange(shape[1]) + 0.5) * size[1] / shape[1] - size[1] / 2
+    return np.dstack(np.meshgrid(xs, ys, indexing="ij"))
+
+def striker_target(ball):
+    """
+    Where a striker wants to be with the ball at the given point: ahead of the
+    ball and towards the middle, but not beyond the edge of the box.
+    """
+
+    return np.array((min(ball[0] + 20.0, 36.0), 0.5 * ball[1]))
+
+def defender_target(ball):
+    """
+    Where a defender wants to be with the ball at the given point: between it
+    and our goal, a third of the way out.
+    """
+
+    return OWN_GOAL + (ball - OWN_GOAL) / 3.0
+
+# the roles there are policies for, by the target their rewards center on
+ROLES = {
+    "striker": striker_target,
+    "defender": defender_target,
+}
+
+def rewards(role, ball, centers, spread=8.0):
+    """
+    Returns the (nx, ny) rewards of every cell for a role with the ball at the
+    given point.  Every cycle spent away from the role's target costs up to
+    1, less the closer the cell is to it.  Defenders also pay for standing in
+    our own penalty box, which is the goalie's.
+    """
+
+    target = ROLES[role](np.asarray(ball, dtype=float))
+    d2 = ((centers - target) ** 2).sum(axis=2)
+    r = np.exp(-d2 / (2 * spread ** 2)) - 1.0
+
+    if role == "defender":
+        box = (centers[..., 0] < -36.0) & (np.abs(centers[..., 1]) < 20.16)
+        r[box] -= 0.5
+
+    return r
+
+def build(gamma=0.95, log=None):
+    """
+    Solves every role's positioning MDP for every ball zone, by modified
+    policy iteration.  Returns {role: (zx, zy, nx, ny) int8 array of moves}.
+    """
+
+    centers = cell_centers(GRID, FIELD)
+    zones = cell_centers(ZONES, FIELD)
+
+    tables = {}
+    for role in sorted(ROLES):
+        table = np.empty(ZONES + GRID, dtype=np.int8)
+        for zx in xrange(ZONES[0]):
+            for zy in xrange(ZONES[1]):
+                start = time.time()
+                mdp = ArrayGridMDP(rewards(role, zones[zx, zy], centers),
+                        actlist=MOVES, gamma=gamma, probs=(0.8, 0.1, 0.1),
+                        turns=(0, -45, 45))
+                pi, U = array_policy_iteration(mdp)
+                table[zx, zy] = mdp.to_grid(pi, fill=STAY)
+
+                if log is not None:
+                    log("%s, ball zone %d,%d: %.2fs" % (role, zx, zy,
+                        time.time() - start))
+
+        tables[role] = table
+
+    return tables
+
+def save(tables, path=PATH):
+    """
+    Saves built tables, replacing the file at once so that agents starting at
+    the same time never read half of it.
+    """
+
+    tmp = "%s.%d.npz" % (path[:-len(".npz")], os.getpid())
+    np.savez_compressed(tmp, grid=np.array(GRID), zones=np.array(ZONES),
+            **tables)
+    os.rename(tmp, path)
+
+def load(path=PATH):
+    """
+    Returns the PositioningPolicy of the tables at the given path, building
+    and saving them first if they're missing or were built for another grid.
+    """
+
+    if os.path.exists(path):
+        data = np.load(path)
+        if (tuple(data["grid"]) == GRID and tuple(data["zones"]) == ZONES and
+                all(role in data for role in ROLES)):
+            return PositioningPolicy(dict((r, data[r]) for r in ROLES))
+
+    tables = build()
+    save(tables, path)
+    return PositioningPolicy(tables)
+
+class PositioningPolicy:
+    """
+    Looks up where to stand off the ball, from tables of the best move in
+    every cell of the field for every ball zone.  A lookup is a handful of
+    array reads, cheap enough to do every cycle.
+    """
+
+    def __init__(self, tables):
+        """
+        tables: {role: (zx, zy, nx, ny) array of indices into MOVES}, as
+            built by build().
+        """
+
+        self.tables = tables
+        self.centers = cell_centers(GRID, FIELD)
+
+    def __cell(self, point, shape):
+        """
+        Returns the cell of a grid of the given shape that point is in.
+        """
+
+        i = int((point[0] + FIELD[0] / 2) * shape[0] / FIELD[0])
+        j = int((point[1] + FIELD[1] / 2) * shape[1] / FIELD[1])
+        return (min(max(i, 0), shape[0] - 1), min(max(j, 0), shape[1] - 1))
+
+    def waypoint(self, role, left, coords, ball, steps=5):
+        """
+        Returns the point 'steps' moves down the role's policy from coords,
+        with the ball at the given point, or the point the policy stays at if
+        that comes first.  'left' says whether we play on the left; the tables
+        are mirrored for the right.
+        """
+
+        flip = 1 if left else -1
+        coords = (flip * coords[0], coords[1])
+        ball = (flip * ball[0], ball[1])
+
+        table = self.tables[role][self.__cell(ball, ZONES)]
+        cell = self.__cell(coords, GRID)
+        for i in xrange(steps):
+            move = table[cell]
+            if move == STAY:
+                break
+            dx, dy = MOVES[move]
+            cell = (cell[0] + dx, cell[1] + dy)
+
+        x, y = self.centers[cell]
+        return (flip * x, y)
+
+if __name__ == "__main__":
+    def report(line):
+        print line
+        sys.stdout.flush()
+
+    start = time.time()
+    save(build(log=report))
+    print "Built %d positioning tables in %.1fs, saved to %s." % (
+            len(ROLES) * ZONES[0] * ZONES[1], time.time() - start, PATH)
@@ -0,0 +1,185 @@
+#!/usr/bin/env python
+
+# Scripted training scenarios for tuning single behaviours with the trainer
+
+import random
+import sys
+
+from soccerpy.trainer import Trainer, Scenario, GOAL_L, GOAL_R
+from soccerpy.world_model import WorldModel
+
+# where a left side team attacks, and where it defends
+ENEMY_GOAL = (52.5, 0)
+OWN_GOAL = (-52.5, 0)
+
+class TeamScenario(Scenario):
+    """
+    A Scenario for one of our players, laid out as if we play on the left and
+    mirrored if we don't.  Starting places are drawn afresh for every episode,
+    within 'spread' of the given ones, so that a batch of episodes covers a
+    patch of the field rather than a single point.
+    """
+
+    def __init__(self, name, cycles, team, side, ball, players, spread=0.0,
+            seed=None):
+        """
+        team, side: our team's name and the side it plays on.
+        ball, players: starting places, see Scenario.  players are given by
+            uniform number and belong to our team.
+        spread: how far starting places may stray from the given ones.
+        seed: seeds the random starting places, for repeatable batches.
+        """
+
+        Scenario.__init__(self, name, cycles, ball)
+        self.team = team
+        self.side = side
+        self.spread = spread
+        self.places = players
+        self.random = random.Random(seed)
+
+        # mirrors x coordinates and directions for the right side
+        self.flip = 1 if side == WorldModel.SIDE_L else -1
+        self.base_ball = ball
+
+    def jitter(self, point):
+        """
+        Returns the given (x, y) moved randomly within the spread, mirrored
+        for our side.
+        """
+
+        dx = self.random.uniform(-self.spread, self.spread)
+        dy = self.random.uniform(-self.spread, self.spread)
+        return (self.flip * (point[0] + dx), point[1] + dy)
+
+    def setup(self, trainer):
+        """
+        Draws this episode's starting places, then puts everything there.
+        """
+
+        self.ball = self.jitter(self.base_ball)
+        self.players = {}
+        for uniform_number, place in self.places.items():
+            x, y = self.jitter(place)
+            direction = 0 if self.flip == 1 else 180
+            self.players[(self.team, uniform_number)] = (x, y, direction)
+
+        Scenario.setup(self, trainer)
+
+    def scored(self, state):
+        """
+        Returns whether our team scored by the given state.
+        """
+
+        return state.play_mode == (GOAL_L if self.flip == 1 else GOAL_R)
+
+    def conceded(self, state):
+        """
+        Returns whether the other team scored by the given state.
+        """
+
+        return state.play_mode == (GOAL_R if self.flip == 1 else GOAL_L)
+
+class ShootScenario(TeamScenario):
+    """
+    A striker with the ball at its feet around the edge of the box.  Scores 1
+    for a goal, otherwise up to 0.5 for how close to the goal the ball got.
+    """
+
+    def __init__(self, team, side, uniform_number=9, cycles=50, spread=5.0,
+            seed=None):
+        TeamScenario.__init__(self, "shoot", cycles, team, side, (36.5, 0),
+                {uniform_number: (36, 0)}, spread, seed)
+
+    def score(self, states):
+        if not states:
+            return 0.0
+        if self.scored(states[-1]):
+            return 1.0
+
+        # the closest the ball came to the middle of the goal
+        goal = (self.flip * ENEMY_GOAL[0], ENEMY_GOAL[1])
+        closest = min(((s.ball[0] - goal[0]) ** 2 +
+                (s.ball[1] - goal[1]) ** 2) ** 0.5 for s in states)
+        return 0.5 * max(0.0, 1.0 - closest / 20.0)
+
+class DribbleScenario(TeamScenario):
+    """
+    A striker with the ball in the middle of the field.  Scores how far up the
+    field the ball got, in metres, or 0 if play stopped for anything but our
+    goal.
+    """
+
+    def __init__(self, team, side, uniform_number=9, cycles=100, spread=5.0,
+            seed=None):
+        TeamScenario.__init__(self, "dribble", cycles, team, side, (0.5, 0),
+                {uniform_number: (0, 0)}, spread, seed)
+
+    def score(self, states):
+        if not states:
+            return 0.0
+
+        end = states[-1]
+        if self.scored(end):
+            return ENEMY_GOAL[0] - self.flip * self.ball[0]
+        if end.play_mode != self.play_mode:
+            return 0.0
+
+        return self.flip * (end.ball[0] - self.ball[0])
+
+class GoalieScenario(TeamScenario):
+    """
+    A shot at our goal from the edge of the box, aimed somewhere within the
+    goal mouth, with our goalie on its line.  Scores 1 if the goalie keeps it
+    out, 0 if not.
+    """
+
+    def __init__(self, team, side, uniform_number=3, cycles=40, spread=4.0,
+            shot_speed=2.0, seed=None):
+        TeamScenario.__init__(self, "goalie", cycles, team, side, (-36, 0),
+                {uniform_number: (-50, 0)}, spread, seed)
+        self.shot_speed = shot_speed
+
+    def setup(self, trainer):
+        TeamScenario.setup(self, trainer)
+
+        # fire the ball at a random point of the goal mouth
+        target = (self.flip * OWN_GOAL[0], self.random.uniform(-6.0, 6.0))
+        dx = target[0] - self.ball[0]
+        dy = target[1] - self.ball[1]
+        norm = (dx ** 2 + dy ** 2) ** 0.5
+        trainer.move_ball(self.ball[0], self.ball[1],
+                self.shot_speed * dx / norm, self.shot_speed * dy / norm)
+
+    def score(self, states):
+        if states and self.conceded(states[-1]):
+            return 0.0
+        return 1.0
+
+SCENARIOS = {
+    "shoot": ShootScenario,
+    "dribble": DribbleScenario,
+    "goalie": GoalieScenario,
+}
+
+if __name__ == "__main__":
+    # enforce correct number of arguments, print help otherwise
+    if len(sys.argv) < 3:
+        print "args: ./scenarios.py <%s> <episodes> [team] [side]" % \
+                "|".join(sorted(SCENARIOS))
+        sys.exit()
+
+    team = sys.argv[3] if len(sys.argv) > 3 else "Keng"
+    side = sys.argv[4] if len(sys.argv) > 4 else WorldModel.SIDE_L
+    scenario = SCENARIOS[sys.argv[1]](team, side)
+
+    trainer = Trainer()
+    trainer.connect()
+    try:
+        episodes = trainer.run_episodes(scenario, int(sys.argv[2]))
+    finally:
+        trainer.disconnect()
+
+    scores = [e.score for e in episodes]
+    print "%s: %d episodes, mean score %.3f, min %.3f, max %.3f" % (
+            scenario.name, len(scores), sum(scores) / len(scores),
+            min(scores), max(scores))
@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+
+# Shot evaluation across the width of the enemy goal
+
+import collections
+
+import numpy as np
+
+from intercept import visible_players
+
+# a scored shot: the (x, y) point in the goal mouth to kick to, the estimated
+# chance it gets past every defender, and how many cycles the ball takes.
+ShotOption = collections.namedtuple("ShotOption", "target success cycles")
+
+class ShotEvaluator:
+    """
+    Picks the best point to shoot at along the enemy goal line.
+
+    Target points are spread across the goal mouth from the server's
+    goal_width, leaving a margin inside each post.  Every shot line is then
+    checked against every visible opponent at once with
+    InterceptSolver.line_margins, for a ball kicked at ball_speed_max.  The
+    goalie gets its catchable area on top of the usual kickable margin.  It is
+    cheap enough to be run every cycle the ball is kickable.
+    """
+
+    def __init__(self, solver, targets=9, post_margin=0.7, samples=10,
+            sharpness=1.5):
+        """
+        solver: the InterceptSolver whose ball and player models are used.
+        targets: how many points are sampled across the goal mouth.
+        post_margin: distance kept from each post, in case of kick noise.
+        samples: points sampled along each shot line.
+        sharpness: how steeply the success estimate rises with cycle margin.
+        """
+
+        self.solver = solver
+        self.targets = targets
+        self.post_margin = post_margin
+        self.samples = samples
+        self.sharpness = sharpness
+
+    def goal_targets(self, goal_pos):
+        """
+        Returns a (targets, 2) array of points across the goal mouth centered
+        on the given goal position.
+        """
+
+        half = self.solver.server_parameters.goal_width / 2.0 - self.post_margin
+        ys = goal_pos[1] + np.linspace(-half, half, self.targets)
+
+        points = np.empty((self.targets, 2))
+        points[:, 0] = goal_pos[0]
+        points[:, 1] = ys
+
+        return points
+
+    def evaluate(self, wm, goal_pos):
+        """
+        Returns the best ShotOption at the given goal for the world model's
+        current state, or None if we can't place ourselves.  The success
+        estimate of a shot out of kicking range is 0.
+        """
+
+        if wm.abs_coords[0] is None:
+            return None
+
+        sp = self.solver.server_parameters
+
+        players, coords, mates = visible_players(wm)
+        opponents = coords[~mates]
+        enemies = [p for p, m in zip(players, mates) if not m]
+
+        # the goalie can reach further, with its hands.  if we can't make out
+        # who the goalie is, assume it's the enemy closest to the goal.
+        goalie = np.array([p.is_goalie for p in enemies], dtype=bool)
+        if len(enemies) > 0 and not goalie.any():
+            to_goal = np.hypot(*(opponents - np.asarray(goal_pos)).T)
+            goalie[to_goal.argmin()] = True
+        extra_reach = goalie * sp.catchable_area_l
+
+        origin = np.asarray(wm.abs_coords, dtype=float)
+        targets = self.goal_targets(goal_pos)
+        margins, cycles = self.solver.line_margins(origin, targets,
+                sp.ball_speed_max, opponents, extra_reach, self.samples)
+
+        # chance of success rises with the margin over the fastest defender
+        success = 1.0 / (1.0 + np.exp(-self.sharpness *
+                np.clip(margins, -50, 50)))
+        success[~np.isfinite(cycles)] = 0.0
+
+        # prefer the biggest margin, the first (closest to center) among ties
+        # is found by ordering targets from the middle out.
+        middle_out = np.argsort(np.abs(targets[:, 1] - goal_pos[1]),
+                kind="mergesort")
+        best = middle_out[success[middle_out].argmax()]
+
+        return ShotOption(tuple(targets[best].tolist()), float(success[best]),
+                float(cycles[best]))
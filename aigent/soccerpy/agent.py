@@ -3,10 +3,15 @@
 import threading
 import time
 import random
+import signal
 
 import sock
 import sp_exceptions
 import handler
+import logger
+import perception
+import profiler
+import traffic
 from world_model import WorldModel
 
 class Agent:
@@ -37,16 +42,43 @@ class Agent:
         # whether we should send commands
         self.__send_commands = False
 
+        # whether the server runs in synchronous mode, and whether it's waiting
+        # for us to finish the current cycle.
+        self.__synchronous = False
+        self.__send_done = False
+
         # adding goal post markers
         self.enemy_goal_pos = None
         self.own_goal_pos = None
 
+        # buffered event log, written to a per-agent file once we're playing
+        self.log = logger.AgentLogger()
+
+        # profiles the next few cycles of our loops when asked to
+        self.profiler = profiler.CycleProfiler(log=self.log)
+
+        # records our recent decisions.  agents with a decision loop set this
+        # to a FlightRecorder in setup_environment.
+        self.recorder = None
+        self.__recorded_match_end = False
+
+        # picks our view width and neck direction, set up in setup_environment
+        self.perception = None
 
-    def connect(self, host, port, teamname, version=11):
+        # records everything we send and receive, if AGENT_TRAFFIC_DIR is set
+        self.traffic = None
+
+
+    def connect(self, host, port, teamname, version=11, synch_see=False):
         """
         Gives us a connection to the server as one player on a team.  This
         immediately connects the agent to the server and starts receiving and
         parsing the information it sends.
+
+        If synch_see is set, we ask the server to send our sees at fixed points
+        in each cycle, which it needs to run faster than real time in
+        synchronous mode.  That mode itself is a server setting, and we follow
+        it whenever the server asks us to think.
         """
 
         # if already connected, raise an error since user may have wanted to
@@ -56,16 +88,21 @@ class Agent:
             raise sp_exceptions.AgentConnectionStateError(msg)
 
         # the pipe through which all of our communication takes place
-        self.__sock = sock.Socket(host, port)
+        if traffic.DEFAULT_DIRECTORY:
+            self.traffic = traffic.TrafficRecorder()
+        self.__sock = sock.Socket(host, port, traffic=self.traffic)
 
         # our models of the world and our body
-        self.wm = WorldModel(handler.ActionHandler(self.__sock))
+        self.wm = WorldModel(handler.ActionHandler(self.__sock, self.log))
 
         # set the team name of the world model to the given name
         self.wm.teamname = teamname
 
+        # stamp log records with the current simulation cycle
+        self.log.clock = lambda: self.wm.sim_time
+
         # handles all messages received from the server
-        self.msg_handler = handler.MessageHandler(self.wm)
+        self.msg_handler = handler.MessageHandler(self.wm, self.log)
 
         # set up our threaded message receiving system
         self.__parsing = True # tell thread that we're currently running
@@ -88,6 +125,10 @@ class Agent:
         while self.__sock.address == init_address:
             time.sleep(0.0001)
 
+        # the server acknowledges this with an 'ok', see MessageHandler
+        if synch_see:
+            self.__sock.send("(synch_see)")
+
         # create our thinking thread.  this will perform the actions necessary
         # to play a game of robo-soccer.
         self.__thinking = False
@@ -116,9 +157,33 @@ class Agent:
             raise sp_exceptions.AgentAlreadyPlayingError(
                 "Agent is already playing.")
 
+        # we know who we are by now, so start writing our own log file
+        name = "%s_%s_%s" % (self.wm.teamname, self.wm.side,
+                self.wm.uniform_number)
+        self.log.open(name)
+        if self.traffic is not None:
+            self.traffic.open(name)
+
+        # let SIGUSR1 request a profile.  signals can only be set up from the
+        # main thread, if we're not in it profiles must be requested directly.
+        self.profiler.name = name
+        try:
+            self.profiler.install_signal()
+        except ValueError:
+            pass
+
         # run the method that sets up the agent's persistant variables
         self.setup_environment()
 
+        # let SIGUSR2 dump our recent decisions, if we record them
+        if self.recorder is not None:
+            self.recorder.name = name
+            try:
+                signal.signal(signal.SIGUSR2,
+                        lambda signum, frame: self.dump_recording("signal"))
+            except ValueError:
+                pass
+
         # tell the thread that it should be running, then start it
         self.__thinking = True
         self.__should_think_on_data = True
@@ -159,6 +224,11 @@ class Agent:
         if self.__think_thread.is_alive():
             self.__think_thread.join(0.01)
 
+        # write out whatever is left in the log
+        self.log.close()
+        if self.traffic is not None:
+            self.traffic.close()
+
         # reset all standard variables in this object.  self.__connected gets
         # reset here, along with all other non-user defined internal variables.
         Agent.__init__(self)
@@ -177,11 +247,25 @@ class Agent:
             # world model as-is.  the world model parses it and stores it within
             # itself for perusal at our leisure.
             raw_msg = self.__sock.recv()
-            msg_type = self.msg_handler.handle_message(raw_msg)
-
-            # we send commands all at once every cycle, ie. whenever a
-            # 'sense_body' command is received
-            if msg_type == handler.ActionHandler.CommandType.SENSE_BODY:
+            msg_type = self.profiler.call("parse",
+                    self.msg_handler.handle_message, raw_msg)
+
+            # remember what we just saw, for deciding where to look next
+            if msg_type == "see" and self.perception is not None:
+                self.perception.observe()
+
+            # in synchronous mode the server tells us when it's sent all of a
+            # cycle's information, then waits for our commands and a 'done'.
+            # there's nothing new to think about in the message itself.
+            if msg_type == "think":
+                self.__synchronous = True
+                self.__send_done = True
+                continue
+
+            # otherwise we send commands all at once every cycle, ie. whenever
+            # a 'sense_body' command is received
+            if (msg_type == handler.ActionHandler.CommandType.SENSE_BODY and
+                    not self.__synchronous):
                 self.__send_commands = True
 
             # flag new data as needing the think loop's attention
@@ -196,11 +280,27 @@ class Agent:
         play method to start play, and the disconnect method to end it.
         """
 
+        # if we crash, save what we were deciding before dying
+        try:
+            self.__think_loop_body()
+        except:
+            self.log.error("crashed")
+            self.dump_recording("crash")
+            raise
+
+    def __think_loop_body(self):
+        """
+        The think loop proper, see __think_loop.
+        """
+
         while self.__thinking:
+            # start or finish any requested profile on cycle boundaries
+            self.profiler.tick(self.wm.sim_time)
+
             # tell the ActionHandler to send its enqueued messages if it is time
             if self.__send_commands:
                 self.__send_commands = False
-                self.wm.ah.send_commands()
+                self.__send_cycle_commands()
 
             # only think if new data has arrived
             if self.__should_think_on_data:
@@ -211,11 +311,50 @@ class Agent:
                 self.__should_think_on_data = False
 
                 # performs the actions necessary for the agent to play soccer
-                self.think()
+                self.profiler.call("think", self.think)
+
+                # save our decisions once the match is over
+                if (self.wm.play_mode == WorldModel.PlayModes.TIME_OVER and
+                        not self.__recorded_match_end):
+                    self.__recorded_match_end = True
+                    self.dump_recording("end")
+                    if self.traffic is not None:
+                        self.traffic.flush()
+
+            # in synchronous mode, once we've thought about everything the
+            # server sent this cycle, act on it right away and let the
+            # simulation move on without waiting out the rest of the cycle.
+            elif self.__send_done:
+                self.__send_done = False
+                self.__send_cycle_commands()
+                self.wm.ah.done()
             else:
                 # prevent from burning up all the cpu time while waiting for data
                 time.sleep(0.0001)
 
+    def __send_cycle_commands(self):
+        """
+        Decides where to look this cycle, then sends every enqueued command.
+        """
+
+        if self.perception is not None:
+            self.perception.schedule()
+
+        self.wm.ah.send_commands()
+
+    def dump_recording(self, reason):
+        """
+        Writes the flight recorder's decisions to disk, if we record them, and
+        logs where they went.
+        """
+
+        if self.recorder is None:
+            return
+
+        path = self.recorder.dump(reason)
+        if path is not None:
+            self.log.info("recording_saved", path=path)
+
     def setup_environment(self):
         """
         Called before the think loop starts, this allows the user to store any
@@ -225,6 +364,9 @@ class Agent:
 
         self.in_kick_off_formation = False
 
+        # choose our view and neck direction every cycle
+        self.perception = perception.PerceptionScheduler(self.wm, self.log)
+
     def think(self):
         """
         Performs a single step of thinking for our agent.  Gets called on every
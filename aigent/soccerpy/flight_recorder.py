@@ -0,0 +1,260 @@
+import os
+import time
+
+import numpy as np
+
+# where recordings are written by default
+DEFAULT_DIRECTORY = os.environ.get("AGENT_RECORDER_DIR", "recordings")
+
+# the most branches a recorder can tell apart, one bit each in the masks
+MAX_BRANCHES = 32
+
+class FlightRecorder:
+    """
+    Keeps a record of the last few thousand decisions an agent made.
+
+    Every decision is one row of a set of preallocated arrays used as a ring
+    buffer: the cycle, the branch that ran, which predicates were evaluated and
+    which of those held, how long each predicate took, how long the whole
+    decision took, and the type of any exception that ended it along with the
+    branch that raised it.  Recording a decision only writes into those arrays,
+    it never allocates or does I/O.
+
+    A decision loop uses it like this:
+
+        rec.begin(cycle)
+        try:
+            if rec.check(SHOOT, self.shall_shoot):
+                return rec.take(SHOOT, self.shoot)
+            ...
+        except:
+            rec.fail(sys.exc_info()[0])
+        finally:
+            rec.end()
+
+    The buffer is written to disk with dump(), which the agent does when its
+    think loop crashes, on SIGUSR2, and at the end of the match.  Recordings
+    can be read back with load() and summarized with summarize().
+    """
+
+    def __init__(self, branches, capacity=4096, directory=DEFAULT_DIRECTORY):
+        """
+        branches: names of the decision branches, in the order of their ids.
+        capacity: how many decisions are kept.
+        directory: where recordings are written.
+        """
+
+        if len(branches) > MAX_BRANCHES:
+            raise ValueError("At most %d branches can be recorded, got %d." %
+                    (MAX_BRANCHES, len(branches)))
+
+        self.branches = list(branches)
+        self.capacity = capacity
+        self.directory = directory
+
+        # the agent's name, used as the file name prefix
+        self.name = "agent"
+
+        # exception types seen so far, mapped to their ids.  0 means none.
+        self.exceptions = {}
+        self.exception_names = ["None"]
+
+        # the ring buffer, one row per decision
+        n = len(self.branches)
+        self.cycle = np.full(capacity, -1, dtype=np.int32)
+        self.branch = np.full(capacity, -1, dtype=np.int8)
+        self.evaluated = np.zeros(capacity, dtype=np.uint32)
+        self.results = np.zeros(capacity, dtype=np.uint32)
+        self.predicate_us = np.zeros((capacity, n), dtype=np.float32)
+        self.elapsed_us = np.zeros(capacity, dtype=np.float32)
+        self.exception = np.zeros(capacity, dtype=np.int16)
+        self.failed_in = np.full(capacity, -1, dtype=np.int8)
+
+        # how many decisions have been recorded in total, and the state of the
+        # one in progress.
+        self.count = 0
+        self.__row = 0
+        self.__start = 0.0
+        self.__evaluated = 0
+        self.__results = 0
+        self.__current = -1
+
+    def begin(self, cycle):
+        """
+        Starts recording a decision made at the given cycle.
+        """
+
+        row = self.__row = self.count % self.capacity
+        self.count += 1
+
+        self.cycle[row] = -1 if cycle is None else cycle
+        self.branch[row] = -1
+        self.predicate_us[row] = 0
+        self.exception[row] = 0
+        self.failed_in[row] = -1
+        self.__current = -1
+        self.__evaluated = 0
+        self.__results = 0
+        self.__start = time.time()
+
+    def check(self, branch, predicate):
+        """
+        Evaluates and times the predicate of the given branch id, recording
+        and returning its result.
+        """
+
+        self.__current = branch
+
+        start = time.time()
+        result = predicate()
+        self.predicate_us[self.__row, branch] = (time.time() - start) * 1e6
+
+        bit = 1 << branch
+        self.__evaluated |= bit
+        if result:
+            self.__results |= bit
+
+        return result
+
+    def take(self, branch, action):
+        """
+        Records the given branch id as the one taken, then runs its action and
+        returns what it returns.
+        """
+
+        self.branch[self.__row] = branch
+        self.__current = branch
+        return action()
+
+    def fail(self, exc_type):
+        """
+        Records that the decision was ended by an exception of the given type,
+        along with the branch whose predicate or action raised it.
+        """
+
+        code = self.exceptions.get(exc_type)
+        if code is None:
+            code = self.exceptions[exc_type] = len(self.exception_names)
+            self.exception_names.append(exc_type.__name__)
+
+        self.exception[self.__row] = code
+        self.failed_in[self.__row] = self.__current
+
+    def end(self):
+        """
+        Finishes recording the current decision.
+        """
+
+        row = self.__row
+        self.elapsed_us[row] = (time.time() - self.__start) * 1e6
+        self.evaluated[row] = self.__evaluated
+        self.results[row] = self.__results
+
+    def last_branch(self):
+        """
+        Returns the branch id the latest decision took, or -1 if it took none
+        or nothing was recorded yet.
+        """
+
+        if self.count == 0:
+            return -1
+        return int(self.branch[self.__row])
+
+    def dump(self, reason):
+        """
+        Writes the recorded decisions, oldest first, to a compressed numpy
+        archive named after the agent, the reason and the cycle range.  Returns
+        the path written to, or None if nothing was recorded yet.
+        """
+
+        if self.count == 0:
+            return None
+
+        # unroll the ring so that rows run oldest to newest
+        n = min(self.count, self.capacity)
+        order = (np.arange(n) + self.count - n) % self.capacity
+
+        cycles = self.cycle[order]
+        filename = "%s_%s_%d-%d.npz" % (self.name, reason, cycles[0],
+                cycles[-1])
+
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        path = os.path.join(self.directory, filename)
+
+        np.savez_compressed(path,
+                branches=np.array(self.branches),
+                exception_names=np.array(self.exception_names),
+                cycle=cycles,
+                branch=self.branch[order],
+                evaluated=self.evaluated[order],
+                results=self.results[order],
+                predicate_us=self.predicate_us[order],
+                elapsed_us=self.elapsed_us[order],
+                exception=self.exception[order],
+                failed_in=self.failed_in[order])
+
+        return path
+
+def load(path):
+    """
+    Reads a recording written by FlightRecorder.dump into a dict of arrays.
+    """
+
+    archive = np.load(path)
+    try:
+        return dict((key, archive[key]) for key in archive.files)
+    finally:
+        archive.close()
+
+def summarize(path):
+    """
+    Prints, for every branch of a recording, how often its predicate was
+    evaluated, how often it held, how often the branch was taken, and its
+    predicate's mean and worst time.  Then lists the exceptions that ended
+    decisions by the branch that raised them, or as raised before branches if
+    no branch had been checked yet, and the slowest decisions.
+    """
+
+    rec = load(path)
+    evaluated = rec["evaluated"]
+    results = rec["results"]
+    times = rec["predicate_us"]
+
+    print "%-24s %8s %8s %8s %10s %10s" % ("branch", "checked", "held",
+            "taken", "mean us", "max us")
+    for i, name in enumerate(rec["branches"]):
+        checked = (evaluated >> i) & 1 == 1
+        held = (results >> i) & 1 == 1
+        taken = rec["branch"] == i
+
+        mean_us = times[checked, i].mean() if checked.any() else 0.0
+        max_us = times[checked, i].max() if checked.any() else 0.0
+        print "%-24s %8d %8d %8d %10.1f %10.1f" % (name, checked.sum(),
+                held.sum(), taken.sum(), mean_us, max_us)
+
+    print
+    for code, name in enumerate(rec["exception_names"]):
+        if code == 0:
+            continue
+
+        # failed_in is -1 for exceptions raised before any branch was checked
+        raised = rec["exception"] == code
+        places = [(-1, "(before branches)")] + list(enumerate(rec["branches"]))
+        for i, branch in places:
+            n = (raised & (rec["failed_in"] == i)).sum()
+            if n > 0:
+                print "%-24s %-24s %8d" % (name, branch, n)
+
+    print
+    print "slowest decisions (cycle, us):"
+    for i in np.argsort(-rec["elapsed_us"])[:5]:
+        print "  %6d %10.1f" % (rec["cycle"][i], rec["elapsed_us"][i])
+
+if __name__ == "__main__":
+    import sys
+
+    for path in sys.argv[1:]:
+        print path
+        summarize(path)
+        print
@@ -157,12 +157,14 @@ class Player(MobileObject):
     """
 
     def __init__(self, distance, direction, dist_change, dir_change, speed,
-            team, side, uniform_number, body_direction, neck_direction):
+            team, side, uniform_number, body_direction, neck_direction,
+            is_goalie=False):
         """
         Adds player-specific information to a mobile object.
         """
 
         self.team = team
+        self.is_goalie = is_goalie
         self.side = side
         self.uniform_number = uniform_number
         self.body_direction = body_direction
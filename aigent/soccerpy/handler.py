@@ -4,12 +4,13 @@ import Queue as queue
 import message_parser
 import sp_exceptions
 import game_object
+import logger
 from world_model import WorldModel
 
-# should we print messages received from the server?
+# should we log messages received from the server?
 PRINT_SERVER_MESSAGES = False
 
-# should we print commands sent to the server?
+# should we log commands sent to the server?
 PRINT_SENT_COMMANDS = False
 
 class MessageHandler:
@@ -25,9 +26,12 @@ class MessageHandler:
     # an inner class used for creating named tuple 'hear' messages
     Message = collections.namedtuple("Message", "time sender message")
 
-    def __init__(self, world_model):
+    def __init__(self, world_model, log=None):
         self.wm = world_model
 
+        # where server messages and warnings are logged to
+        self.log = log or logger.AgentLogger(logger.OFF)
+
     def handle_message(self, msg):
         """
         Takes a raw message direct from the server, parses it, and stores its
@@ -39,7 +43,7 @@ class MessageHandler:
         parsed = message_parser.parse(msg)
 
         if PRINT_SERVER_MESSAGES:
-            print parsed[0] + ":", parsed[1:], "\n"
+            self.log.debug(parsed[0], message=parsed[1:])
 
         # this is the name of the function that should be used to handle
         # this message type.  we pull it from this object dynamically to
@@ -70,8 +74,8 @@ class MessageHandler:
         """
 
         # the simulation cycle of the soccer server
-        # TODO: we should probably use this somewhere...
         sim_time = msg[1]
+        self.wm.sim_time = sim_time
 
         # store new values before changing those in the world model.  all new
         # values replace those in the world model at the end of parsing.
@@ -135,6 +139,7 @@ class MessageHandler:
                 # extract any available information from the player object's name
                 teamname = None
                 uniform_number = None
+                position = None
 
                 if len(name) >= 2:
                     teamname = name[1]
@@ -160,9 +165,12 @@ class MessageHandler:
                 speed = None
                 # TODO: calculate player's speed!
 
+                # only goalies are marked with a position
+                is_goalie = position == "goalie"
+
                 new_players.append(game_object.Player(distance, direction,
                     dist_change, dir_change, speed, teamname, side,
-                    uniform_number, body_dir, neck_dir))
+                    uniform_number, body_dir, neck_dir, is_goalie))
 
             # parse goals
             elif name[0] == 'g':
@@ -281,6 +289,9 @@ class MessageHandler:
         Deals with the agent's body model information.
         """
 
+        # the simulation cycle this body information belongs to
+        self.wm.sim_time = msg[1]
+
         # update the body model information when received. each piece of info is
         # a list with the first item as the name of the data, and the rest as
         # the values.
@@ -376,6 +387,22 @@ class MessageHandler:
         self.wm.uniform_number = uniform_number
         self.wm.play_mode = play_mode
 
+    def _handle_ok(self, msg):
+        """
+        Deals with the server accepting a command that it acknowledges.
+        """
+
+        # sees now arrive at fixed points in the cycle, see perception.py
+        if msg[1] == "synch_see":
+            self.wm.synch_see = True
+
+    def _handle_think(self, msg):
+        """
+        In synchronous mode, the server says it's sent everything for this
+        cycle and is waiting for our commands.  The agent's loops act on this
+        by sending them followed by a 'done', so there's nothing to store.
+        """
+
     def _handle_error(self, msg):
         """
         Deals with error messages by raising them as exceptions.
@@ -390,7 +417,8 @@ class MessageHandler:
         """
 
         m = "Server issued a warning: '%s'" % msg[1]
-        print sp_exceptions.SoccerServerWarning(m)
+        self.log.warning("server_warning",
+                warning=sp_exceptions.SoccerServerWarning(m))
 
 class ActionHandler:
     """
@@ -420,6 +448,16 @@ class ActionHandler:
         TURN = "turn"
         TURN_NECK = "turn_neck"
 
+        # secondary commands the server only accepts once per cycle
+        ONCE_PER_CYCLE = (CHANGE_VIEW, TURN_NECK)
+
+        # sent in synchronous mode once all of a cycle's commands are
+        DONE = "done"
+
+        # view widths and qualities accepted by change_view
+        VIEW_WIDTHS = ("narrow", "normal", "wide")
+        VIEW_QUALITIES = ("high", "low")
+
         def __init__(self):
             raise NotImplementedError("Can't instantiate a CommandType, access "
                     "its members through ActionHandler instead.")
@@ -427,7 +465,7 @@ class ActionHandler:
     # a command for our queue containing an id and command text
     Command = collections.namedtuple("Command", "cmd_type text")
 
-    def __init__(self, server_socket):
+    def __init__(self, server_socket, log=None):
         """
         Save the socket that connects us to the soccer server to allow us to
         send it commands.
@@ -435,16 +473,26 @@ class ActionHandler:
 
         self.sock = server_socket
 
+        # where sent commands are logged to
+        self.log = log or logger.AgentLogger(logger.OFF)
+
         # this contains all requested actions for the current and future cycles
         self.q = queue.Queue()
 
+        # the body turn, in degrees, that the most recent primary command
+        # queued for this cycle asks for.  0 if it isn't a turn.
+        self.pending_turn = 0.0
+
     def send_commands(self):
         """
         Sends all the enqueued commands.
         """
 
-        # we only send the most recent primary command
+        # we only send the most recent primary command, and the most recent of
+        # each secondary command that only counts once per cycle.
         primary_cmd = None
+        once_cmds = {}
+        self.pending_turn = 0.0
 
         # dequeue all enqueued commands and send them
         while 1:
@@ -454,22 +502,33 @@ class ActionHandler:
                 break
 
             # save the most recent primary command and send it at the very end
+            name = cmd.text[1:].split(" ", 1)[0]
             if cmd.cmd_type == ActionHandler.CommandType.TYPE_PRIMARY:
                 primary_cmd = cmd
+            # save the most recent once-per-cycle ones too, by command name
+            elif name in ActionHandler.CommandType.ONCE_PER_CYCLE:
+                once_cmds[name] = cmd
             # send other commands immediately
             else:
                 if PRINT_SENT_COMMANDS:
-                    print "sent:", cmd.text, "\n"
+                    self.log.debug("sent", command=cmd.text)
 
                 self.sock.send(cmd.text)
 
             # indicate that we finished processing a command
             self.q.task_done()
 
+        # send the saved once-per-cycle commands
+        for cmd in once_cmds.values():
+            if PRINT_SENT_COMMANDS:
+                self.log.debug("sent", command=cmd.text)
+
+            self.sock.send(cmd.text)
+
         # send the saved primary command, if there was one
         if primary_cmd is not None:
             if PRINT_SENT_COMMANDS:
-                print "sent:", primary_cmd.text, "\n"
+                self.log.debug("sent", command=primary_cmd.text)
 
             self.sock.send(primary_cmd.text)
 
@@ -482,6 +541,7 @@ class ActionHandler:
         """
 
         msg = "(move %.10f %.10f)" % (x, y)
+        self.pending_turn = 0.0
 
         # create the command object for insertion into the queue
         cmd_type = ActionHandler.CommandType.TYPE_PRIMARY
@@ -499,6 +559,7 @@ class ActionHandler:
         assert -180 <= relative_degrees <= 180
 
         msg = "(turn %.10f)" % relative_degrees
+        self.pending_turn = relative_degrees
 
         # create the command object for insertion into the queue
         cmd_type = ActionHandler.CommandType.TYPE_PRIMARY
@@ -512,6 +573,7 @@ class ActionHandler:
         """
 
         msg = "(dash %.10f)" % power
+        self.pending_turn = 0.0
 
         # create the command object for insertion into the queue
         cmd_type = ActionHandler.CommandType.TYPE_PRIMARY
@@ -526,6 +588,7 @@ class ActionHandler:
         """
 
         msg = "(kick %.10f %.10f)" % (power, relative_direction)
+        self.pending_turn = 0.0
 
         # create the command object for insertion into the queue
         cmd_type = ActionHandler.CommandType.TYPE_PRIMARY
@@ -540,6 +603,7 @@ class ActionHandler:
         """
 
         msg = "(catch %.10f)" % relative_direction
+        self.pending_turn = 0.0
 
         # create the command object for insertion into the queue
         cmd_type = ActionHandler.CommandType.TYPE_PRIMARY
@@ -575,3 +639,36 @@ class ActionHandler:
 
         self.q.put(cmd)
 
+    def change_view(self, width, quality):
+        """
+        Changes the width ('narrow', 'normal' or 'wide') and quality ('high' or
+        'low') of the player's view.  Narrower and lower quality views arrive
+        more often, and low quality ones carry no distances.
+        """
+
+        # disallow modes the server doesn't know
+        assert width in ActionHandler.CommandType.VIEW_WIDTHS
+        assert quality in ActionHandler.CommandType.VIEW_QUALITIES
+
+        msg = "(change_view %s %s)" % (width, quality)
+
+        # create the command object for insertion into the queue
+        cmd_type = ActionHandler.CommandType.TYPE_SECONDARY
+        cmd = ActionHandler.Command(cmd_type, msg)
+
+        self.q.put(cmd)
+
+    def done(self):
+        """
+        Tells the server, in synchronous mode, that we've sent all of our
+        commands for this cycle so that it can move on to the next one.  This
+        isn't queued, it's sent immediately, so send the cycle's commands first.
+        """
+
+        msg = "(%s)" % ActionHandler.CommandType.DONE
+
+        if PRINT_SENT_COMMANDS:
+            self.log.debug("sent", command=msg)
+
+        self.sock.send(msg)
+
@@ -0,0 +1,177 @@
+import collections
+import os
+import threading
+import time
+
+# log levels, in increasing order of importance.  a logger at some level drops
+# every record below it.
+DEBUG = 10
+INFO = 20
+WARNING = 30
+ERROR = 40
+OFF = 100
+
+LEVEL_NAMES = {
+    DEBUG: "DEBUG",
+    INFO: "INFO",
+    WARNING: "WARNING",
+    ERROR: "ERROR",
+}
+
+# the default level for new loggers, overridable from the environment
+DEFAULT_LEVEL = int(os.environ.get("AGENT_LOG_LEVEL", INFO))
+
+# where per-agent log files are written by default
+DEFAULT_DIRECTORY = os.environ.get("AGENT_LOG_DIR", "logs")
+
+def _noop(*args, **kwargs):
+    """
+    Stands in for the logging methods of disabled levels.
+    """
+
+class AgentLogger:
+    """
+    Writes structured (cycle, level, event, fields) records for a single agent
+    without ever blocking the caller on I/O.
+
+    Records go into an in-memory ring buffer (a bounded deque, whose appends
+    and pops are atomic, so no lock is taken) and a background thread drains
+    it to the agent's own log file.  If the writer falls behind, the oldest
+    records are overwritten rather than making the think loop wait.
+
+    The 'debug', 'info', 'warning' and 'error' methods of disabled levels are
+    bound to a no-op function, so a disabled call costs no more than calling
+    an empty function.  Callers building expensive arguments can check
+    'enabled' first.
+    """
+
+    def __init__(self, level=DEFAULT_LEVEL, capacity=4096,
+            flush_interval=0.1):
+        """
+        level: records below this level are dropped.
+        capacity: the number of records the ring buffer holds.
+        flush_interval: seconds the writer sleeps between drains.
+        """
+
+        self.capacity = capacity
+        self.flush_interval = flush_interval
+
+        # returns the current simulation cycle, stamped on every record
+        self.clock = lambda: None
+
+        # the ring buffer of pending records
+        self.__records = collections.deque(maxlen=capacity)
+
+        # the background writer and its output file
+        self.__file = None
+        self.__writer = None
+        self.__writing = False
+        self.name = None
+
+        self.set_level(level)
+
+    def set_level(self, level):
+        """
+        Sets the lowest level that is recorded, rebinding the logging methods
+        of lower levels to a no-op.
+        """
+
+        self.level = level
+
+        for lvl, method in ((DEBUG, "debug"), (INFO, "info"),
+                (WARNING, "warning"), (ERROR, "error")):
+            if lvl >= level:
+                setattr(self, method, self.__recorder(lvl))
+            else:
+                setattr(self, method, _noop)
+
+    def enabled(self, level):
+        """
+        Returns whether records of the given level are currently kept.
+        """
+
+        return level >= self.level
+
+    def __recorder(self, level):
+        """
+        Returns a function that records events at the given level.
+        """
+
+        append = self.__records.append
+        clock = lambda: self.clock()
+
+        def record(event, **fields):
+            append((clock(), level, event, fields))
+
+        return record
+
+    def open(self, name, directory=DEFAULT_DIRECTORY):
+        """
+        Starts writing records to '<directory>/<name>.log' from a background
+        thread.  Records made before opening are kept and written first.
+        """
+
+        if self.__writing:
+            return
+
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        self.name = name
+        self.__file = open(os.path.join(directory, name + ".log"), "a")
+
+        self.__writing = True
+        self.__writer = threading.Thread(target=self.__write_loop,
+                name="log_writer")
+        self.__writer.daemon = True
+        self.__writer.start()
+
+    def close(self):
+        """
+        Stops the background writer, writing out everything still buffered.
+        """
+
+        if not self.__writing:
+            return
+
+        self.__writing = False
+        self.__writer.join(1.0)
+
+        self.__drain()
+        self.__file.close()
+        self.__file = None
+
+    def __drain(self):
+        """
+        Writes out every buffered record.
+        """
+
+        popleft = self.__records.popleft
+        lines = []
+        while 1:
+            try:
+                cycle, level, event, fields = popleft()
+            except IndexError:
+                break
+
+            line = "%s\t%s\t%s\t%s" % (cycle, LEVEL_NAMES[level], self.name,
+                    event)
+            if fields:
+                line += "\t" + " ".join("%s=%s" % kv
+                        for kv in sorted(fields.items()))
+            lines.append(line + "\n")
+
+        if lines:
+            self.__file.writelines(lines)
+            self.__file.flush()
+
+    def __write_loop(self):
+        """
+        Periodically drains the ring buffer to the log file.
+
+        This SHOULD NOT be called externally, it runs as the writer thread.
+        """
+
+        while self.__writing:
+            self.__drain()
+            time.sleep(self.flush_interval)
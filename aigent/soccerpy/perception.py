@@ -0,0 +1,283 @@
+import numpy as np
+
+import logger
+
+# how each view width scales the view cone and the time between see messages,
+# relative to the 'normal' width.
+VIEW_FACTORS = {
+    "narrow": 0.5,
+    "normal": 1.0,
+    "wide": 2.0,
+}
+
+# in synch see mode every width has a cone of its own, in degrees, and sees
+# arrive every so many whole cycles.
+SYNCH_SEE_VIEWS = {
+    "narrow": (60.0, 1),
+    "normal": (120.0, 2),
+    "wide": (180.0, 3),
+}
+
+# widths in the order they're scored.  low quality views carry no distances,
+# which we can't place anything without, so we always ask for high quality.
+VIEW_WIDTHS = ("narrow", "normal", "wide")
+VIEW_QUALITY = "high"
+
+# rows of the object table: the ball, then our players and theirs by uniform
+# number.
+BALL = 0
+MATES = 1
+ENEMIES = 12
+NUM_OBJECTS = 23
+
+def wrap_angle(a):
+    """
+    Wraps angles in degrees, scalar or array, into [-180, 180).
+    """
+
+    return (a + 180.0) % 360.0 - 180.0
+
+class PerceptionScheduler:
+    """
+    Picks our view width and neck direction every cycle so that the see
+    messages we get carry as much new information as possible.
+
+    It remembers when it last saw the ball, every player it could identify,
+    and every direction around us (in 'sectors' equal slices), and where the
+    ball and players were at the time.  Each cycle it scores every view width
+    against a fan of reachable neck angles: a view is worth the weighted age of
+    everything in its cone, divided by how often that view arrives.  Narrow
+    views refresh a few things often, wide ones refresh many things rarely, and
+    stale things grow in worth until some view goes and looks at them.
+
+    The ball comes first.  While we know roughly where it is, only views that
+    keep it in sight are considered.  Once it's been out of sight for
+    'ball_lost_cycles', we go wide and look wherever we looked least recently.
+
+    observe() has to be called with every see message, and schedule() once per
+    cycle right before the cycle's commands are sent.  The scheduler owns the
+    neck: its turn_neck replaces any other queued in the same cycle.
+    """
+
+    def __init__(self, wm, log=None, ball_weight=10.0, player_weight=1.0,
+            sector_weight=0.2, sectors=36, neck_steps=19, cone_margin=5.0,
+            ball_lost_cycles=10, max_age=50):
+        """
+        wm: the WorldModel we perceive for.
+        log: the AgentLogger chosen views are logged to at debug level.
+        ball_weight, player_weight, sector_weight: how much one cycle of
+            staleness of each kind of thing is worth.
+        sectors: how many slices the directions around us are split into.
+        neck_steps: how many neck angles are tried across the neck's range.
+        cone_margin: degrees kept inside the edges of the view cone, to allow
+            for errors in where we think things are.
+        ball_lost_cycles: how long the ball can go unseen before we stop
+            trusting where we think it is.
+        max_age: ages are capped at this many cycles.
+        """
+
+        self.wm = wm
+        self.log = log or logger.AgentLogger(logger.OFF)
+        self.ball_lost_cycles = ball_lost_cycles
+        self.max_age = max_age
+        self.cone_margin = cone_margin
+
+        # when, where and how fast every object was last seen.  a cycle of -1
+        # means never.
+        self.seen = np.full(NUM_OBJECTS, -1, dtype=float)
+        self.positions = np.zeros((NUM_OBJECTS, 2))
+        self.velocities = np.zeros((NUM_OBJECTS, 2))
+
+        # when every slice of directions around us was last in view
+        self.sector_dirs = np.arange(sectors) * (360.0 / sectors)
+        self.sector_seen = np.full(sectors, -1, dtype=float)
+
+        # what a cycle of staleness is worth, objects first, then sectors
+        weights = np.full(NUM_OBJECTS, player_weight)
+        weights[BALL] = ball_weight
+        self.weights = np.concatenate((weights,
+                np.full(sectors, sector_weight)))
+
+        sp = wm.server_parameters
+
+        # the neck angles tried, relative to the body
+        self.neck_angles = np.linspace(sp.minneckang, sp.maxneckang,
+                neck_steps)
+
+        # the cone half width and cycles between sees of every view width,
+        # which depend on whether sees are synchronous.
+        self.half_widths = None
+        self.periods = None
+        self.__synch_see = None
+        self.__update_tables()
+
+    def __update_tables(self):
+        """
+        Recomputes the view cone and see interval of every width, if the world
+        model's see mode changed since they were last computed.
+        """
+
+        if self.wm.synch_see == self.__synch_see:
+            return
+
+        self.__synch_see = self.wm.synch_see
+
+        if self.__synch_see:
+            views = np.array([SYNCH_SEE_VIEWS[w] for w in VIEW_WIDTHS])
+            self.half_widths = views[:, 0] / 2.0
+            self.periods = views[:, 1]
+        else:
+            sp = self.wm.server_parameters
+            factors = np.array([VIEW_FACTORS[w] for w in VIEW_WIDTHS])
+            self.half_widths = sp.visible_angle * factors / 2.0
+            self.periods = (float(sp.send_step) / sp.simulator_step) * factors
+
+    def view_angle(self, width):
+        """
+        Returns the full angle, in degrees, of the given view width's cone.
+        """
+
+        return self.half_widths[VIEW_WIDTHS.index(width)] * 2
+
+    def see_period(self, width):
+        """
+        Returns how many cycles pass between see messages at the given width.
+        """
+
+        return self.periods[VIEW_WIDTHS.index(width)]
+
+    def observe(self):
+        """
+        Records what the world model's latest see message showed us.  Does
+        nothing if we couldn't place ourselves in it.
+        """
+
+        wm = self.wm
+        t = wm.sim_time
+        if t is None or wm.abs_coords[0] is None or wm.abs_neck_dir is None:
+            return
+
+        self.__update_tables()
+
+        # everything in the cone was looked at, whether or not it was there
+        width = wm.view_width if wm.view_width in VIEW_FACTORS else "normal"
+        half = self.view_angle(width) / 2.0
+        looked = np.abs(wrap_angle(self.sector_dirs - wm.abs_neck_dir)) <= half
+        self.sector_seen[looked] = t
+
+        if wm.ball is not None and wm.ball.distance is not None:
+            self.__saw(BALL, t, wm.get_object_absolute_coords(wm.ball),
+                    wm.get_object_absolute_velocity(wm.ball))
+
+        for p in wm.players:
+            # we can only tell apart players whose numbers we can make out
+            if (p.distance is None or p.side is None or
+                    p.uniform_number is None or
+                    not 1 <= p.uniform_number <= 11):
+                continue
+
+            if p.side == wm.side:
+                row = MATES + p.uniform_number - 1
+            else:
+                row = ENEMIES + p.uniform_number - 1
+
+            self.__saw(row, t, wm.get_object_absolute_coords(p), None)
+
+    def __saw(self, row, t, coords, velocity):
+        """
+        Stores a sighting of the object in the given row of the table.
+        """
+
+        self.positions[row] = coords
+        self.velocities[row] = velocity or (0.0, 0.0)
+        self.seen[row] = t
+
+    def schedule(self):
+        """
+        Queues the change_view and turn_neck commands for the best view this
+        cycle.  Returns the chosen (width, neck angle), or None if we don't
+        know where we are or which way we face, in which case we only widen our
+        view to find out sooner.
+        """
+
+        wm = self.wm
+        t = wm.sim_time
+        if t is None:
+            return None
+
+        self.__update_tables()
+
+        if wm.abs_coords[0] is None or wm.abs_body_dir is None:
+            self.__change_view("wide")
+            return None
+
+        sp = wm.server_parameters
+
+        # how stale everything is, and which way it is from us.  the ball has
+        # kept rolling since we saw it.
+        ages = np.minimum(t - self.seen, self.max_age)
+        ages[self.seen < 0] = self.max_age
+        positions = self.positions.copy()
+        positions[BALL] += self.velocities[BALL] * ((1 - sp.ball_decay **
+                ages[BALL]) / (1 - sp.ball_decay))
+        offsets = positions - np.asarray(wm.abs_coords, dtype=float)
+        dirs = np.degrees(np.arctan2(offsets[:, 1], offsets[:, 0]))
+
+        sector_ages = np.minimum(t - self.sector_seen, self.max_age)
+        sector_ages[self.sector_seen < 0] = self.max_age
+
+        # unknown objects are left out, their directions are covered by sectors
+        known = np.concatenate((self.seen >= 0,
+                np.ones(len(self.sector_dirs), dtype=bool)))
+        dirs = np.concatenate((dirs, self.sector_dirs))
+        ages = np.concatenate((ages, sector_ages))
+        weights = self.weights * known
+
+        # our body's direction after this cycle's turn, if we're turning, and
+        # the absolute direction of every neck angle we could pick.
+        speed = wm.speed_amount or 0.0
+        body = wm.abs_body_dir - wm.ah.pending_turn / (1.0 +
+                sp.inertia_moment * speed)
+        necks = body - self.neck_angles
+
+        # (widths, necks, things) of whether each view would show each thing
+        off = np.abs(wrap_angle(dirs[np.newaxis, :] - necks[:, np.newaxis]))
+        inside = (off[np.newaxis, :, :] <= (self.half_widths -
+                self.cone_margin)[:, np.newaxis, np.newaxis])
+
+        # what each view is worth per cycle: everything it shows, each by how
+        # stale it'll be by the time the view arrives.
+        periods = self.periods[:, np.newaxis]
+        values = np.dot(inside, weights * ages) + np.dot(inside, weights) * \
+                periods
+        values /= periods
+
+        # keep the ball in sight if we can, look for it wide if we've lost it
+        if self.seen[BALL] >= 0 and ages[BALL] <= self.ball_lost_cycles:
+            keeps_ball = inside[:, :, BALL]
+            if keeps_ball.any():
+                values[~keeps_ball] = -np.inf
+        else:
+            values[:VIEW_WIDTHS.index("wide")] = -np.inf
+
+        w, n = np.unravel_index(values.argmax(), values.shape)
+        width = VIEW_WIDTHS[w]
+        neck = self.neck_angles[n]
+
+        self.__change_view(width)
+
+        # always turn, even by nothing, to override other neck turns
+        self.wm.ah.turn_neck(neck - (wm.neck_direction or 0.0))
+
+        self.log.debug("view", width=width, neck=neck)
+
+        return width, neck
+
+    def __change_view(self, width):
+        """
+        Asks for the given view width at high quality, if that's not what we
+        already have.
+        """
+
+        if self.wm.view_width != width or self.wm.view_quality != VIEW_QUALITY:
+            self.wm.ah.change_view(width, VIEW_QUALITY)
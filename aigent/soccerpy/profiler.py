@@ -0,0 +1,137 @@
+import cProfile
+import os
+import signal
+import threading
+
+import logger
+
+# how many cycles a requested profile covers, overridable from the environment
+DEFAULT_CYCLES = int(os.environ.get("AGENT_PROFILE_CYCLES", 100))
+
+# where profiles are written by default
+DEFAULT_DIRECTORY = os.environ.get("AGENT_PROFILE_DIR", "profiles")
+
+class CycleProfiler:
+    """
+    Runs cProfile over the next N simulation cycles of an agent on request,
+    usually by sending the agent's process a SIGUSR1:
+
+        kill -USR1 <pid>
+
+    Each of the agent's loops ('think', 'parse') gets its own profile, since
+    cProfile only sees the thread it's enabled in.  When the requested cycles
+    are over, each profile is dumped as a pstats file named after the agent and
+    the cycle range, eg. 'profiles/Keng_l_9_1200-1300_think.prof'.  Open it
+    with pstats or any pstats viewer.
+
+    While no profile is running, wrapped calls cost a single attribute check.
+    """
+
+    def __init__(self, cycles=DEFAULT_CYCLES, directory=DEFAULT_DIRECTORY,
+            log=None):
+        """
+        cycles: how many cycles a request profiles for by default.
+        directory: where the profiles are written.
+        log: the AgentLogger that profile starts and dumps are reported to.
+        """
+
+        self.cycles = cycles
+        self.directory = directory
+        self.log = log or logger.AgentLogger(logger.OFF)
+
+        # the agent's name, used as the file name prefix
+        self.name = "agent"
+
+        # the number of cycles requested, None if no request is pending
+        self.__requested = None
+
+        # whether profiling is on, and for which cycle range
+        self.active = False
+        self.start_cycle = None
+        self.end_cycle = None
+
+        # a (lock, profile) pair per loop name.  each lock keeps its profile
+        # from being dumped mid-call, the main lock guards the dict itself.
+        self.__profiles = {}
+        self.__lock = threading.Lock()
+
+    def install_signal(self, signum=signal.SIGUSR1):
+        """
+        Makes the given signal request a profile of the default length.  Only
+        works when called from the process' main thread.
+        """
+
+        signal.signal(signum, lambda signum, frame: self.request())
+
+    def request(self, cycles=None):
+        """
+        Asks for the next 'cycles' cycles to be profiled, starting on the next
+        tick.  Requests made while a profile is running are ignored.
+        """
+
+        if not self.active:
+            self.__requested = cycles or self.cycles
+
+    def tick(self, cycle):
+        """
+        Advances the profiler to the given simulation cycle, starting a
+        requested profile or finishing a running one as needed.
+        """
+
+        if cycle is None:
+            return
+
+        # start a pending request
+        if not self.active:
+            if self.__requested is not None:
+                self.start_cycle = cycle
+                self.end_cycle = cycle + self.__requested
+                self.__requested = None
+                self.active = True
+                self.log.info("profile_start", end=self.end_cycle)
+
+        # dump once we've covered the requested cycles
+        elif cycle >= self.end_cycle:
+            self.active = False
+            self.dump()
+
+    def call(self, loop, func, *args):
+        """
+        Calls func with the given args, under the given loop's profile if
+        profiling is on.  Returns whatever func returns.
+        """
+
+        if not self.active:
+            return func(*args)
+
+        with self.__lock:
+            entry = self.__profiles.get(loop)
+            if entry is None:
+                entry = (threading.Lock(), cProfile.Profile())
+                self.__profiles[loop] = entry
+
+        lock, profile = entry
+        with lock:
+            return profile.runcall(func, *args)
+
+    def dump(self):
+        """
+        Writes every loop's profile to its own file, then discards them.
+        """
+
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+
+        with self.__lock:
+            profiles = self.__profiles
+            self.__profiles = {}
+
+        for loop, (lock, profile) in profiles.items():
+            filename = "%s_%s-%s_%s.prof" % (self.name, self.start_cycle,
+                    self.end_cycle, loop)
+            path = os.path.join(self.directory, filename)
+
+            with lock:
+                profile.dump_stats(path)
+
+            self.log.info("profile_saved", path=path)
@@ -1,19 +1,24 @@
 import socket
 
+import traffic
+
 class Socket:
     """
     Handles the barest level of UDP communication with a server in a slightly
     simpler way (for our purposes) than the default socket library.
     """
     
-    def __init__(self, host, port, bufsize=8192):
+    def __init__(self, host, port, bufsize=8192, traffic=None):
         """
         host: hostname of the server we want to connect to
         port: port of the server we want to connect to
+        traffic: a TrafficRecorder that everything sent and received is
+            recorded to, if any
         """
         
         self.address = (host, port)
         self.bufsize = bufsize
+        self.traffic = traffic
         
         # the socket communication with the server takes place on (ipv4, udp)
         self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
@@ -27,6 +32,9 @@ class Socket:
         if append_null_terminator:
             msg = msg + "\0"
 
+        if self.traffic is not None:
+            self.traffic.record(traffic.SENT, msg)
+
         self.sock.sendto(msg, self.address)
     
     def recv(self, conform_address=True):
@@ -40,5 +48,8 @@ class Socket:
         
         if conform_address:
             self.address = address
+
+        if self.traffic is not None:
+            self.traffic.record(traffic.RECEIVED, data)
         
         return data
@@ -31,3 +31,9 @@ class AgentConnectionStateError(Exception):
     connection state of the agent object.
     """
 
+class TrainerTimeoutError(Exception):
+    """
+    Raised when the server stops sending the trainer field updates, eg. because
+    the clock isn't running in the current play mode, or when a match runs
+    past its time limit.
+    """
@@ -0,0 +1,88 @@
+import os
+import threading
+import time
+
+# where traffic is recorded, if anywhere.  recording is off unless this is set.
+DEFAULT_DIRECTORY = os.environ.get("AGENT_TRAFFIC_DIR")
+
+# marks the direction of every recorded message
+RECEIVED = "<"
+SENT = ">"
+
+class TrafficRecorder:
+    """
+    Records every message an agent receives from the server and every command
+    it sends, in order, one per line, so that a match can be replayed through
+    a MessageHandler later (see match_data.py).  Lines look like:
+
+        < (see 12 ((b) 10.5 -3) ...)
+        > (dash 80)
+
+    Messages arrive before we know our name, so those are held until open() is
+    called and then written first.  Writes go through the file's own buffer,
+    so they cost about as much as appending to a list.
+    """
+
+    def __init__(self, directory=DEFAULT_DIRECTORY):
+        self.directory = directory
+
+        # lines held until the file is open, and the file once it is
+        self.__pending = []
+        self.__file = None
+
+        # the message and think loops both write
+        self.__lock = threading.Lock()
+
+    def open(self, name):
+        """
+        Starts writing to '<directory>/<name>_<time>.traffic', so that every
+        match gets a file of its own.  Returns the path written to.
+        """
+
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+
+        path = os.path.join(self.directory, "%s_%d.traffic" % (name,
+            time.time()))
+
+        with self.__lock:
+            self.__file = open(path, "w")
+            self.__file.writelines(self.__pending)
+            self.__pending = None
+
+        return path
+
+    def flush(self):
+        """
+        Writes out everything recorded so far, for when the match is over but
+        we may be killed rather than disconnected.
+        """
+
+        with self.__lock:
+            if self.__file is not None:
+                self.__file.flush()
+
+    def close(self):
+        """
+        Writes out and closes the file.  Nothing is recorded after this.
+        """
+
+        with self.__lock:
+            if self.__file is not None:
+                self.__file.close()
+            self.__file = None
+            self.__pending = None
+
+    def record(self, direction, msg):
+        """
+        Records a message going in the given direction, RECEIVED or SENT.
+        """
+
+        # messages are null terminated, and never span lines otherwise
+        line = "%s %s\n" % (direction, msg.rstrip("\0\n"))
+
+        with self.__lock:
+            if self.__file is not None:
+                self.__file.write(line)
+            elif self.__pending is not None:
+                self.__pending.append(line)
@@ -0,0 +1,357 @@
+#!/usr/bin/env python
+
+import collections
+import socket
+import time
+
+import logger
+import message_parser
+import sock
+import sp_exceptions
+from world_model import WorldModel
+
+# what the trainer sees of the field in one cycle.  ball is (x, y, vx, vy) and
+# players maps (team name, uniform number) to (x, y, vx, vy, body direction,
+# neck direction).  everything is in the agents' frame, ie. y grows toward the
+# top flags and angles grow counter-clockwise.
+FieldState = collections.namedtuple("FieldState",
+        "time play_mode ball players")
+
+# the outcome of one episode: its score, the cycles it ran for, and the state of
+# the field at its end.
+Episode = collections.namedtuple("Episode", "score cycles state")
+
+# play modes the referee announces goals with, followed by the new score
+GOAL_L = "goal_l"
+GOAL_R = "goal_r"
+
+# every play mode the referee can switch to.  it calls out other things too,
+# like fouls, which don't change the play mode.
+PLAY_MODES = set(v for k, v in vars(WorldModel.PlayModes).items()
+        if k.isupper()) | set([GOAL_L, GOAL_R])
+
+class Trainer:
+    """
+    A client for the server's trainer port, which can place the ball and any
+    player anywhere, change the play mode, and sees the whole field exactly.
+
+    It's made for running many short scripted episodes (see Scenario) against
+    agents that are already connected and playing: each episode is a handful
+    of commands and then however many cycles it runs for, with no reconnects
+    in between.
+
+    Unlike the agents it has no threads of its own.  Commands are sent as soon
+    as they're made, without waiting for the server's 'ok', and all incoming
+    messages are handled while run() waits for the cycles to go by.  Errors the
+    server reports are raised from there.
+    """
+
+    def __init__(self, log=None):
+        """
+        log: the AgentLogger that episodes and server warnings are logged to.
+        """
+
+        self.log = log or logger.AgentLogger(logger.OFF)
+
+        # the socket to the server's trainer port, None until connected
+        self.__sock = None
+
+        # the latest play mode, and the latest field state we were sent
+        self.play_mode = WorldModel.PlayModes.BEFORE_KICK_OFF
+        self.state = None
+
+        # the score, as the referee last called it
+        self.score_l = 0
+        self.score_r = 0
+
+    def connect(self, host="localhost", port=6001, version=11, timeout=5.0):
+        """
+        Connects to the trainer port of the server and asks it for the full
+        state of the field every cycle, and for the referee's calls.
+        """
+
+        if self.__sock is not None:
+            msg = "Cannot connect while already connected, disconnect first."
+            raise sp_exceptions.AgentConnectionStateError(msg)
+
+        self.__sock = sock.Socket(host, port)
+        self.__sock.sock.settimeout(timeout)
+
+        self.command("(init (version %d))" % version)
+        while self.__receive() != "init":
+            pass
+
+        self.command("(eye on)")
+        self.command("(ear on)")
+
+    def disconnect(self):
+        """
+        Closes our connection to the server.  The trainer can connect again
+        afterwards.
+        """
+
+        if self.__sock is None:
+            return
+
+        self.__sock.sock.close()
+        self.__sock = None
+
+    def command(self, text):
+        """
+        Sends a raw trainer command to the server.
+        """
+
+        if self.__sock is None:
+            msg = "Must be connected to a server to send commands."
+            raise sp_exceptions.AgentConnectionStateError(msg)
+
+        self.__sock.send(text)
+
+    def move_ball(self, x, y, vx=0.0, vy=0.0):
+        """
+        Puts the ball at (x, y), rolling with the given velocity.
+        """
+
+        # the server's y axis points the other way
+        self.command("(move (ball) %.4f %.4f %.4f %.4f)" % (x, -y, vx, -vy))
+
+    def move_player(self, team, uniform_number, x, y, direction=0.0):
+        """
+        Puts a player at (x, y), standing still with its body facing the given
+        absolute direction.
+        """
+
+        self.command("(move (player %s %d) %.4f %.4f %.4f 0 0)" % (team,
+            uniform_number, x, -y, -direction))
+
+    def change_mode(self, play_mode):
+        """
+        Switches the game to the given play mode, see WorldModel.PlayModes.
+        """
+
+        self.play_mode = play_mode
+        self.command("(change_mode %s)" % play_mode)
+
+    def start(self):
+        """
+        Kicks off the match, as the referee would.
+        """
+
+        self.command("(start)")
+
+    def recover(self):
+        """
+        Restores every player's stamina, recovery and effort.
+        """
+
+        self.command("(recover)")
+
+    def run(self, cycles, stop=None):
+        """
+        Lets the game run for the given number of cycles, or until the stop
+        function returns True for a state.  Returns the list of field states
+        seen along the way, one per cycle.
+        """
+
+        states = []
+        last_time = None
+        while len(states) < cycles:
+            if self.__receive() != "see_global":
+                continue
+
+            # the clock doesn't move in some play modes, only count new cycles
+            if self.state.time == last_time:
+                continue
+
+            last_time = self.state.time
+            states.append(self.state)
+
+            if stop is not None and stop(self.state):
+                break
+
+        return states
+
+    def play_match(self, timeout=None):
+        """
+        Kicks off a match and lets it run to the end, kicking off again after
+        half time, as the server would itself in its auto_mode.  Returns the
+        final score as (left goals, right goals).
+
+        The clock stops while the server waits for a kick off, but it keeps
+        sending us the field, so a match that never ends would never time out
+        on its own.  If the match isn't over 'timeout' seconds from now, a
+        TrainerTimeoutError is raised.
+        """
+
+        deadline = None
+        if timeout is not None:
+            deadline = time.time() + timeout
+
+        # whether we've kicked off since the server started waiting for it,
+        # so that we only do so once before it answers
+        kicked_off = False
+        while self.play_mode != WorldModel.PlayModes.TIME_OVER:
+            if deadline is not None and time.time() > deadline:
+                raise sp_exceptions.TrainerTimeoutError("Match not over after "
+                        "%g seconds, in play mode '%s'." % (timeout,
+                            self.play_mode))
+
+            if self.play_mode != WorldModel.PlayModes.BEFORE_KICK_OFF:
+                kicked_off = False
+            elif not kicked_off:
+                kicked_off = True
+                self.start()
+
+            self.__receive()
+
+        return self.score_l, self.score_r
+
+    def run_episode(self, scenario):
+        """
+        Sets up and runs one episode of the given Scenario, returning its
+        scored Episode.
+        """
+
+        scenario.setup(self)
+        states = self.run(scenario.cycles, scenario.done)
+
+        end = states[-1] if states else self.state
+        episode = Episode(scenario.score(states), len(states), end)
+        self.log.info("episode", scenario=scenario.name, score=episode.score,
+                cycles=episode.cycles)
+
+        return episode
+
+    def run_episodes(self, scenario, episodes):
+        """
+        Runs the given number of episodes of the given Scenario back to back,
+        returning the list of their Episodes.
+        """
+
+        return [self.run_episode(scenario) for i in xrange(episodes)]
+
+    def __receive(self):
+        """
+        Waits for the next message from the server and deals with it.  Returns
+        the type of message received.
+        """
+
+        try:
+            raw_msg = self.__sock.recv()
+        except socket.timeout:
+            raise sp_exceptions.TrainerTimeoutError("No message from the "
+                    "server in play mode '%s'." % self.play_mode)
+
+        msg = message_parser.parse(raw_msg)
+        msg_type = msg[0]
+
+        if msg_type == "see_global":
+            self.state = self.__parse_field(msg[1], msg[2:])
+
+        elif msg_type == "hear":
+            # only the referee's play mode calls matter to us.  goals come
+            # with the scoring side's new score.
+            if msg[2] == "referee":
+                call = str(msg[3])
+                if call.startswith(GOAL_L + "_"):
+                    self.score_l = int(call[len(GOAL_L) + 1:])
+                    call = GOAL_L
+                elif call.startswith(GOAL_R + "_"):
+                    self.score_r = int(call[len(GOAL_R) + 1:])
+                    call = GOAL_R
+
+                # after half time the server waits for a kick off again
+                elif call == WorldModel.RefereeMessages.HALF_TIME:
+                    call = WorldModel.PlayModes.BEFORE_KICK_OFF
+
+                if call in PLAY_MODES:
+                    self.play_mode = call
+
+        elif msg_type == "think":
+            # in synchronous mode, we're done as soon as we've been asked
+            self.command("(done)")
+
+        elif msg_type == "error":
+            m = "Server returned an error: '%s'" % msg[1]
+            raise sp_exceptions.SoccerServerError(m)
+
+        elif msg_type == "warning":
+            m = "Server issued a warning: '%s'" % msg[1]
+            self.log.warning("server_warning",
+                    warning=sp_exceptions.SoccerServerWarning(m))
+
+        return msg_type
+
+    def __parse_field(self, time, objects):
+        """
+        Turns the objects of a 'see_global' message into a FieldState, flipping
+        them into the agents' frame.
+        """
+
+        ball = None
+        players = {}
+        for obj in objects:
+            name = obj[0]
+            values = obj[1:]
+
+            if name[0] == "b":
+                ball = (values[0], -values[1], values[2], -values[3])
+            elif name[0] == "p":
+                players[(name[1], name[2])] = (values[0], -values[1],
+                        values[2], -values[3], -values[4], -values[5])
+
+        return FieldState(time, self.play_mode, ball, players)
+
+class Scenario:
+    """
+    One kind of episode for a Trainer to run: where the ball and players start,
+    how long it runs for, and how its outcome is scored.
+
+    By default an episode places everything, restores everyone's stamina and
+    switches to 'play_on', and ends early as soon as the referee stops play,
+    eg. for a goal or the ball going out.  Subclasses have to provide score,
+    and can override the rest.
+    """
+
+    def __init__(self, name, cycles, ball, players=None,
+            play_mode=WorldModel.PlayModes.PLAY_ON):
+        """
+        name: what the episodes are logged as.
+        cycles: the most cycles an episode runs for.
+        ball: the (x, y) or (x, y, vx, vy) the ball starts at.
+        players: maps (team, uniform number) to the (x, y) or (x, y, direction)
+            each player starts at.  players left out stay where they are.
+        play_mode: the play mode episodes are run in.
+        """
+
+        self.name = name
+        self.cycles = cycles
+        self.ball = ball
+        self.players = players or {}
+        self.play_mode = play_mode
+
+    def setup(self, trainer):
+        """
+        Puts everything in its starting place for an episode.
+        """
+
+        trainer.move_ball(*self.ball)
+        for (team, uniform_number), place in self.players.items():
+            trainer.move_player(team, uniform_number, *place)
+
+        trainer.recover()
+        trainer.change_mode(self.play_mode)
+
+    def done(self, state):
+        """
+        Returns whether the episode is over early at the given state.
+        """
+
+        return state.play_mode != self.play_mode
+
+    def score(self, states):
+        """
+        Returns the score of an episode that went through the given states.
+        """
+
+        raise NotImplementedError
@@ -100,6 +100,12 @@ class WorldModel:
         # stores the most recent message heard
         self.last_message = None
 
+        # the simulation cycle of the most recent sensor message
+        self.sim_time = None
+
+        # whether the server agreed to send our sees in step with its cycles
+        self.synch_see = False
+
         # the mode the game is currently in (default to not playing yet)
         self.play_mode = WorldModel.PlayModes.BEFORE_KICK_OFF
 
@@ -323,9 +329,10 @@ class WorldModel:
         # set the neck and body absolute directions based on flag directions
         self.abs_neck_dir = self.triangulate_direction(self.flags, flag_dict)
 
-        # set body dir only if we got a neck dir, else reset it
+        # set body dir only if we got a neck dir, else reset it.  the neck
+        # angle turns clockwise like object directions do, so it's added back.
         if self.abs_neck_dir is not None and self.neck_direction is not None:
-            self.abs_body_dir = self.abs_neck_dir - self.neck_direction
+            self.abs_body_dir = self.abs_neck_dir + self.neck_direction
         else:
             self.abs_body_dir = None
 
@@ -510,17 +517,52 @@ class WorldModel:
         calculated.
         """
 
-        # we can't calculate this without a distance to the object
-        if obj.distance is None:
+        # we can't calculate this without a distance to the object, or without
+        # knowing which way our head is pointing.
+        if obj.distance is None or self.abs_neck_dir is None:
             return None
 
+        # object directions are relative to the neck, in degrees
+        abs_dir = math.radians(self.abs_neck_dir - obj.direction)
+
         # get the components of the vector to the object
-        dx = obj.distance * math.cos(obj.direction)
-        dy = obj.distance * math.sin(obj.direction)
+        dx = obj.distance * math.cos(abs_dir)
+        dy = obj.distance * math.sin(abs_dir)
 
         # return the point the object is at relative to our current position
         return (self.abs_coords[0] + dx, self.abs_coords[1] + dy)
 
+    def get_object_absolute_velocity(self, obj):
+        """
+        Estimates the absolute (vx, vy) velocity of a mobile object from the
+        distance and direction changes reported in the last see message, plus
+        our own velocity.  Returns None if the estimate can't be made.
+        """
+
+        # we need the deltas and our own heading to say anything at all
+        if (obj.distance is None or obj.dist_change is None or
+                obj.dir_change is None or self.abs_neck_dir is None):
+            return None
+
+        # unit vectors along and across the line of sight to the object
+        abs_dir = math.radians(self.abs_neck_dir - obj.direction)
+        ex = math.cos(abs_dir)
+        ey = math.sin(abs_dir)
+
+        # radial speed moves along the line of sight, angular speed across it.
+        # direction changes are clockwise-positive like directions themselves.
+        tangential = -math.radians(obj.dir_change) * obj.distance
+        vx = obj.dist_change * ex - tangential * ey
+        vy = obj.dist_change * ey + tangential * ex
+
+        # the deltas are relative to us, so add our own velocity back in
+        if self.speed_amount is not None and self.speed_direction is not None:
+            own_dir = math.radians(self.abs_neck_dir - self.speed_direction)
+            vx += self.speed_amount * math.cos(own_dir)
+            vy += self.speed_amount * math.sin(own_dir)
+
+        return (vx, vy)
+
     def teleport_to_point(self, point):
         """
         Teleports the player to a given (x, y) point using the 'move' command.
@@ -0,0 +1,403 @@
+#!/usr/bin/env python
+
+# Tunes the agents' parameters by playing headless matches with them
+
+import hashlib
+import json
+import math
+import os
+import random
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import Queue as queue
+from multiprocessing.pool import ThreadPool
+
+from aima_python.search import (Problem, hill_climbing, simulated_annealing,
+        parallel_genetic_algorithm, exp_schedule)
+import parameters
+from soccerpy import sp_exceptions
+from soccerpy.trainer import Trainer
+
+# the script that starts a team, and what it's run with
+MAIN = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))), "main.py")
+PYTHON = sys.executable
+
+# the server binary, and how long a half lasts, in seconds of 10 cycles each
+SERVER = os.environ.get("SWEEP_SERVER", "rcssserver")
+HALF_TIME = int(os.environ.get("SWEEP_HALF_TIME", 300))
+
+# the names the tuned team and its opponent play as
+TEAM = "Sweep"
+OPPONENT = "Base"
+
+# the score a match is given if it never finishes
+LOST = (0, 1)
+
+def match_fitness(ours, theirs):
+    """
+    Turns a match's score into a fitness in (0, 1): 0.5 for a draw, and
+    closer to 1 the more goals we won by.  It's never 0, so genetic selection
+    can weigh every candidate by it.
+    """
+
+    return 0.5 + 0.5 * math.tanh((ours - theirs) / 2.0)
+
+class MatchRunner:
+    """
+    Plays headless matches between a team with given parameters and a fixed
+    opponent, by default the same team with default parameters.
+
+    Every match gets a server of its own, in synchronous mode so it runs as
+    fast as the agents can think, on its own block of ports, so as many
+    matches can run at once as there are blocks.  Matches are kicked off, at
+    the start and after half time, and ended by a Trainer on the server's
+    coach port.
+    """
+
+    def __init__(self, slots, opponent=None, half_time=HALF_TIME,
+            base_port=6000, connect_wait=3.0, timeout=None):
+        """
+        slots: how many matches can run at once.
+        opponent: the {name: value} parameters the opponent plays with.
+        half_time: the length of a half, in seconds.
+        base_port: the first server port.  slot i uses base_port + 10 * i and
+            the two ports after it.
+        connect_wait: seconds to give each team to connect.
+        timeout: seconds a match may take once kicked off, by default twice
+            as long as it would take in real time.
+        """
+
+        self.opponent = opponent
+        self.half_time = half_time
+        self.connect_wait = connect_wait
+        self.timeout = timeout if timeout is not None else 4 * half_time
+
+        # the blocks of ports not in use by a match
+        self.ports = queue.Queue()
+        for i in xrange(slots):
+            self.ports.put(base_port + 10 * i)
+
+    def play(self, params):
+        """
+        Plays one match with our team on the left, returning (our goals, their
+        goals).  Blocks until a block of ports is free.  Raises a
+        TrainerTimeoutError if the match takes longer than our timeout.
+        """
+
+        port = self.ports.get()
+        workdir = tempfile.mkdtemp(prefix="sweep_")
+        processes = []
+        try:
+            processes.append(self.__start([SERVER,
+                "server::port=%d" % port,
+                "server::coach_port=%d" % (port + 1),
+                "server::olcoach_port=%d" % (port + 2),
+                "server::synch_mode=true",
+                "server::half_time=%d" % self.half_time,
+                "server::nr_extra_halfs=0",
+                "server::penalty_shoot_outs=false",
+                "server::game_logging=false",
+                "server::text_logging=false",
+                "server::auto_mode=false"], workdir))
+            time.sleep(1.0)
+
+            # whoever connects first plays on the left, so wait for us
+            processes.append(self.__start_team(TEAM, params, port, workdir))
+            time.sleep(self.connect_wait)
+            processes.append(self.__start_team(OPPONENT, self.opponent, port,
+                workdir))
+            time.sleep(self.connect_wait)
+
+            trainer = Trainer()
+            trainer.connect(port=port + 1)
+            try:
+                return trainer.play_match(self.timeout)
+            finally:
+                trainer.disconnect()
+
+        finally:
+            for p in reversed(processes):
+                self.__stop(p)
+            shutil.rmtree(workdir, ignore_errors=True)
+            self.ports.put(port)
+
+    def __start_team(self, team, params, port, workdir):
+        """
+        Starts a whole team playing with the given parameters on our server.
+        Its logs and recordings are kept out of the way in workdir.
+        """
+
+        env = dict(os.environ)
+        env.update({
+            "TEAM": team,
+            "SERVER_PORT": str(port),
+            "SYNCH_SEE": "1",
+            "AGENT_LOG_LEVEL": "100",
+        })
+        env.pop("AGENT_PARAMS", None)
+        if params is not None:
+            env["AGENT_PARAMS"] = json.dumps(params)
+
+        return self.__start([PYTHON, MAIN], workdir, env)
+
+    def __start(self, args, workdir, env=None):
+        """
+        Starts a process in a process group of its own, so that it can be
+        stopped along with any children it spawns.
+        """
+
+        with open(os.devnull, "w") as devnull:
+            return subprocess.Popen(args, cwd=workdir, env=env,
+                    stdout=devnull, stderr=devnull, preexec_fn=os.setsid)
+
+    def __stop(self, process):
+        """
+        Stops a process started by __start, and its children.
+        """
+
+        try:
+            os.killpg(process.pid, signal.SIGTERM)
+        except OSError:
+            pass
+        process.wait()
+
+class FitnessCache:
+    """
+    Fitness results by parameter vector, kept in a file with one JSON object
+    per line.  Every result is written out as soon as it's in, so an
+    interrupted sweep loses at most the evaluation it was in the middle of.
+    Run again with the same cache and seed, it replays everything it already
+    evaluated straight from the file and carries on from there.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.results = {}
+        self.lock = threading.Lock()
+
+        if os.path.exists(path):
+            with open(path) as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self.results[entry["key"]] = entry
+
+    @staticmethod
+    def key(vector):
+        """
+        Returns the hash a parameter vector is cached by.
+        """
+
+        text = json.dumps([round(v, 6) for v in parameters.clip(vector)])
+        return hashlib.sha1(text).hexdigest()
+
+    def get(self, vector):
+        """
+        Returns the cached fitness of a vector, or None if it has none.
+        """
+
+        entry = self.results.get(self.key(vector))
+        return entry["fitness"] if entry is not None else None
+
+    def put(self, vector, fitness, scores):
+        """
+        Caches and saves the fitness of a vector, along with the match scores
+        it came from.
+        """
+
+        entry = {
+            "key": self.key(vector),
+            "params": parameters.to_dict(vector),
+            "fitness": fitness,
+            "scores": scores,
+        }
+
+        with self.lock:
+            self.results[entry["key"]] = entry
+            with open(self.path, "a") as f:
+                f.write(json.dumps(entry, sort_keys=True) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+
+    def best(self):
+        """
+        Returns the cached entry with the highest fitness, or None.
+        """
+
+        if not self.results:
+            return None
+        return max(self.results.values(), key=lambda e: e["fitness"])
+
+class Evaluator:
+    """
+    The fitness function of a sweep.  A parameter vector's fitness is the mean
+    match_fitness of 'matches' matches, all played at once, and is cached so
+    no vector is ever played twice.  It can be called from several threads at
+    once, whose matches then share the runner's ports.
+    """
+
+    def __init__(self, runner, cache, matches, workers):
+        self.runner = runner
+        self.cache = cache
+        self.matches = matches
+        self.pool = ThreadPool(workers)
+        self.evaluations = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, vector):
+        return self.evaluate([vector])[0]
+
+    def evaluate(self, vectors):
+        """
+        Returns the fitness of every given vector, playing the matches of all
+        the ones not cached yet side by side.  Each vector is cached as soon
+        as its own matches are over.
+        """
+
+        vectors = [parameters.clip(v) for v in vectors]
+        missing = []
+        for v in vectors:
+            if self.cache.get(v) is None and v not in missing:
+                missing.append(v)
+
+        if missing:
+            games = [j for j in xrange(len(missing))
+                    for i in xrange(self.matches)]
+            results = [[] for v in missing]
+            for j, score in self.pool.imap_unordered(
+                    lambda j: (j, self.play(missing[j])), games):
+                results[j].append(score)
+                if len(results[j]) == self.matches:
+                    self.record(missing[j], results[j])
+
+        return [self.cache.get(v) for v in vectors]
+
+    def play(self, vector):
+        """
+        Plays one match with the given vector and returns its score.  A match
+        that times out is played again, and if that one times out too it
+        counts as LOST, so that a stuck server costs one match rather than
+        the whole sweep.
+        """
+
+        params = parameters.to_dict(vector)
+        for attempt in xrange(2):
+            try:
+                return self.runner.play(params)
+            except sp_exceptions.TrainerTimeoutError as e:
+                print "Match timed out: %s" % e
+
+        return LOST
+
+    def record(self, vector, results):
+        """
+        Caches the fitness of a vector from the scores of its matches.
+        """
+
+        fitness = (sum(match_fitness(*s) for s in results) /
+                float(len(results)))
+        self.cache.put(vector, fitness, results)
+
+        with self.lock:
+            self.evaluations += 1
+            print "%4d: fitness %.3f from %s" % (self.evaluations, fitness,
+                    " ".join("%d-%d" % s for s in results))
+
+class ParameterProblem(Problem):
+    """
+    Parameter tuning as an optimization problem for the aima search functions.
+    States are clipped parameter vectors, each one's neighbors move a single
+    parameter one step up or down, and its value is its fitness.
+
+    With 'prefetch' on, all of a state's neighbors are evaluated at once as
+    soon as they're generated.  That's what hill climbing wants, since it
+    values them all anyway, but a waste for annealing, which only tries one.
+    """
+
+    def __init__(self, evaluator, initial=parameters.DEFAULTS, prefetch=False):
+        Problem.__init__(self, parameters.clip(initial))
+        self.evaluator = evaluator
+        self.prefetch = prefetch
+
+    def successor(self, state):
+        result = []
+        for i, name in enumerate(parameters.NAMES):
+            for sign in (-1, 1):
+                v = list(state)
+                v[i] += sign * parameters.STEPS[i]
+                v = parameters.clip(v)
+                if v != state:
+                    result.append(((name, sign), v))
+
+        if self.prefetch:
+            self.evaluator.evaluate([state] + [v for a, v in result])
+
+        return result
+
+    def value(self, state):
+        return self.evaluator(state)
+
+def mutate(vector):
+    """
+    Moves one random parameter of a vector a step up or down.
+    """
+
+    v = list(vector)
+    i = random.randrange(len(v))
+    v[i] += random.choice((-1, 1)) * parameters.STEPS[i]
+    return parameters.clip(v)
+
+def random_vector():
+    """
+    Returns a parameter vector drawn uniformly from the bounds.
+    """
+
+    return parameters.clip([random.uniform(lo, hi)
+        for lo, hi in zip(parameters.LOWS, parameters.HIGHS)])
+
+if __name__ == "__main__":
+    # enforce correct number of arguments, print help otherwise
+    if len(sys.argv) < 3:
+        print "args: ./sweep.py <hill|anneal|genetic> <matches> [workers] " \
+                "[cache] [seed]"
+        sys.exit()
+
+    method = sys.argv[1]
+    matches = int(sys.argv[2])
+    workers = int(sys.argv[3]) if len(sys.argv) > 3 else matches
+    cache = FitnessCache(sys.argv[4] if len(sys.argv) > 4 else "sweep.jsonl")
+    seed = int(sys.argv[5]) if len(sys.argv) > 5 else 0
+
+    # the same seed makes the same choices given the same fitnesses, so a
+    # resumed sweep retraces its steps through the cache
+    random.seed(seed)
+
+    evaluator = Evaluator(MatchRunner(workers), cache, matches, workers)
+
+    if method == "hill":
+        best = hill_climbing(ParameterProblem(evaluator, prefetch=True))
+    elif method == "anneal":
+        best = simulated_annealing(ParameterProblem(evaluator),
+                exp_schedule(k=0.1, lam=0.05, limit=100))
+    elif method == "genetic":
+        # a whole generation is played at once, as far as ports allow
+        population = [parameters.DEFAULTS] + [random_vector()
+                for i in xrange(11)]
+        best = parallel_genetic_algorithm(population, evaluator, ngen=10,
+                pmut=0.3, mutate=mutate, elitism=2, tournament=3,
+                pool=ThreadPool(len(population)))
+    else:
+        print "Unknown method '%s'." % method
+        sys.exit(1)
+
+    print
+    print "Best of this run: %.3f" % evaluator(best)
+    print json.dumps(parameters.to_dict(parameters.clip(best)), indent=4,
+            sort_keys=True)
+    print "Best ever: %.3f" % cache.best()["fitness"]
@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+
+# Replays a small recorded match through match_data
+
+import math
+import os
+import shutil
+import tempfile
+import unittest
+
+import match_data
+
+# our player 2 on the left, with its head turned 30 degrees from its body,
+# sees the ball, two teammates and an enemy, then dashes
+TRAFFIC = """\
+> (init agents (version 11))
+< (init l 2 before_kick_off)
+< (sense_body 1 (view_mode high normal) (stamina 8000 1) (speed 0 0) (head_angle 30))
+< (see 1 ((b) 10 5) ((p "agents" 3) 6 0) ((p "others" 7) 9 0) ((p "agents" 5) 4 0))
+> (dash 80)
+< (sense_body 2 (view_mode high normal) (stamina 8000 1) (speed 0 0) (head_angle 30))
+"""
+
+class ReplayTest(unittest.TestCase):
+    """
+    Checks the rows extracted from TRAFFIC.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "agents_l_2.traffic")
+        with open(self.path, "w") as f:
+            f.write(TRAFFIC)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def row(self):
+        rows = list(match_data.rows(match_data.read_traffic(self.path)))
+        self.assertEqual(len(rows), 1)
+        return dict(zip(match_data.COLUMNS, rows[0]))
+
+    def test_teammates_and_enemies(self):
+        # the team name only comes from our own init command
+        row = self.row()
+        self.assertEqual(row["mate_distance"], 4)
+        self.assertEqual(row["enemy_distance"], 9)
+
+    def test_ball_direction_relative_to_body(self):
+        row = self.row()
+        self.assertEqual(row["ball_distance"], 10)
+        self.assertEqual(row["ball_direction"], 35)
+        self.assertTrue(math.isnan(row["goal_direction"]))
+
+    def test_action_and_outcome(self):
+        row = self.row()
+        self.assertEqual(row["cycle"], 1)
+        self.assertEqual(row["action"], "dash")
+        self.assertEqual(row["outcome"], match_data.NO_OUTCOME)
+
+    def test_goal_after_horizon(self):
+        # after cycle 1 we act at cycles 2 and 40, then not again until after
+        # we score at cycle 70, more than HORIZON cycles after the first two
+        with open(self.path, "a") as f:
+            for cycle in (2, 40, 71):
+                if cycle == 71:
+                    f.write("< (hear 70 referee goal_l_1)\n")
+                f.write("< (sense_body %d (head_angle 0))\n" % cycle)
+                f.write("> (dash 80)\n")
+
+        rows = list(match_data.rows(match_data.read_traffic(self.path)))
+        outcomes = [(r[0], r[-1]) for r in rows]
+        self.assertEqual(outcomes, [(1, match_data.NO_OUTCOME),
+            (2, match_data.NO_OUTCOME), (40, match_data.SCORED),
+            (71, match_data.NO_OUTCOME)])
+
+    def test_build(self):
+        output = os.path.join(self.directory, "rows")
+        store = match_data.build([self.path] * 3, output, processes=1,
+                chunk_rows=2)
+        self.assertEqual(len(store), 3)
+        self.assertEqual(list(store.column(match_data.COLUMNS.index(
+            "mate_distance"))), [4, 4, 4])
+
+        # only the finished store is left behind
+        self.assertEqual(sorted(os.listdir(output)), sorted(
+            ["columns.json"] + ["%d.npy" % a for a in
+                range(len(match_data.COLUMNS))] + ["%d.values.npy" % a
+                for a, k in enumerate(match_data.KINDS) if k != "c"]))
+
+if __name__ == "__main__":
+    unittest.main()
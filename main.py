@@ -15,11 +15,21 @@ from aigent.agent_1 import Agent as A1
 from aigent.agent_2 import Agent as A2
 # goalie
 from aigent.agent_3 import Agent as A3
+# where to stand off the ball
+from aigent import positioning
 
 # set team
-TEAM_NAME = 'Keng'
+TEAM_NAME = os.environ.get("TEAM", 'Keng')
 NUM_PLAYERS = 11
 
+# the server to play on, so that several matches can run side by side
+SERVER_HOST = os.environ.get("SERVER_HOST", "localhost")
+SERVER_PORT = int(os.environ.get("SERVER_PORT", 6000))
+
+# ask for synchronous sees, to run faster than real time against a server
+# started with server::synch_mode=1
+SYNCH_SEE = os.environ.get("SYNCH_SEE", "0") == "1"
+
 
 if __name__ == "__main__":
 
@@ -41,7 +51,7 @@ if __name__ == "__main__":
         """
         # return type of agent by position, construct
         a = agent_type(position)()
-        a.connect("localhost", 6000, team_name)
+        a.connect(SERVER_HOST, SERVER_PORT, team_name, synch_see=SYNCH_SEE)
         a.play()
 
         # we wait until we're killed
@@ -49,6 +59,10 @@ if __name__ == "__main__":
             # we sleep for a good while since we can only exit if terminated.
             time.sleep(1)
 
+    # solve the positioning tables once, before every agent wants them
+    print "Loading positioning tables..."
+    positioning.load()
+
     # spawn all agents as seperate processes for maximum processing efficiency
     agentthreads = []
     for position in xrange(1, NUM_PLAYERS+1):
@@ -61,6 +75,9 @@ if __name__ == "__main__":
         agentthreads.append(at)
 
     print "Spawned %d agents." % len(agentthreads)
+    print "Profile an agent's next cycles with: kill -USR1 <pid>"
+    for position, at in enumerate(agentthreads, 1):
+        print "  Agent %d has pid %d." % (position, at.pid)
     print
     print "Playing soccer..."
 